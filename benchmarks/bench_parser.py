@@ -0,0 +1,80 @@
+"""
+Flex XML parser benchmark: rows/sec and peak RSS of each parser on a synthetic statement.
+
+Usage:
+    python -m benchmarks.bench_parser --trades 1000000
+"""
+import argparse
+import multiprocessing as mp
+import os
+import resource
+import tempfile
+import time
+
+from benchmarks.synthetic import generate_flex_xml
+
+PARSERS = ['dom', 'stream', 'stream-arrow']
+
+
+def _run_parser(name, path, queue):
+    # Imported in the child so every parser starts from the same baseline RSS
+    from core.parser import parse_ibkr_xml, parse_ibkr_xml_stream
+
+    start = time.perf_counter()
+    if name == 'dom':
+        with open(path, encoding='utf-8') as f:
+            result = parse_ibkr_xml(f.read())
+    else:
+        result = parse_ibkr_xml_stream(path, as_arrow=(name == 'stream-arrow'))
+    elapsed = time.perf_counter() - start
+
+    rows = sum(len(t) for t in result.values() if t is not None)
+    # ru_maxrss is reported in KB on Linux
+    queue.put({'parser': name, 'rows': rows, 'seconds': elapsed,
+               'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024})
+
+
+def run_benchmark(n_trades, parsers=PARSERS, path=None):
+    """Runs each parser in a fresh process and returns one result dict per parser."""
+    cleanup = path is None
+    if path is None:
+        fd, path = tempfile.mkstemp(suffix='.xml')
+        os.close(fd)
+
+    try:
+        print(f"Generating synthetic statement with {n_trades:,} trades...")
+        generate_flex_xml(path, n_trades=n_trades)
+        print(f"File size: {os.path.getsize(path) / 1024 ** 2:,.1f} MB")
+
+        ctx = mp.get_context('spawn')
+        results = []
+        for name in parsers:
+            queue = ctx.Queue()
+            proc = ctx.Process(target=_run_parser, args=(name, path, queue))
+            proc.start()
+            result = queue.get()
+            proc.join()
+            result['rows_per_sec'] = result['rows'] / result['seconds'] if result['seconds'] else 0.0
+            results.append(result)
+        return results
+    finally:
+        if cleanup and os.path.exists(path):
+            os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Flex XML parsers.")
+    parser.add_argument('--trades', type=int, default=1_000_000)
+    parser.add_argument('--parsers', nargs='+', choices=PARSERS, default=PARSERS)
+    args = parser.parse_args()
+
+    results = run_benchmark(args.trades, parsers=args.parsers)
+
+    print(f"\n{'Parser':<14}{'Rows':>12}{'Seconds':>10}{'Rows/sec':>14}{'Peak RSS (MB)':>16}")
+    for r in results:
+        print(f"{r['parser']:<14}{r['rows']:>12,}{r['seconds']:>10.2f}{r['rows_per_sec']:>14,.0f}"
+              f"{r['peak_rss_mb']:>16,.1f}")
+
+
+if __name__ == "__main__":
+    main()
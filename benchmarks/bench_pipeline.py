@@ -0,0 +1,237 @@
+"""
+End-to-end pipeline benchmark on a synthetic wheel/spread history: wall time, rows/sec and
+peak RSS of every stage from Flex XML parsing to the dashboard queries.
+
+Each size runs in a fresh process against a throwaway DuckDB file. Results can be written as JSON
+and compared against an earlier run to spot regressions.
+
+Usage:
+    python -m benchmarks.bench_pipeline --fills 10000 100000 1000000 --json results.json
+    python -m benchmarks.bench_pipeline --fills 100000 --baseline results.json
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+STAGES = ['generate', 'parse_dom', 'parse_stream', 'save', 'load', 'fifo', 'strategies', 'campaigns',
+          'materialize', 'dashboard']
+
+# Slower than the baseline by more than this fraction is flagged as a regression
+REGRESSION_THRESHOLD = 0.25
+
+
+class RssSampler:
+    """Samples the resident set size in a background thread so every stage gets its own peak."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def current(self):
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * self.page_size
+        except OSError:
+            # No procfs (macOS): fall back to the process-wide high-water mark (KB on Linux, bytes on macOS)
+            maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.current())
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def reset(self):
+        self.peak = self.current()
+
+
+def _run_pipeline(n_fills, options, queue):
+    """Runs every stage once in this (fresh) process and puts the results on `queue`."""
+    workdir = tempfile.mkdtemp(prefix='bench_pipeline_')
+    # Settings are read at import time: point the app at a scratch database before importing core
+    os.environ['DATABASE_URL'] = os.path.join(workdir, 'bench.duckdb')
+    os.environ['MOTHERDUCK_TOKEN'] = ''
+    os.environ.setdefault('IBKR_TOKEN', 'benchmark')
+    os.environ.setdefault('IBKR_QUERY_ID', 'benchmark')
+    if options['backend']:
+        os.environ['EXECUTION_BACKEND'] = options['backend']
+
+    import pandas as pd
+
+    from benchmarks.synthetic import generate_history_xml
+    from core.data_service import DataService, EXECUTION_FILTER
+    from core.database import DatabaseManager
+    from core.parser import parse_ibkr_xml, parse_ibkr_xml_stream
+    from core.logic import PnLEngine
+
+    sampler = RssSampler().start()
+    stages = []
+
+    def timed(name, func, rows=None):
+        sampler.reset()
+        start_rss = sampler.peak
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        sampler.peak = max(sampler.peak, sampler.current())
+        n = rows(result) if callable(rows) else rows
+        stages.append({'stage': name, 'rows': n, 'seconds': elapsed,
+                       'rows_per_sec': n / elapsed if n and elapsed else 0.0,
+                       'peak_rss_mb': sampler.peak / 1024 ** 2,
+                       'delta_rss_mb': (sampler.peak - start_rss) / 1024 ** 2})
+        return result
+
+    xml_path = os.path.join(workdir, 'statement.xml')
+    try:
+        counts = timed('generate', lambda: generate_history_xml(xml_path, n_fills, n_underlyings=options['underlyings'],
+                                                                 seed=options['seed']),
+                       rows=lambda c: c['trades'] + c['transactions'])
+
+        def table_rows(tables):
+            return sum(len(t) for t in tables.values())
+
+        if n_fills <= options['dom_limit']:
+            def parse_dom():
+                with open(xml_path, encoding='utf-8') as f:
+                    return parse_ibkr_xml(f.read())
+            timed('parse_dom', parse_dom, rows=table_rows)
+        tables = timed('parse_stream', lambda: parse_ibkr_xml_stream(xml_path), rows=table_rows)
+
+        db = DatabaseManager()
+
+        def save():
+            db.save_dataframe('trades', tables['trades'])
+            db.save_dataframe('transactions', tables['transactions'])
+        timed('save', save, rows=table_rows(tables))
+        del tables
+
+        conn = db.get_connection()
+
+        def load():
+            trades = conn.execute(f"SELECT * FROM trades WHERE {EXECUTION_FILTER}").df()
+            return trades, conn.execute("SELECT * FROM transactions").df()
+        trades_df, cash_df = timed('load', load, rows=lambda r: len(r[0]) + len(r[1]))
+
+        closed_df, _ = timed('fifo', lambda: PnLEngine.calculate_fifo_pnl(trades_df, cash_df,
+                                                                         engine=options['engine']),
+                             rows=len(trades_df))
+        del trades_df, cash_df
+        closed_df = closed_df[closed_df['asset_id'] != 'DIVIDEND'].reset_index(drop=True)
+
+        service = DataService()
+        timed('strategies', lambda: service.get_strategy_data(closed_df), rows=len(closed_df))
+        timed('campaigns', lambda: service.get_campaign_data(closed_df), rows=len(closed_df))
+        timed('materialize', lambda: service.recompute_pnl(full_rebuild=True), rows=lambda n: n)
+
+        def dashboard():
+            # What one page load of the standard view asks the database for
+            first_close, end = service.get_close_date_range()
+            roots = service.get_root_symbols()
+            visible = service.query_closed_trades(first_close, end, roots)
+            service.query_open_positions(roots)
+            daily = service.query_daily_pnl(first_close, end, roots)
+            if not daily.empty:
+                daily['net_pnl'].resample('W').sum().fillna(0).cumsum()
+            return len(visible)
+        timed('dashboard', dashboard, rows=lambda n: n)
+    finally:
+        sampler.stop()
+        DatabaseManager.close_all()
+        for name in os.listdir(workdir):
+            os.remove(os.path.join(workdir, name))
+        os.rmdir(workdir)
+
+    queue.put({'fills': n_fills, 'trades': counts['trades'], 'transactions': counts['transactions'],
+               'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 'stages': stages,
+               'pandas': pd.__version__})
+
+
+def run_benchmark(sizes, engine=None, backend=None, underlyings=50, dom_limit=1_000_000, seed=42):
+    """Runs the pipeline once per size, each in a fresh process, and returns one result dict per size."""
+    options = {'engine': engine, 'backend': backend, 'underlyings': underlyings, 'dom_limit': dom_limit,
+               'seed': seed}
+    ctx = mp.get_context('spawn')
+    results = []
+    for n_fills in sizes:
+        print(f"Running pipeline on {n_fills:,} fills...")
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_run_pipeline, args=(n_fills, options, queue))
+        proc.start()
+        results.append(queue.get())
+        proc.join()
+    return results
+
+
+def compare(results, baseline):
+    """Adds 'baseline_seconds' / 'change' to every stage that also exists in `baseline`."""
+    previous = {(run['fills'], s['stage']): s['seconds'] for run in baseline['runs'] for s in run['stages']}
+    for run in results:
+        for stage in run['stages']:
+            before = previous.get((run['fills'], stage['stage']))
+            if before:
+                stage['baseline_seconds'] = before
+                stage['change'] = stage['seconds'] / before - 1
+
+
+def print_results(results):
+    for run in results:
+        print(f"\n{run['fills']:,} fills ({run['trades']:,} trades, {run['transactions']:,} cash rows), "
+              f"max RSS {run['max_rss_mb']:,.1f} MB")
+        print(f"{'Stage':<14}{'Rows':>12}{'Seconds':>10}{'Rows/sec':>14}{'Peak RSS (MB)':>16}{'vs baseline':>14}")
+        for s in run['stages']:
+            change = ''
+            if 'change' in s:
+                change = f"{s['change']:+.0%}" + (' !' if s['change'] > REGRESSION_THRESHOLD else '')
+            print(f"{s['stage']:<14}{s['rows'] or 0:>12,}{s['seconds']:>10.2f}{s['rows_per_sec']:>14,.0f}"
+                  f"{s['peak_rss_mb']:>16,.1f}{change:>14}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the full P&L pipeline on synthetic histories.")
+    parser.add_argument('--fills', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--engine', choices=['python', 'vectorized'], default=None)
+    parser.add_argument('--backend', choices=['serial', 'threads', 'processes'], default=None)
+    parser.add_argument('--underlyings', type=int, default=50)
+    parser.add_argument('--dom-limit', type=int, default=1_000_000,
+                        help="Largest size the in-memory DOM parser is timed on.")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help="Write the results to this file.")
+    parser.add_argument('--baseline', help="Earlier --json output to compare against.")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.fills, engine=args.engine, backend=args.backend, underlyings=args.underlyings,
+                            dom_limit=args.dom_limit, seed=args.seed)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            compare(results, json.load(f))
+    print_results(results)
+
+    if args.json:
+        record = {'created': datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(),
+                  'machine': platform.machine(), 'cpus': os.cpu_count(), 'engine': args.engine,
+                  'backend': args.backend, 'runs': results}
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(record, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+import random
+from datetime import datetime, timedelta
+from xml.sax.saxutils import escape
+
+UNDERLYINGS = ['AAPL', 'MSFT', 'CCJ', 'SPOT', 'TSLA', 'AMD', 'NVDA', 'META', 'AMZN', 'GOOG', 'KO', 'PEP', 'XOM',
+               'JPM', 'BAC', 'DIS', 'NFLX', 'INTC', 'PFE', 'T']
+
+
+def _underlyings(n):
+    """The well-known tickers first, then generated ones (U0001, U0002, ...)."""
+    names = UNDERLYINGS[:n]
+    names += [f"U{i:04d}" for i in range(1, n - len(names) + 1)]
+    return names
+
+
+def generate_flex_xml(path, n_trades=100_000, n_underlyings=20, option_ratio=0.6, n_dividends=None, seed=42):
+    """
+    Writes a synthetic IBKR Flex statement (Trades + CashTransactions) to `path`, streaming row by row
+    so multi-million trade files can be produced without holding them in memory.
+
+    Returns:
+        dict: Row counts written ({'trades': ..., 'transactions': ...}).
+    """
+    rng = random.Random(seed)
+    roots = _underlyings(n_underlyings)
+    n_dividends = n_trades // 100 if n_dividends is None else n_dividends
+    start = datetime(2020, 1, 2, 9, 30)
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<FlexQueryResponse queryName="synthetic" type="AF">\n<FlexStatements count="1">\n')
+        f.write('<FlexStatement accountId="U0000000" fromDate="20200101" toDate="20251231">\n<Trades>\n')
+
+        for i in range(n_trades):
+            root = rng.choice(roots)
+            when = start + timedelta(minutes=i * 3)
+            side = rng.choice(('BUY', 'SELL'))
+            sign = 1 if side == 'BUY' else -1
+            if rng.random() < option_ratio:
+                expiry = (when + timedelta(days=rng.randint(1, 60))).strftime('%Y%m%d')
+                strike = rng.randint(10, 300)
+                right = rng.choice(('P', 'C'))
+                qty = rng.randint(1, 10)
+                price = round(rng.uniform(0.05, 15.0), 2)
+                notes = rng.choice(('', '', '', 'O', 'C', 'A', 'Ep'))
+                if notes == 'Ep':
+                    price = 0.0
+                f.write(
+                    f'<Trade tradeID="{100000000 + i}" symbol="{root} {expiry[2:]}{right}{strike:05d}000" '
+                    f'description="{root} {expiry} {strike} {right}" assetCategory="OPT" '
+                    f'dateTime="{when:%Y%m%d;%H%M%S}" quantity="{sign * qty}" tradePrice="{price}" '
+                    f'ibCommission="{-round(qty * 0.65, 2)}" buySell="{side}" openCloseIndicator="O" '
+                    f'closePrice="{price}" underlyingSymbol="{root}" strike="{strike}" expiry="{expiry}" '
+                    f'putCall="{right}" multiplier="100" notes="{notes}" />\n')
+            else:
+                qty = rng.randint(1, 20) * 10
+                price = round(rng.uniform(10.0, 500.0), 2)
+                f.write(
+                    f'<Trade tradeID="{100000000 + i}" symbol="{root}" description="{root} COMMON" '
+                    f'assetCategory="STK" dateTime="{when:%Y%m%d;%H%M%S}" quantity="{sign * qty}" '
+                    f'tradePrice="{price}" ibCommission="-1.0" buySell="{side}" openCloseIndicator="O" '
+                    f'closePrice="{price}" underlyingSymbol="" strike="" expiry="" putCall="" multiplier="1" '
+                    f'notes="" />\n')
+
+        f.write('</Trades>\n<CashTransactions>\n')
+        for i in range(n_dividends):
+            root = rng.choice(roots)
+            when = start + timedelta(days=rng.randint(0, 2000))
+            amount = round(rng.uniform(5.0, 500.0), 2)
+            f.write(
+                f'<CashTransaction transactionID="{500000000 + i}" type="Dividends" assetCategory="STK" '
+                f'symbol="{root}" amount="{amount}" dateTime="{when:%Y%m%d}" '
+                f'description="{root} CASH DIVIDEND" />\n')
+        f.write('</CashTransactions>\n</FlexStatement>\n</FlexStatements>\n</FlexQueryResponse>\n')
+
+    return {'trades': n_trades, 'transactions': n_dividends}
+
+
+# --- WHEEL / SPREAD HISTORY ---
+
+PASSIVE_NOTES = {'expire': 'Ep', 'assign': 'A'}
+
+
+class _Book:
+    """Per-underlying state of the synthetic account: spot price, shares held and open option positions."""
+    __slots__ = ('root', 'spot', 'shares', 'options', 'next_dividend')
+
+    def __init__(self, root, spot, next_dividend):
+        self.root = root
+        self.spot = spot
+        self.shares = 0
+        self.options = []  # [(legs, kind)] where legs = [(expiry, strike, right, qty)]
+        self.next_dividend = next_dividend
+
+
+def iter_history(n_fills=100_000, n_underlyings=50, chain_width=10, wheel_share=0.5, spread_share=0.3,
+                 assignment_rate=0.3, dividend_every_days=91, seed=42):
+    """
+    Yields a chronological synthetic IBKR history as ('trade' | 'cash', attributes) pairs, with
+    attributes named like the Flex XML (tradeID, dateTime, ...).
+
+    Each step advances one underlying:
+    - wheel cycles: short puts that are bought back, expire or get assigned (stock delivered at the
+      strike), then covered calls on the shares until they are called away;
+    - vertical spreads and iron condors opened and closed as multi-leg executions on one timestamp,
+      with strikes drawn from a `chain_width`-strike chain around spot;
+    - plain stock trades; dividends (plus withholding) every `dividend_every_days` on held shares.
+
+    Stops once `n_fills` executions have been produced.
+    """
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 2, 9, 30)
+    books = [_Book(root, rng.uniform(20, 400), start + timedelta(days=rng.randint(1, dividend_every_days)))
+             for root in _underlyings(n_underlyings)]
+    state = {'fills': 0, 'cash': 0, 'now': start}
+
+    def trade(book, side, qty, price, notes='', contract=None):
+        state['fills'] += 1
+        sign = 1 if side == 'BUY' else -1
+        attrs = {'tradeID': str(100_000_000 + state['fills']), 'dateTime': f"{state['now']:%Y%m%d;%H%M%S}",
+                 'quantity': str(sign * qty), 'tradePrice': f"{price:.2f}", 'buySell': side, 'notes': notes,
+                 'closePrice': f"{price:.2f}", 'openCloseIndicator': 'O'}
+        if contract is None:
+            attrs.update(symbol=book.root, description=f"{book.root} COMMON", assetCategory='STK',
+                         ibCommission=f"{-max(1.0, qty * 0.005):.2f}", underlyingSymbol='', strike='', expiry='',
+                         putCall='', multiplier='1')
+        else:
+            expiry, strike, right = contract
+            attrs.update(symbol=f"{book.root} {expiry[2:]}{right}{int(strike * 1000):08d}",
+                         description=f"{book.root} {expiry} {strike:g} {right}", assetCategory='OPT',
+                         ibCommission=f"{-qty * 0.65:.2f}", underlyingSymbol=book.root, strike=f"{strike:g}",
+                         expiry=expiry, putCall=right, multiplier='100')
+        return 'trade', attrs
+
+    def strike_near(book, offset):
+        step = 1 if book.spot < 50 else 5 if book.spot < 200 else 10
+        atm = round(book.spot / step) * step
+        return float(max(step, atm + offset * step))
+
+    def premium(book, strike, right):
+        intrinsic = max(0.0, book.spot - strike) if right == 'C' else max(0.0, strike - book.spot)
+        return round(intrinsic + rng.uniform(0.05, 0.03 * book.spot), 2)
+
+    def close_position(book, legs, kind):
+        """Buys back / sells out every leg, lets it expire, or assigns a short put/call."""
+        expired = state['now'] >= datetime.strptime(legs[0][0], '%Y%m%d')
+        outcome = 'close'
+        if expired:
+            outcome = 'assign' if kind in ('put', 'call') and rng.random() < assignment_rate else 'expire'
+        for expiry, strike, right, qty in legs:
+            side = 'BUY' if qty < 0 else 'SELL'
+            if outcome == 'close':
+                yield trade(book, side, abs(qty), premium(book, strike, right), contract=(expiry, strike, right))
+            else:
+                yield trade(book, side, abs(qty), 0.0, PASSIVE_NOTES[outcome], contract=(expiry, strike, right))
+            if outcome == 'assign':
+                shares = abs(qty) * 100
+                if right == 'P':
+                    book.shares += shares
+                    yield trade(book, 'BUY', shares, strike, 'A')
+                else:
+                    book.shares -= shares
+                    yield trade(book, 'SELL', shares, strike, 'A')
+
+    def open_position(book):
+        expiry = (state['now'] + timedelta(days=rng.choice((7, 14, 21, 30, 45)))).strftime('%Y%m%d')
+        roll = rng.random()
+        if roll < wheel_share:
+            contracts = max(1, book.shares // 100)
+            if book.shares >= 100 and not any(kind == 'call' for _, kind in book.options):
+                legs, kind = [(expiry, strike_near(book, rng.randint(1, chain_width // 2)), 'C', -contracts)], 'call'
+            else:
+                legs, kind = [(expiry, strike_near(book, -rng.randint(1, chain_width // 2)), 'P',
+                               -rng.randint(1, 3))], 'put'
+        elif roll < wheel_share + spread_share:
+            width = rng.randint(1, 3)
+            qty = rng.randint(1, 5)
+            if rng.random() < 0.5:
+                right = rng.choice(('P', 'C'))
+                away = -1 if right == 'P' else 1
+                offset = rng.randint(1, chain_width // 2) * away
+                legs = [(expiry, strike_near(book, offset), right, -qty),
+                        (expiry, strike_near(book, offset + width * away), right, qty)]
+                kind = 'vertical'
+            else:
+                legs = [(expiry, strike_near(book, -2), 'P', -qty), (expiry, strike_near(book, -2 - width), 'P', qty),
+                        (expiry, strike_near(book, 2), 'C', -qty), (expiry, strike_near(book, 2 + width), 'C', qty)]
+                kind = 'condor'
+        else:
+            side = rng.choice(('BUY', 'SELL')) if book.shares >= 100 else 'BUY'
+            qty = 100 * rng.randint(1, 3)
+            if side == 'SELL':
+                qty = min(qty, book.shares)
+            book.shares += qty if side == 'BUY' else -qty
+            yield trade(book, side, qty, round(book.spot, 2))
+            return
+        book.options.append((legs, kind))
+        for leg_expiry, strike, right, qty in legs:
+            side = 'BUY' if qty > 0 else 'SELL'
+            yield trade(book, side, abs(qty), premium(book, strike, right), contract=(leg_expiry, strike, right))
+
+    while state['fills'] < n_fills:
+        state['now'] += timedelta(seconds=rng.randint(30, 1800))
+        if state['now'].hour >= 16:
+            state['now'] = (state['now'] + timedelta(days=1)).replace(hour=9, minute=30)
+        book = rng.choice(books)
+        book.spot = max(5.0, book.spot * (1 + rng.gauss(0, 0.01)))
+
+        if book.shares > 0 and state['now'] >= book.next_dividend:
+            state['cash'] += 1
+            amount = round(book.shares * book.spot * 0.004, 2)
+            when = f"{state['now']:%Y%m%d}"
+            yield 'cash', {'transactionID': str(500_000_000 + state['cash']), 'type': 'Dividends',
+                           'assetCategory': 'STK', 'symbol': book.root, 'amount': f"{amount}", 'dateTime': when,
+                           'description': f"{book.root} CASH DIVIDEND", 'currency': 'USD'}
+            state['cash'] += 1
+            yield 'cash', {'transactionID': str(500_000_000 + state['cash']), 'type': 'WithholdingTax',
+                           'assetCategory': 'STK', 'symbol': book.root, 'amount': f"{-round(amount * 0.15, 2)}",
+                           'dateTime': when, 'description': f"{book.root} US TAX", 'currency': 'USD'}
+            book.next_dividend = state['now'] + timedelta(days=dividend_every_days)
+
+        if book.options and rng.random() < 0.45:
+            legs, kind = book.options.pop(rng.randrange(len(book.options)))
+            yield from close_position(book, legs, kind)
+        else:
+            yield from open_position(book)
+
+
+def _xml_attrs(attrs):
+    return ' '.join(f'{k}="{escape(str(v), {chr(34): "&quot;"})}"' for k, v in attrs.items())
+
+
+def generate_history_xml(path, n_fills=100_000, **kwargs):
+    """
+    Writes iter_history() as a Flex statement. Trades are streamed; cash rows (a small fraction)
+    are buffered until the Trades section is closed.
+
+    Returns:
+        dict: Row counts written ({'trades': ..., 'transactions': ...}).
+    """
+    cash = []
+    n_trades = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<FlexQueryResponse queryName="synthetic" type="AF">\n<FlexStatements count="1">\n')
+        f.write('<FlexStatement accountId="U0000000" fromDate="20200101" toDate="20301231">\n<Trades>\n')
+        for kind, attrs in iter_history(n_fills, **kwargs):
+            if kind == 'trade':
+                f.write(f'<Trade {_xml_attrs(attrs)} />\n')
+                n_trades += 1
+            else:
+                cash.append(attrs)
+        f.write('</Trades>\n<CashTransactions>\n')
+        for attrs in cash:
+            f.write(f'<CashTransaction {_xml_attrs(attrs)} />\n')
+        f.write('</CashTransactions>\n</FlexStatement>\n</FlexStatements>\n</FlexQueryResponse>\n')
+    return {'trades': n_trades, 'transactions': len(cash)}
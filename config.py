@@ -11,6 +11,16 @@ class Settings(BaseSettings):
     IBKR_TOKEN: str = Field(..., alias="IBKR_TOKEN")
     IBKR_QUERY_ID: str = Field(..., alias="IBKR_QUERY_ID")
 
+    # Flex Web Service client: 'async' (httpx, exponential backoff) or 'sync' (requests, fixed 3s retries)
+    FLEX_CLIENT: str = Field("async", alias="FLEX_CLIENT")
+    FLEX_BACKOFF_INITIAL: float = Field(0.5, alias="FLEX_BACKOFF_INITIAL")
+    FLEX_BACKOFF_MAX: float = Field(20, alias="FLEX_BACKOFF_MAX")
+    FLEX_BACKOFF_MULTIPLIER: float = Field(2, alias="FLEX_BACKOFF_MULTIPLIER")
+    FLEX_BACKOFF_JITTER: float = Field(0.5, alias="FLEX_BACKOFF_JITTER")
+    FLEX_THROTTLE_DELAY: float = Field(10, alias="FLEX_THROTTLE_DELAY")
+    FLEX_DEADLINE_SECONDS: float = Field(180, alias="FLEX_DEADLINE_SECONDS")
+    FLEX_TIMEOUT_SECONDS: float = Field(30, alias="FLEX_TIMEOUT_SECONDS")
+
     # Database Configuration
     # Defaults to local DuckDB, but can be overridden for Online/Postgres
     DATABASE_URL: str = Field("data/trading_data.duckdb", alias="DATABASE_URL")
@@ -18,8 +28,36 @@ class Settings(BaseSettings):
     # MotherDuck Token (Optional - triggers Cloud Storage if present)
     MOTHERDUCK_TOKEN: Optional[str] = Field(None, alias="MOTHERDUCK_TOKEN")
 
+    # Seconds to wait for a local database file that another process (scheduler / dashboard) has open
+    DATABASE_LOCK_TIMEOUT: float = Field(60, alias="DATABASE_LOCK_TIMEOUT")
+    # Dashboard closes its local database connection after every page run so the scheduler can write
+    RELEASE_DB_LOCK: bool = Field(False, alias="RELEASE_DB_LOCK")
+
+    # Background sync scheduler (scheduler.py)
+    SYNC_INTERVAL_MINUTES: float = Field(60, alias="SYNC_INTERVAL_MINUTES")
+    SCHEDULER_LOCK_FILE: str = Field("data/scheduler.lock", alias="SCHEDULER_LOCK_FILE")
+
     IS_OFFLINE: bool = True
 
+    # P&L Engine: 'vectorized' (NumPy interval matching) or 'python' (original row-by-row FIFO loop)
+    PNL_ENGINE: str = Field("vectorized", alias="PNL_ENGINE")
+
+    # Execution backend for the per-symbol engines: 'serial', 'threads' or 'processes'
+    EXECUTION_BACKEND: str = Field("serial", alias="EXECUTION_BACKEND")
+    EXECUTION_WORKERS: Optional[int] = Field(None, alias="EXECUTION_WORKERS")
+
+    # Memory ceiling (MB) for the streaming Flex XML parser's column buffers
+    PARSER_MAX_BUFFER_MB: float = Field(64, alias="PARSER_MAX_BUFFER_MB")
+    # Fixed rows per parser chunk (overrides the buffer-size estimate when set)
+    PARSER_CHUNK_ROWS: Optional[int] = Field(None, alias="PARSER_CHUNK_ROWS")
+
+    # Instrumentation: per-run stage timings are appended to TIMINGS_LOG (JSON lines, empty to disable).
+    # PROFILER ('cprofile' or 'pyinstrument') profiles every pipeline run into PROFILE_DIR.
+    TIMINGS_LOG: Optional[str] = Field("data/pipeline_timings.jsonl", alias="TIMINGS_LOG")
+    PROFILER: Optional[str] = Field(None, alias="PROFILER")
+    PROFILE_DIR: str = Field("data/profiles", alias="PROFILE_DIR")
+    SHOW_TIMINGS: bool = Field(False, alias="SHOW_TIMINGS")
+
     # Allow extra fields in .env without error
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", extra='ignore')
 
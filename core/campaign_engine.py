@@ -1,6 +1,7 @@
+import numpy as np
 import pandas as pd
 import logging
-import uuid
+from core.strategy_engine import stable_group_ids
 
 logger = logging.getLogger(__name__)
 
@@ -11,6 +12,11 @@ class CampaignEngine:
     Uses Dynamic Tolerance based on close reasons (Trade vs Assignment).
     """
 
+    # Tolerances
+    TOLERANCE_STRICT = pd.Timedelta(hours=2)  # For manual closes (Trade)
+    TOLERANCE_LOOSE = pd.Timedelta(days=4)  # For passive closes (Assign/Expire)
+    PASSIVE_CLOSES = ['Assigned', 'Exercised', 'Expired']
+
     @staticmethod
     def identify_campaigns(closed_trades_df: pd.DataFrame) -> pd.DataFrame:
         """
@@ -37,48 +43,80 @@ class CampaignEngine:
         # Sort
         df = df.sort_values(by=['root_symbol', 'entry_date'])
 
-        df['campaign_id'] = None
-
-        # Tolerances
-        TOLERANCE_STRICT = pd.Timedelta(hours=2)  # For manual closes (Trade)
-        TOLERANCE_LOOSE = pd.Timedelta(days=4)  # For passive closes (Assign/Expire)
-
-        for symbol, group in df.groupby('root_symbol'):
-            group = group.sort_values('entry_date')
-
-            current_camp_id = str(uuid.uuid4())
-
-            # State Variables for the current campaign window
-            camp_end = group.iloc[0]['close_date']
-            camp_end_reason = group.iloc[0]['close_reason']
-
-            for idx, row in group.iterrows():
-                # Determine allowed gap based on how the LAST trade ended
-                if camp_end_reason in ['Assigned', 'Exercised', 'Expired']:
-                    tolerance = TOLERANCE_LOOSE
-                else:
-                    tolerance = TOLERANCE_STRICT
-
-                # Check Overlap
-                if row['entry_date'] <= (camp_end + tolerance):
-                    # --- LINKED ---
-                    df.at[idx, 'campaign_id'] = current_camp_id
-
-                    # Extend window?
-                    if row['close_date'] > camp_end:
-                        camp_end = row['close_date']
-                        camp_end_reason = row['close_reason']
-                else:
-                    # --- NEW CAMPAIGN ---
-                    current_camp_id = str(uuid.uuid4())
-                    df.at[idx, 'campaign_id'] = current_camp_id
-
-                    # Reset Window
-                    camp_end = row['close_date']
-                    camp_end_reason = row['close_reason']
+        # Each symbol is scanned in its own entry order (as sorted per symbol); rows without a
+        # root symbol sort last and never join a campaign
+        symbols = df['root_symbol']
+        assigned = symbols.notna().to_numpy()
+        n_assigned = int(assigned.sum())
+        block_start = np.flatnonzero((symbols != symbols.shift()).to_numpy() & assigned)
+        block_end = np.append(block_start[1:], n_assigned)
+        entry_all = df['entry_date'].to_numpy(dtype='datetime64[ns]')
+        order = np.arange(n_assigned)
+        tied = np.flatnonzero(entry_all[1:n_assigned] == entry_all[:n_assigned - 1])
+        for b in np.unique(np.searchsorted(block_start, tied, side='right') - 1):
+            # Equal entry times keep the order of the per-symbol sort (it decides which close reason sets the window)
+            b0, b1 = block_start[b], block_end[b]
+            dated = np.flatnonzero(~np.isnat(entry_all[b0:b1]))
+            undated = np.flatnonzero(np.isnat(entry_all[b0:b1]))
+            order[b0:b1] = b0 + np.concatenate((dated[entry_all[b0:b1][dated].argsort(kind='quicksort')], undated))
+
+        entry = entry_all[order]
+        close = df['close_date'].to_numpy(dtype='datetime64[ns]')[order]
+        passive = df['close_reason'].isin(CampaignEngine.PASSIVE_CLOSES).to_numpy()[order]
+        block = np.repeat(np.arange(len(block_start)), block_end - block_start)
+        symbol_start = np.zeros(n_assigned, dtype=bool)
+        symbol_start[block_start] = True
+
+        # Campaign window before each row: the running max close of its symbol, and the reason of the
+        # trade that first reached it (an exact tie does not take over the window)
+        window_end = pd.Series(close).groupby(block).cummax().to_numpy(dtype='datetime64[ns]')
+        prev_end = np.concatenate(([np.datetime64('NaT', 'ns')], window_end[:-1]))[:n_assigned]
+        prev_end[symbol_start] = np.datetime64('NaT')
+        sets_window = symbol_start | (close > prev_end)
+        setter = np.maximum.accumulate(np.where(sets_window, np.arange(n_assigned), 0))
+        prev_setter = np.concatenate(([0], setter[:-1]))[:n_assigned]
+
+        # Determine allowed gap based on how the trade that set the window ended
+        tolerance = np.where(passive[prev_setter], CampaignEngine.TOLERANCE_LOOSE.to_timedelta64(),
+                             CampaignEngine.TOLERANCE_STRICT.to_timedelta64()).astype('timedelta64[ns]')
+        starts = symbol_start | ~(entry <= prev_end + tolerance)
+
+        # A new campaign resets the window to its own close. That equals the running max unless the
+        # trade closed before the previous window ended (or dates are missing); those symbols are rescanned.
+        irregular = (starts & ~symbol_start & ~(close > prev_end)) | np.isnat(entry) | np.isnat(close)
+        for b in np.unique(block[irregular]):
+            rows = slice(block_start[b], block_end[b])
+            starts[rows] = CampaignEngine._scan_campaign_starts(entry[rows], close[rows], passive[rows])
+
+        # Stable ids from each campaign's symbol and first entry
+        ids = stable_group_ids(symbols.to_numpy()[order][starts], entry[starts])
+        if n_assigned == len(df):
+            campaign_ids = np.empty(n_assigned, dtype=np.int64)
+        else:
+            campaign_ids = pd.array([pd.NA] * len(df), dtype='Int64')
+        campaign_ids[order] = ids[np.cumsum(starts) - 1]
+        df['campaign_id'] = campaign_ids
 
         return df
 
+    @staticmethod
+    def _scan_campaign_starts(entry: np.ndarray, close: np.ndarray, passive: np.ndarray) -> np.ndarray:
+        """Sequential campaign scan for one symbol (entry-sorted); flags the rows that open a campaign."""
+        starts = np.zeros(len(entry), dtype=bool)
+        starts[0] = True
+        camp_end, camp_end_passive = close[0], passive[0]
+        for i in range(len(entry)):
+            tolerance = CampaignEngine.TOLERANCE_LOOSE if camp_end_passive else CampaignEngine.TOLERANCE_STRICT
+            if entry[i] <= camp_end + tolerance.to_timedelta64():
+                # --- LINKED --- Extend window?
+                if close[i] > camp_end:
+                    camp_end, camp_end_passive = close[i], passive[i]
+            else:
+                # --- NEW CAMPAIGN --- Reset Window
+                starts[i] = True
+                camp_end, camp_end_passive = close[i], passive[i]
+        return starts
+
     @staticmethod
     def aggregate_campaign_stats(df_with_campaigns: pd.DataFrame) -> pd.DataFrame:
         """
@@ -87,51 +125,50 @@ class CampaignEngine:
         if 'campaign_id' not in df_with_campaigns.columns or df_with_campaigns.empty:
             return pd.DataFrame()
 
-        def estimate_capital(rows):
-            """
-            Conservative Capital Estimate: Max Notional Exposure.
-            """
-            max_cap = 0.0
-            for _, r in rows.iterrows():
-                val = 0.0
-                qty = abs(r['quantity'])
-                if 'strike' in r and pd.notna(r['strike']) and r['strike'] > 0:
-                    val = r['strike'] * 100 * qty
-                elif 'STK' in str(r.get('asset_class', '')):
-                    price = r.get('close_price', 0)
-                    if price == 0 and r.get('net_pnl') != 0: price = 100
-                    val = price * qty
-                if val > max_cap: max_cap = val
-            return max_cap if max_cap > 0 else 1.0
-
-        stats = []
-        for camp_id, group in df_with_campaigns.groupby('campaign_id'):
-            start_date = group['entry_date'].min()
-            end_date = group['close_date'].max()
-            duration_days = (end_date - start_date).total_seconds() / (24 * 3600)
-            if duration_days < 1: duration_days = 1
-
-            total_pnl = group['net_pnl'].sum()
-            capital = estimate_capital(group)
-
-            roi_abs = total_pnl / capital
-            roi_annualized = roi_abs * (365 / duration_days)
-
-            stats.append({
-                'campaign_id': camp_id,
-                'root_symbol': group['root_symbol'].iloc[0],
-                'start_date': start_date,
-                'end_date': end_date,
-                'duration_days': round(duration_days, 1),
-                'trades_count': len(group),
-                'total_pnl': total_pnl,
-                'capital_est': capital,
-                'roi_abs': roi_abs * 100,
-                'roi_annualized': roi_annualized * 100
-            })
-
-        stats_df = pd.DataFrame(stats)
-        if not stats_df.empty:
-            stats_df = stats_df.sort_values(by='end_date', ascending=False)
-
-        return stats_df
\ No newline at end of file
+        df = df_with_campaigns[df_with_campaigns['campaign_id'].notna()]
+        if df.empty: return pd.DataFrame()
+
+        # Conservative Capital Estimate: Max Notional Exposure per campaign
+        qty = df['quantity'].abs()
+        strike = df['strike'] if 'strike' in df.columns else pd.Series(np.nan, index=df.index)
+        is_option = strike.notna() & (strike > 0)
+        is_stock = df['asset_class'].astype(str).str.contains('STK', regex=False) if 'asset_class' in df.columns \
+            else pd.Series(False, index=df.index)
+        price = df['close_price'] if 'close_price' in df.columns else pd.Series(0.0, index=df.index)
+        price = price.mask((price == 0) & (df['net_pnl'] != 0), 100)
+        notional = pd.Series(np.where(is_option, strike * 100 * qty, np.where(is_stock, price * qty, 0.0)),
+                             index=df.index)
+
+        camp = pd.DataFrame({
+            'campaign_id': df['campaign_id'],
+            'root_symbol': df['root_symbol'],
+            'entry_date': df['entry_date'],
+            'close_date': df['close_date'],
+            'net_pnl': df['net_pnl'],
+            'notional': notional,
+        })
+        stats_df = camp.groupby('campaign_id').agg(
+            root_symbol=('root_symbol', 'first'),
+            start_date=('entry_date', 'min'),
+            end_date=('close_date', 'max'),
+            trades_count=('net_pnl', 'size'),
+            total_pnl=('net_pnl', 'sum'),
+            capital_est=('notional', 'max'),
+        ).reset_index()
+
+        duration_days = (stats_df['end_date'] - stats_df['start_date']).dt.total_seconds() / (24 * 3600)
+        duration_days = duration_days.mask(duration_days < 1, 1)
+        capital = stats_df['capital_est'].where(stats_df['capital_est'] > 0, 1.0)
+
+        roi_abs = stats_df['total_pnl'] / capital
+        stats_df['capital_est'] = capital
+        stats_df['roi_abs'] = roi_abs * 100
+        stats_df['roi_annualized'] = roi_abs * (365 / duration_days) * 100
+        # Python's round() per value keeps the exact decimal rounding of the displayed durations
+        stats_df['duration_days'] = [round(d, 1) for d in duration_days]
+
+        stats_df = stats_df[['campaign_id', 'root_symbol', 'start_date', 'end_date', 'duration_days', 'trades_count',
+                             'total_pnl', 'capital_est', 'roi_abs', 'roi_annualized']]
+        stats_df = stats_df.sort_values(by='end_date', ascending=False)
+
+        return stats_df
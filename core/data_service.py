@@ -2,13 +2,17 @@ import pandas as pd
 import yfinance as yf
 from datetime import datetime, timedelta
 from core.database import DatabaseManager
-from core.logic import PnLEngine
+from core.logic import PnLEngine, CLOSED_COLUMNS
 from core.strategy_engine import StrategyEngine  # NEW
 from core.campaign_engine import CampaignEngine  # NEW
-from core.ibkr_client import IBKRFlexClient
-from core.parser import parse_ibkr_xml
+from core.executor import run_partitioned
+from core.instrumentation import RunTimer, stage, write_record
+from core.ibkr_client import IBKRFlexClient, AsyncIBKRFlexClient, HTTPX_AVAILABLE
+from core.parser import iter_ibkr_xml_chunks, ARROW_AVAILABLE
 from config import settings
 import logging
+import asyncio
+import json
 import sys
 
 # Configure logging to ensure output appears in Streamlit console
@@ -19,6 +23,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Executions fed to the P&L engine: excludes Cash/Forex pairs like USD.CAD
+EXECUTION_FILTER = "asset_class NOT IN ('CASH') AND symbol NOT LIKE '%.%'"
+
 
 class DataService:
     def __init__(self):
@@ -27,52 +34,268 @@ class DataService:
     def sync_ibkr_data(self):
         """
         Connects to IBKR, downloads the report, and saves to DB.
+        Timed as a 'sync' run (see record_run).
         """
+        run = self.start_run('sync')
+        success, msg = self._sync_ibkr_data()
+        self.record_run(run, None if success else msg)
+        return success, msg
+
+    def _sync_ibkr_data(self):
         logger.info("Starting manual IBKR Sync...")
         try:
-            client = IBKRFlexClient(token=settings.IBKR_TOKEN, query_id=settings.IBKR_QUERY_ID)
+            xml_content, error = self._download_flex_report()
+            if not xml_content:
+                return False, error
+
+            counts = self.ingest_flex_report(xml_content)
+            count_t, new_t = counts['trades']
+            count_c, new_c = counts['transactions']
+            logger.info(f"Ingested {count_t} trades ({new_t} new) and {count_c} transactions ({new_c} new).")
+
+            self._recompute_pnl(full_rebuild=False)
+            self.db.record_sync_time()
 
+            return True, f"Synced {count_t} trades ({new_t} new) & {count_c} transactions ({new_c} new)."
+
+        except Exception as e:
+            logger.error(f"Sync Error: {e}")
+            return False, str(e)
+
+    @staticmethod
+    def _download_flex_report():
+        """
+        Requests and downloads the Flex statement with the configured client (settings.FLEX_CLIENT).
+
+        Returns:
+            (xml_content, None) on success, (None, error message) otherwise.
+        """
+        if settings.FLEX_CLIENT == 'async' and HTTPX_AVAILABLE:
+            client = AsyncIBKRFlexClient(token=settings.IBKR_TOKEN, query_id=settings.IBKR_QUERY_ID)
+            return asyncio.run(client.fetch_report())
+
+        with IBKRFlexClient(token=settings.IBKR_TOKEN, query_id=settings.IBKR_QUERY_ID) as client:
             result = client.request_report()
             if not result:
-                return False, "Failed to initiate report request."
+                return None, "Failed to initiate report request."
 
             ref_code, url = result
-
             xml_content = client.download_report(ref_code, url)
             if not xml_content:
-                return False, "Download failed (empty content)."
-
-            data_map = parse_ibkr_xml(xml_content)
-            trades_df = data_map.get('trades')
-            cash_df = data_map.get('transactions')
+                return None, "Download failed (empty content)."
+            return xml_content, None
 
-            count_t = len(trades_df)
-            count_c = len(cash_df)
-
-            if not trades_df.empty:
-                self.db.save_dataframe('trades', trades_df)
-            if not cash_df.empty:
-                self.db.save_dataframe('transactions', cash_df)
+    def ingest_flex_report(self, source) -> dict:
+        """
+        Streams a Flex report (XML content, file path or binary file) into the trades / transactions tables.
+        Parser chunks go straight into DuckDB (Arrow when available), so memory stays bounded.
 
-            self.db.record_sync_time()
+        Returns:
+            dict: {'trades': [rows, new rows], 'transactions': [rows, new rows]}
+        """
+        counts = {'trades': [0, 0], 'transactions': [0, 0]}
+        chunks = iter_ibkr_xml_chunks(source, chunk_rows=settings.PARSER_CHUNK_ROWS,
+                                      max_buffer_mb=settings.PARSER_MAX_BUFFER_MB, as_arrow=ARROW_AVAILABLE)
+        while True:
+            with stage('parse') as parsed:
+                item = next(chunks, None)
+                if item is not None:
+                    parsed.rows += len(item[1])
+            if item is None:
+                break
+            table, chunk = item
+            with stage('save', rows=len(chunk)):
+                inserted, _ = self.db.ingest(table, chunk)
+            counts[table][0] += len(chunk)
+            counts[table][1] += inserted
+        return counts
 
-            return True, f"Synced {count_t} trades & {count_c} transactions."
+    def backfill_from_file(self, path, recompute=True):
+        """
+        Loads a saved Flex statement (e.g. a multi-year history exported from the IBKR portal) and
+        refreshes the P&L tables. Timed as a 'backfill' run.
 
+        Returns:
+            (success, message)
+        """
+        run = self.start_run('backfill')
+        try:
+            counts = self.ingest_flex_report(str(path))
+            if recompute:
+                self._recompute_pnl(full_rebuild=False)
+            else:
+                self.db.bump_data_version()
         except Exception as e:
-            logger.error(f"Sync Error: {e}")
+            logger.error(f"Backfill Error: {e}")
+            self.record_run(run, e)
             return False, str(e)
+        self.record_run(run)
+        count_t, new_t = counts['trades']
+        count_c, new_c = counts['transactions']
+        return True, f"Loaded {count_t} trades ({new_t} new) & {count_c} transactions ({new_c} new) from {path}."
 
     def get_last_sync(self):
         return self.db.get_last_sync_time()
 
-    def get_processed_data(self):
+    # --- RUN INSTRUMENTATION ---
+
+    @staticmethod
+    def start_run(kind: str) -> RunTimer:
+        """Starts timing a pipeline run, profiled if settings.PROFILER is set."""
+        return RunTimer(kind, profiler=settings.PROFILER, profile_dir=settings.PROFILE_DIR).start()
+
+    def record_run(self, run: RunTimer, error=None) -> dict:
+        """
+        Finishes `run`, appends its timing record to settings.TIMINGS_LOG and keeps it in the database
+        as the last run (what the dashboard shows, also for cloud deployments without a shared filesystem).
+        """
+        record = run.finish(error)
+        write_record(record, settings.TIMINGS_LOG)
+        try:
+            self.db.set_metadata('last_run_timings', json.dumps(record, default=str))
+        except Exception as e:
+            logger.error(f"Failed to store run timings: {e}")
+        return record
+
+    def get_scheduler_status(self):
+        """Last status stored by the background scheduler (scheduler.py), or None."""
+        try:
+            return self.db.get_scheduler_status()
+        except Exception as e:
+            logger.error(f"Could not read scheduler status: {e}")
+            return None
+
+    def get_last_run_timings(self):
+        """Timing record of the last recorded sync/recompute run, or None."""
+        value = self.db.get_metadata('last_run_timings')
+        return json.loads(value) if value else None
+
+    def get_data_version(self):
+        return self.db.get_data_version()
+
+    def update_pnl_state(self, full_rebuild=False):
+        """
+        Feeds only the executions the matcher has not seen yet through PnLEngine and stores the result.
+
+        New executions (past the stored high-water mark) are matched against the persisted open lots.
+        Backdated executions (at or before the mark, but never processed) force a replay of the
+        affected asset keys only; every other asset keeps its stored state.
+
+        Returns:
+            int: Number of executions fed to the matcher.
+        """
         conn = self.db.get_connection()
+        watermark = None if full_rebuild else self.db.get_fifo_watermark()
+
+        if watermark is None:
+            new_df = conn.execute(f"SELECT * FROM trades WHERE {EXECUTION_FILTER}").df()
+            backdated_df = pd.DataFrame()
+        else:
+            hwm_date, hwm_id = watermark
+            is_new = "(trade_date > ? OR (trade_date = ? AND trade_id > ?))"
+            params = [hwm_date, hwm_date, hwm_id]
+            new_df = conn.execute(f"SELECT * FROM trades WHERE {EXECUTION_FILTER} AND {is_new}", params).df()
+            backdated_df = conn.execute(f"""
+                SELECT * FROM trades
+                WHERE {EXECUTION_FILTER} AND NOT COALESCE({is_new}, FALSE)
+                AND trade_id NOT IN (SELECT trade_id FROM fifo_processed_trades)
+            """, params).df()
+
+        if new_df.empty and backdated_df.empty:
+            return 0
+
+        input_df = new_df
+        seed_lots = None
+        rebuild_assets = set()
+        if watermark is not None:
+            seed_lots = self.db.load_fifo_lots()
+            if not backdated_df.empty:
+                rebuild_assets = set(PnLEngine.build_asset_keys(backdated_df)['asset_id'])
+                logger.info(f"Found {len(backdated_df)} backdated executions. "
+                            f"Replaying {len(rebuild_assets)} affected asset(s).")
+                with self.db.registered(conn, 'rebuild_view', pd.DataFrame({'asset_id': list(rebuild_assets)})):
+                    history_df = conn.execute("""
+                        SELECT t.* FROM trades t
+                        JOIN fifo_processed_trades p ON t.trade_id = p.trade_id
+                        WHERE p.asset_id IN (SELECT asset_id FROM rebuild_view)
+                    """).df()
+                input_df = pd.concat([df for df in (history_df, backdated_df, new_df) if not df.empty],
+                                     ignore_index=True)
+                seed_lots = seed_lots[~seed_lots['asset_id'].isin(rebuild_assets)]
+
+        with stage('fifo', rows=len(input_df)):
+            asset_keys = PnLEngine.build_asset_keys(input_df)
+            closed_df, lots_df = run_partitioned(
+                PnLEngine.match_executions, input_df, asset_keys['root_symbol'],
+                backend=settings.EXECUTION_BACKEND, max_workers=settings.EXECUTION_WORKERS,
+                aligned={'open_lots': (seed_lots, 'root_symbol')}, engine=settings.PNL_ENGINE)
+
+        processed_df = pd.DataFrame({
+            'trade_id': input_df['trade_id'].to_numpy(),
+            'asset_id': asset_keys['asset_id'].to_numpy()
+        })
+
+        dated = input_df.dropna(subset=['trade_date']).sort_values(['trade_date', 'trade_id'])
+        new_watermark = watermark
+        if not dated.empty:
+            last = dated.iloc[-1]
+            candidate = (pd.Timestamp(last['trade_date']), str(last['trade_id']))
+            if watermark is None or candidate > (pd.Timestamp(watermark[0]), watermark[1]):
+                new_watermark = candidate
+
+        with stage('save_fifo_state', rows=len(closed_df)):
+            self.db.save_fifo_state(closed_df, lots_df, processed_df, new_watermark,
+                                    rebuild_assets=rebuild_assets, full_rebuild=watermark is None)
+        logger.info(f"P&L state updated: {len(input_df)} executions processed, {len(closed_df)} new closed trades.")
+        return len(input_df)
+
+    def recompute_pnl(self, full_rebuild=False):
+        """
+        Brings the materialized P&L tables (closed_trades, open_positions) up to date.
+        Called by the sync pipeline so page loads only read stored results.
+        Timed as a 'recompute' run (see record_run).
+        """
+        run = self.start_run('recompute')
         try:
-            raw_trades_df = conn.execute(
-                "SELECT * FROM trades WHERE asset_class NOT IN ('CASH') AND symbol NOT LIKE '%.%'").df()
+            processed = self._recompute_pnl(full_rebuild)
+        except Exception as e:
+            self.record_run(run, e)
+            raise
+        self.record_run(run)
+        return processed
+
+    def _recompute_pnl(self, full_rebuild):
+        conn = self.db.get_connection()
+        processed = self.update_pnl_state(full_rebuild=full_rebuild)
+
+        with stage('materialize'):
             raw_cash_df = conn.execute("SELECT * FROM transactions").df()
-            if raw_trades_df.empty: return pd.DataFrame(), pd.DataFrame()
-            closed_df, open_df = PnLEngine.calculate_fifo_pnl(raw_trades_df, raw_cash_df)
+            dividends_df = PnLEngine.process_dividends(raw_cash_df)
+            open_df = PnLEngine.summarize_open_lots(self.db.load_fifo_lots())
+            self.db.save_pnl_outputs(dividends_df, open_df)
+        logger.info(f"P&L tables refreshed (version {self.db.get_metadata('pnl_version')}).")
+        return processed
+
+    def ensure_pnl_tables(self):
+        """Databases synced before the P&L tables existed get materialized once."""
+        if self.db.get_metadata('pnl_version') is None:
+            self.recompute_pnl()
+            return
+        conn = self.db.get_connection()
+        rollup_missing = conn.execute(
+            "SELECT NOT EXISTS (SELECT 1 FROM daily_pnl) AND EXISTS (SELECT 1 FROM closed_trades)").fetchone()[0]
+        if rollup_missing:
+            self.db.rebuild_daily_pnl()
+
+    def get_processed_data(self):
+        conn = self.db.get_connection()
+        try:
+            self.ensure_pnl_tables()
+
+            closed_df = conn.execute("SELECT * FROM closed_trades ORDER BY close_date, entry_date, asset_id").df()
+            open_df = conn.execute("SELECT * FROM open_positions").df()
+            if closed_df.empty and open_df.empty: return pd.DataFrame(), pd.DataFrame()
+
             if not closed_df.empty:
                 closed_df['close_date'] = pd.to_datetime(closed_df['close_date'])
                 if 'entry_date' in closed_df.columns:
@@ -81,21 +304,46 @@ class DataService:
         except Exception as e:
             logger.error(f"Data Service failed: {e}")
             return pd.DataFrame(), pd.DataFrame()
-        finally:
-            self.db.close()
 
     # --- NEW ANALYTICS METHODS ---
     def get_strategy_data(self, closed_df):
         """Groups trades into Strategies (Verticals, Condors)."""
         if closed_df.empty: return pd.DataFrame()
-        grouped = StrategyEngine.group_executions_into_strategies(closed_df)
-        return StrategyEngine.aggregate_strategy_pnl(grouped)
+        with stage('strategy', rows=len(closed_df)):
+            grouped = run_partitioned(StrategyEngine.group_executions_into_strategies, closed_df, 'root_symbol',
+                                      backend=settings.EXECUTION_BACKEND, max_workers=settings.EXECUTION_WORKERS)
+            return StrategyEngine.aggregate_strategy_pnl(grouped)
 
     def get_campaign_data(self, closed_df):
         """Groups trades into Wheel Campaigns."""
         if closed_df.empty: return pd.DataFrame()
-        grouped = CampaignEngine.identify_campaigns(closed_df)
-        return CampaignEngine.aggregate_campaign_stats(grouped)
+        with stage('campaign', rows=len(closed_df)):
+            grouped = run_partitioned(CampaignEngine.identify_campaigns, closed_df, 'root_symbol',
+                                      backend=settings.EXECUTION_BACKEND, max_workers=settings.EXECUTION_WORKERS)
+            return CampaignEngine.aggregate_campaign_stats(grouped)
+
+    def get_lot_relief_comparison(self, methods=('fifo', 'lifo', 'hifo', 'average')):
+        """
+        Replays every execution once under several lot relief methods (one pass, see PnLEngine.match_lot_relief).
+
+        Returns:
+            (closed_df, open_df): realized matches with a 'method' column, and the remaining open
+            cost basis per method and root symbol.
+        """
+        conn = self.db.get_connection()
+        trades = conn.execute(f"SELECT * FROM trades WHERE {EXECUTION_FILTER}").df()
+        if trades.empty: return pd.DataFrame(), pd.DataFrame()
+
+        trades = trades.sort_values(['trade_date', 'trade_id'])
+        results = PnLEngine.match_lot_relief(trades, methods=methods)
+
+        closed_frames, open_frames = [], []
+        for method, (closed, lots) in results.items():
+            closed_frames.append(closed[['root_symbol', 'asset_id', 'quantity', 'entry_date', 'close_date',
+                                         'net_pnl']].assign(method=method))
+            basis = lots.assign(cost_basis=lots['price'] * lots['quantity'].abs() * lots['multiplier'])
+            open_frames.append(basis.groupby('root_symbol', as_index=False)['cost_basis'].sum().assign(method=method))
+        return pd.concat(closed_frames, ignore_index=True), pd.concat(open_frames, ignore_index=True)
 
     # -----------------------------
 
@@ -103,8 +351,6 @@ class DataService:
         conn = self.db.get_connection()
         try:
             try:
-                conn.execute(
-                    "CREATE TABLE IF NOT EXISTS market_data (symbol VARCHAR, date TIMESTAMP, close DOUBLE, PRIMARY KEY (symbol, date))")
                 res = conn.execute("SELECT MAX(date) FROM market_data WHERE symbol = ?", [symbol]).fetchone()
                 last_db_date = res[0] if res and res[0] else None
             except Exception:
@@ -149,16 +395,88 @@ class DataService:
             return df_db
         except Exception:
             return pd.DataFrame()
-        finally:
-            self.db.close()
+
+    # --- FILTERED QUERIES (pushed down to DuckDB) ---
+
+    @staticmethod
+    def _closed_trade_filters(start_date=None, end_date=None, symbols=None, date_column='close_date'):
+        """WHERE clause for calendar-day (inclusive) bounds on date_column and root symbols."""
+        clauses, params = [], []
+        if start_date is not None:
+            clauses.append(f"{date_column} >= ?")
+            params.append(pd.Timestamp(start_date).normalize().to_pydatetime())
+        if end_date is not None:
+            clauses.append(f"{date_column} < ?")
+            params.append((pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1)).to_pydatetime())
+        if symbols:
+            clauses.append("root_symbol IN (SELECT UNNEST(?::VARCHAR[]))")
+            params.append([str(s) for s in symbols])
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def query_closed_trades(self, start_date=None, end_date=None, symbols=None, columns=None) -> pd.DataFrame:
+        """
+        Returns realized trades (incl. dividends) with the filters evaluated inside DuckDB.
+
+        Args:
+            start_date / end_date: Inclusive calendar-day bounds on close_date.
+            symbols: Root symbols to keep (None or empty keeps all).
+            columns: Subset of CLOSED_COLUMNS to return (default: all).
+        """
+        columns = list(columns) if columns else CLOSED_COLUMNS
+        unknown = set(columns) - set(CLOSED_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown closed_trades columns: {sorted(unknown)}")
+
+        conn = self.db.get_connection()
+        where, params = self._closed_trade_filters(start_date, end_date, symbols)
+        select = ', '.join(columns)
+        return conn.execute(f"SELECT {select} FROM closed_trades{where} ORDER BY close_date, entry_date, asset_id",
+                            params).df()
+
+    def query_daily_pnl(self, start_date=None, end_date=None, symbols=None) -> pd.DataFrame:
+        """
+        Returns the daily_pnl rollup summed over the selected root symbols, indexed by day.
+        Columns: trade_pnl, dividend_pnl, net_pnl. Days without closes are absent.
+        """
+        conn = self.db.get_connection()
+        where, params = self._closed_trade_filters(start_date, end_date, symbols, date_column='pnl_date')
+        df = conn.execute(f"""
+            SELECT pnl_date, SUM(trade_pnl) AS trade_pnl, SUM(dividend_pnl) AS dividend_pnl
+            FROM daily_pnl{where}
+            GROUP BY pnl_date
+            ORDER BY pnl_date
+        """, params).df()
+        df['pnl_date'] = pd.to_datetime(df['pnl_date'])
+        df['net_pnl'] = df['trade_pnl'] + df['dividend_pnl']
+        return df.set_index('pnl_date')
+
+    def query_open_positions(self, symbols=None) -> pd.DataFrame:
+        conn = self.db.get_connection()
+        if symbols:
+            return conn.execute("SELECT * FROM open_positions WHERE root_symbol IN (SELECT UNNEST(?::VARCHAR[]))",
+                                [[str(s) for s in symbols]]).df()
+        return conn.execute("SELECT * FROM open_positions").df()
+
+    def get_root_symbols(self) -> list:
+        conn = self.db.get_connection()
+        rows = conn.execute(
+            "SELECT DISTINCT root_symbol FROM closed_trades WHERE root_symbol IS NOT NULL ORDER BY 1").fetchall()
+        return [str(r[0]) for r in rows]
+
+    def get_close_date_range(self):
+        """Returns (first, last) close_date of stored realized trades, or (None, None) when there are none."""
+        conn = self.db.get_connection()
+        first, last = conn.execute("SELECT MIN(close_date), MAX(close_date) FROM closed_trades").fetchone()
+        return first, last
 
     @staticmethod
     def apply_filters(df, symbols=None, date_range=None):
         if df.empty: return df
-        filtered_df = df.copy()
-        if symbols: filtered_df = filtered_df[filtered_df['root_symbol'].isin(symbols)]
+        mask = pd.Series(True, index=df.index)
+        if symbols: mask &= df['root_symbol'].isin(symbols)
         if date_range and len(date_range) == 2:
-            start_date, end_date = pd.to_datetime(date_range[0]), pd.to_datetime(date_range[1])
-            filtered_df = filtered_df[(filtered_df['close_date'].dt.date >= start_date.date()) & (
-                        filtered_df['close_date'].dt.date <= end_date.date())]
-        return filtered_df
\ No newline at end of file
+            # Compare timestamps against day bounds rather than building a date object per row
+            start_date = pd.Timestamp(date_range[0]).normalize()
+            end_date = pd.Timestamp(date_range[1]).normalize() + pd.Timedelta(days=1)
+            mask &= (df['close_date'] >= start_date) & (df['close_date'] < end_date)
+        return df[mask].copy()
@@ -1,19 +1,45 @@
 import duckdb
 import pandas as pd
 import logging
+import json
+import threading
+import time
+from contextlib import contextmanager
+from itertools import count
 from config import settings
 from pathlib import Path
 from datetime import datetime, timezone
 from zoneinfo import ZoneInfo  # Standard in Python 3.9+
 
+try:
+    import pyarrow as pa
+except ImportError:  # Optional: enables zero-copy Arrow ingestion
+    pa = None
+
 logger = logging.getLogger(__name__)
 
+# --- PROCESS-WIDE CONNECTION POOL ---
+# One DuckDB connection per database path, shared by every DatabaseManager in the process.
+# Each thread works on its own cursor (conn.cursor()), which DuckDB requires for concurrent use.
+_pool_lock = threading.Lock()
+_shared_connections = {}  # db_path -> (connection, generation)
+_initialized_schemas = set()  # db_paths whose tables were created in this process
+_generations = count(1)
+_thread_state = threading.local()  # .cursors: db_path -> [cursor, generation, last_health_check]
+_cursor_owners = {}  # db_path -> {thread ident: generation}, the threads holding a cursor (see release())
+
 
 class DatabaseManager:
     """
     Handles interactions with the DuckDB database (Local or MotherDuck).
     """
 
+    # Text formats tried (in order) when a string column lands in a TIMESTAMP column, e.g. IBKR "20240102;093500"
+    TIMESTAMP_FORMATS = ['%Y%m%d;%H%M%S', '%Y%m%d']
+
+    # Seconds between liveness probes of a pooled cursor
+    HEALTH_CHECK_INTERVAL = 30
+
     def __init__(self):
         # Check if MotherDuck token is present
         self.use_motherduck = settings.MOTHERDUCK_TOKEN is not None and len(settings.MOTHERDUCK_TOKEN) > 0
@@ -26,23 +52,109 @@ class DatabaseManager:
             Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
             logger.info(f"Configured for Local Database: {self.db_path}")
 
-        self.conn = None
-
     def get_connection(self):
-        if self.conn is None:
-            self.conn = duckdb.connect(self.db_path)
+        """
+        Returns this thread's cursor on the process-wide shared connection.
+        Cursors are health-checked at most every HEALTH_CHECK_INTERVAL seconds and rebuilt
+        (together with the shared connection) if the check fails.
+        """
+        cursors = getattr(_thread_state, 'cursors', None)
+        if cursors is None:
+            cursors = _thread_state.cursors = {}
+
+        entry = cursors.get(self.db_path)
+        if entry is not None:
+            cursor, generation, checked_at = entry
+            shared = _shared_connections.get(self.db_path)
+            if shared is not None and shared[1] == generation:
+                now = time.monotonic()
+                if now - checked_at < self.HEALTH_CHECK_INTERVAL:
+                    return cursor
+                if self._is_healthy(cursor):
+                    entry[2] = now
+                    return cursor
+                logger.warning("DuckDB connection failed health check. Reconnecting...")
+                self._discard_shared(generation)
+            self._close_quietly(cursor)
+            del cursors[self.db_path]
+
+        cursor, generation = self._open_cursor()
+        cursors[self.db_path] = [cursor, generation, time.monotonic()]
+        return cursor
+
+    def _connect(self):
+        """
+        Opens the database, waiting up to settings.DATABASE_LOCK_TIMEOUT seconds while another process
+        (e.g. the scheduler next to the dashboard) holds the local file's write lock.
+        """
+        deadline = time.monotonic() + max(0.0, settings.DATABASE_LOCK_TIMEOUT)
+        delay = 0.1
+        while True:
+            try:
+                return duckdb.connect(self.db_path)
+            except duckdb.IOException as e:
+                if 'lock' not in str(e).lower() or time.monotonic() + delay > deadline:
+                    raise
+                logger.info(f"Database is locked by another process, retrying in {delay:.1f}s...")
+                time.sleep(delay)
+                delay = min(delay * 2, 2.0)
+
+    def _open_cursor(self):
+        with _pool_lock:
+            shared = _shared_connections.get(self.db_path)
+            if shared is None:
+                shared = _shared_connections[self.db_path] = (self._connect(), next(_generations))
+            conn, generation = shared
+            cursor = conn.cursor()
+            _cursor_owners.setdefault(self.db_path, {})[threading.get_ident()] = generation
 
             if self.use_motherduck:
                 try:
-                    self.conn.execute("USE ibkr_dashboard")
+                    cursor.execute("USE ibkr_dashboard")
                 except Exception as e:
                     logger.warning(f"Could not switch context to ibkr_dashboard: {e}")
 
-            self._initialize_tables()
-        return self.conn
+            # Schema setup runs once per process, not on every connect
+            if self.db_path not in _initialized_schemas:
+                self._initialize_tables(cursor)
+                _initialized_schemas.add(self.db_path)
+        return cursor, generation
+
+    @staticmethod
+    @contextmanager
+    def registered(conn, name: str, data):
+        """Registers `data` as view `name` for the block. Unregistered even if a statement fails, so it never
+        lingers on the pooled cursor."""
+        conn.register(name, data)
+        try:
+            yield
+        finally:
+            conn.unregister(name)
+
+    @staticmethod
+    def _is_healthy(cursor) -> bool:
+        try:
+            cursor.execute("SELECT 1").fetchone()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _discard_shared(self, generation):
+        """Drops the shared connection (if it is still the given generation) so the next call reconnects."""
+        with _pool_lock:
+            shared = _shared_connections.get(self.db_path)
+            if shared is not None and shared[1] == generation:
+                del _shared_connections[self.db_path]
+                self._close_quietly(shared[0])
 
-    def _initialize_tables(self):
-        conn = self.conn
+    def _initialize_tables(self, conn):
         conn.execute("""
             CREATE TABLE IF NOT EXISTS trades (
                 trade_id VARCHAR PRIMARY KEY,
@@ -94,25 +206,277 @@ class DatabaseManager:
             )
         """)
 
+        # --- P&L ENGINE STATE (incremental FIFO) ---
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS closed_trades (
+                root_symbol VARCHAR,
+                asset_id VARCHAR,
+                quantity DOUBLE,
+                entry_date TIMESTAMP,
+                close_date TIMESTAMP,
+                commission DOUBLE,
+                net_pnl DOUBLE,
+                close_reason VARCHAR,
+                asset_class VARCHAR,
+                put_call VARCHAR,
+                strike DOUBLE,
+                expiry VARCHAR
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS fifo_lots (
+                lot_seq BIGINT,
+                asset_id VARCHAR,
+                root_symbol VARCHAR,
+                quantity DOUBLE,
+                price DOUBLE,
+                entry_date TIMESTAMP,
+                multiplier DOUBLE,
+                comm_per_unit DOUBLE
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS open_positions (
+                root_symbol VARCHAR,
+                asset_id VARCHAR,
+                quantity DOUBLE,
+                avg_price DOUBLE
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS daily_pnl (
+                pnl_date DATE,
+                root_symbol VARCHAR,
+                trade_pnl DOUBLE,
+                dividend_pnl DOUBLE,
+                commission DOUBLE,
+                closes INTEGER,
+                PRIMARY KEY (pnl_date, root_symbol)
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS fifo_processed_trades (
+                trade_id VARCHAR PRIMARY KEY,
+                asset_id VARCHAR
+            )
+        """)
+
     def save_dataframe(self, table_name: str, df: pd.DataFrame):
         if df.empty: return
-        date_cols = ['trade_date', 'date', 'dateTime']
-        for col in date_cols:
-            if col in df.columns:
-                df[col] = pd.to_datetime(df[col], errors='coerce')
+        # Timezone-aware columns keep their wall-clock time (DuckDB would shift them to the session zone)
+        for col in df.columns:
+            if isinstance(df[col].dtype, pd.DatetimeTZDtype):
+                df[col] = df[col].dt.tz_localize(None)
+        try:
+            inserted, ignored = self.ingest(table_name, df)
+            logger.info(f"Successfully synced {len(df)} rows to {table_name} ({inserted} new, {ignored} ignored).")
+        except Exception as e:
+            logger.error(f"Failed to save to {table_name}: {e}")
 
-                if df[col].dt.tz is not None:
-                    df[col] = df[col].dt.tz_localize(None)
+    def ingest(self, table_name: str, data) -> tuple:
+        """
+        Bulk-inserts rows into `table_name` with INSERT OR IGNORE, mapping columns by name.
 
+        Args:
+            data: A pandas DataFrame, a pyarrow Table / RecordBatch / RecordBatchReader, or an
+                iterable of those (e.g. chunks from core.parser.iter_ibkr_xml_chunks).
+                Arrow data is scanned by DuckDB in place, without a pandas copy.
+
+        Returns:
+            (inserted, ignored): rows written, and rows skipped because their key already existed.
+        """
+        if isinstance(data, pd.DataFrame) or (pa is not None and isinstance(data, (pa.Table, pa.RecordBatch))):
+            batches = [data]
+        else:
+            batches = data
+
+        conn = self.get_connection()
+        target = {row[0]: row[1] for row in conn.execute(f'DESCRIBE "{table_name}"').fetchall()}
+
+        inserted = total = 0
+        for batch in batches:
+            if pa is not None and isinstance(batch, pa.RecordBatch):
+                batch = pa.Table.from_batches([batch])
+            rows = len(batch)
+            if rows == 0:
+                continue
+
+            with self.registered(conn, 'ingest_view', batch):
+                source = {row[0]: row[1] for row in conn.execute("DESCRIBE ingest_view").fetchall()}
+                columns = [c for c in target if c in source]
+                select = ', '.join(self._ingest_expr(c, target[c], source[c]) for c in columns)
+                column_list = ', '.join(f'"{c}"' for c in columns)
+                res = conn.execute(
+                    f'INSERT OR IGNORE INTO "{table_name}" ({column_list}) SELECT {select} FROM ingest_view'
+                ).fetchone()
+
+            inserted += res[0] if res else 0
+            total += rows
+
+        return inserted, total - inserted
+
+    def _ingest_expr(self, column: str, target_type: str, source_type: str) -> str:
+        """SELECT expression for one column; timestamps are normalized inside DuckDB."""
+        col = f'"{column}"'
+        if target_type != 'TIMESTAMP' or source_type == 'TIMESTAMP':
+            return col
+        if source_type == 'VARCHAR':
+            formats = ', '.join(f"'{fmt}'" for fmt in self.TIMESTAMP_FORMATS)
+            return f"COALESCE(TRY_STRPTIME({col}, [{formats}]), TRY_CAST({col} AS TIMESTAMP)) AS {col}"
+        # Other types (e.g. TIMESTAMP WITH TIME ZONE from Arrow) are cast, invalid values become NULL
+        return f"TRY_CAST({col} AS TIMESTAMP) AS {col}"
+
+    def get_metadata(self, key: str):
+        conn = self.get_connection()
+        res = conn.execute("SELECT value FROM app_metadata WHERE key = ?", [key]).fetchone()
+        return res[0] if res else None
+
+    def set_metadata(self, key: str, value):
         conn = self.get_connection()
-        conn.register('df_view', df)
+        conn.execute("INSERT OR REPLACE INTO app_metadata (key, value) VALUES (?, ?)", [key, str(value)])
+
+    # --- INCREMENTAL FIFO STATE ---
+
+    def get_fifo_watermark(self):
+        """Returns the (trade_date, trade_id) of the last execution fed to the matcher, or None."""
+        date_val = self.get_metadata('fifo_hwm_date')
+        if date_val is None:
+            return None
+        return datetime.fromisoformat(date_val), self.get_metadata('fifo_hwm_trade_id') or ''
+
+    def load_fifo_lots(self) -> pd.DataFrame:
+        conn = self.get_connection()
+        return conn.execute("""
+            SELECT asset_id, root_symbol, quantity, price, entry_date, multiplier, comm_per_unit
+            FROM fifo_lots ORDER BY lot_seq
+        """).df()
+
+    def save_fifo_state(self, closed_df: pd.DataFrame, lots_df: pd.DataFrame, processed_df: pd.DataFrame,
+                        watermark, rebuild_assets=None, full_rebuild=False):
+        """
+        Atomically applies one matcher run to the stored state.
+
+        Args:
+            closed_df: New closed matches to append.
+            lots_df: The complete open-lot inventory after the run (replaces fifo_lots).
+            processed_df: trade_id/asset_id of every execution fed to the matcher.
+            watermark: (trade_date, trade_id) of the newest processed execution.
+            rebuild_assets: Asset keys whose history was replayed from scratch (their old rows are dropped).
+            full_rebuild: Drop all previous closed matches and processed ids.
+        """
+        conn = self.get_connection()
+        conn.begin()
         try:
-            conn.execute(f"INSERT OR IGNORE INTO {table_name} SELECT * FROM df_view")
-            logger.info(f"Successfully synced {len(df)} rows to {table_name}.")
-        except Exception as e:
-            logger.error(f"Failed to save to {table_name}: {e}")
-        finally:
-            conn.unregister('df_view')
+            if full_rebuild:
+                conn.execute("DELETE FROM closed_trades")
+                conn.execute("DELETE FROM fifo_processed_trades")
+            elif rebuild_assets:
+                with self.registered(conn, 'rebuild_view', pd.DataFrame({'asset_id': list(rebuild_assets)})):
+                    conn.execute("DELETE FROM closed_trades WHERE asset_id IN (SELECT asset_id FROM rebuild_view)")
+                    conn.execute("DELETE FROM fifo_processed_trades "
+                                 "WHERE asset_id IN (SELECT asset_id FROM rebuild_view)")
+
+            conn.execute("DELETE FROM fifo_lots")
+            if not lots_df.empty:
+                with self.registered(conn, 'lots_view', lots_df.assign(lot_seq=range(len(lots_df)))):
+                    conn.execute("""
+                        INSERT INTO fifo_lots (lot_seq, asset_id, root_symbol, quantity, price, entry_date, multiplier,
+                                               comm_per_unit)
+                        SELECT lot_seq, asset_id, root_symbol, quantity, price, entry_date, multiplier, comm_per_unit
+                        FROM lots_view
+                    """)
+
+            if not closed_df.empty:
+                with self.registered(conn, 'closed_view', closed_df):
+                    conn.execute("""
+                        INSERT INTO closed_trades (root_symbol, asset_id, quantity, entry_date, close_date, commission,
+                                                   net_pnl, close_reason, asset_class, put_call, strike, expiry)
+                        SELECT root_symbol, asset_id, quantity, entry_date, close_date, commission,
+                               net_pnl, close_reason, asset_class, put_call, CAST(strike AS DOUBLE),
+                               CAST(expiry AS VARCHAR)
+                        FROM closed_view
+                    """)
+
+            if not processed_df.empty:
+                with self.registered(conn, 'processed_view', processed_df):
+                    conn.execute("""
+                        INSERT OR IGNORE INTO fifo_processed_trades (trade_id, asset_id)
+                        SELECT trade_id, asset_id FROM processed_view
+                    """)
+
+            if watermark is not None:
+                self.set_metadata('fifo_hwm_date', pd.Timestamp(watermark[0]).isoformat())
+                self.set_metadata('fifo_hwm_trade_id', watermark[1])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def save_pnl_outputs(self, dividends_df: pd.DataFrame, open_df: pd.DataFrame):
+        """
+        Materializes the remaining P&L outputs next to the FIFO state and bumps 'pnl_version'.
+        Dividend rows are kept in closed_trades (asset_id 'DIVIDEND') so readers need a single scan.
+        """
+        conn = self.get_connection()
+        conn.begin()
+        try:
+            conn.execute("DELETE FROM closed_trades WHERE asset_id = 'DIVIDEND'")
+            if not dividends_df.empty:
+                with self.registered(conn, 'dividends_view', dividends_df):
+                    conn.execute("""
+                        INSERT INTO closed_trades (root_symbol, asset_id, quantity, entry_date, close_date, commission,
+                                                   net_pnl, close_reason, asset_class, put_call, strike, expiry)
+                        SELECT root_symbol, asset_id, quantity, entry_date, close_date, commission,
+                               net_pnl, close_reason, asset_class, NULL, NULL, NULL
+                        FROM dividends_view
+                    """)
+
+            conn.execute("DELETE FROM open_positions")
+            if not open_df.empty:
+                with self.registered(conn, 'open_view', open_df):
+                    conn.execute("""
+                        INSERT INTO open_positions (root_symbol, asset_id, quantity, avg_price)
+                        SELECT root_symbol, asset_id, quantity, avg_price FROM open_view
+                    """)
+
+            self._rebuild_daily_pnl(conn)
+
+            version = int(self.get_metadata('pnl_version') or 0) + 1
+            self.set_metadata('pnl_version', version)
+            self.set_metadata('pnl_updated_at', datetime.now(timezone.utc).isoformat())
+            self.bump_data_version()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def rebuild_daily_pnl(self):
+        """Re-derives the daily_pnl rollup from closed_trades."""
+        conn = self.get_connection()
+        conn.begin()
+        try:
+            self._rebuild_daily_pnl(conn)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    @staticmethod
+    def _rebuild_daily_pnl(conn):
+        # One row per (close day, root) with trades and dividends split, so charts scale with days, not fills
+        conn.execute("DELETE FROM daily_pnl")
+        conn.execute("""
+            INSERT INTO daily_pnl (pnl_date, root_symbol, trade_pnl, dividend_pnl, commission, closes)
+            SELECT CAST(close_date AS DATE),
+                   COALESCE(root_symbol, ''),
+                   COALESCE(SUM(net_pnl) FILTER (WHERE asset_id <> 'DIVIDEND'), 0),
+                   COALESCE(SUM(net_pnl) FILTER (WHERE asset_id = 'DIVIDEND'), 0),
+                   COALESCE(SUM(commission), 0),
+                   COUNT(*) FILTER (WHERE asset_id <> 'DIVIDEND')
+            FROM closed_trades
+            WHERE close_date IS NOT NULL
+            GROUP BY 1, 2
+        """)
 
     def record_sync_time(self):
         """Updates the last_sync timestamp in UTC."""
@@ -120,6 +484,28 @@ class DatabaseManager:
         # Store as UTC-aware datetime string
         now_utc = datetime.now(timezone.utc)
         conn.execute("INSERT OR REPLACE INTO app_metadata (key, value) VALUES ('last_sync', ?)", [now_utc.isoformat()])
+        self.bump_data_version()
+
+    def bump_data_version(self):
+        """Increments 'data_version', the key that caches of derived data are invalidated on."""
+        conn = self.get_connection()
+        conn.execute("""
+            INSERT OR REPLACE INTO app_metadata (key, value)
+            SELECT 'data_version', CAST(COALESCE(MAX(TRY_CAST(value AS BIGINT)), 0) + 1 AS VARCHAR)
+            FROM app_metadata WHERE key = 'data_version'
+        """)
+
+    def set_scheduler_status(self, status: dict):
+        """Stores the background scheduler's latest status (see scheduler.py)."""
+        self.set_metadata('scheduler_status', json.dumps(status, default=str))
+
+    def get_scheduler_status(self):
+        value = self.get_metadata('scheduler_status')
+        return json.loads(value) if value else None
+
+    def get_data_version(self) -> int:
+        """Monotonically increasing counter, bumped on every sync and P&L refresh."""
+        return int(self.get_metadata('data_version') or 0)
 
     def get_last_sync_time(self):
         """Returns the last sync timestamp converted to NY Time."""
@@ -146,6 +532,36 @@ class DatabaseManager:
             return "Unknown"
 
     def close(self):
-        if self.conn:
-            self.conn.close()
-            self.conn = None
\ No newline at end of file
+        """Releases this thread's cursor. The shared connection stays open for the rest of the process."""
+        cursors = getattr(_thread_state, 'cursors', {})
+        entry = cursors.pop(self.db_path, None)
+        with _pool_lock:
+            _cursor_owners.get(self.db_path, {}).pop(threading.get_ident(), None)
+        if entry is not None:
+            self._close_quietly(entry[0])
+
+    def release(self):
+        """
+        Releases this thread's cursor and closes the shared connection (freeing a local file's lock)
+        once no other live thread holds a cursor on it. Threads still mid-query keep it open.
+        """
+        self.close()
+        alive = {thread.ident for thread in threading.enumerate()}
+        with _pool_lock:
+            shared = _shared_connections.get(self.db_path)
+            owners = _cursor_owners.get(self.db_path, {})
+            # Forget threads that ended without releasing, and cursors on an older connection
+            for ident in [i for i, gen in owners.items() if i not in alive or shared is None or gen != shared[1]]:
+                del owners[ident]
+            if shared is not None and not owners:
+                self._close_quietly(shared[0])
+                del _shared_connections[self.db_path]
+
+    @staticmethod
+    def close_all():
+        """Closes every shared connection in the process (e.g. on shutdown, or to release a local file lock)."""
+        with _pool_lock:
+            for conn, _ in _shared_connections.values():
+                DatabaseManager._close_quietly(conn)
+            _shared_connections.clear()
+            _cursor_owners.clear()
\ No newline at end of file
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('serial', 'threads', 'processes')
+
+# Partitions per worker, so one heavy symbol range does not leave the other workers idle
+PARTITIONS_PER_WORKER = 4
+
+
+def assign_partitions(keys: pd.Series, n_parts: int) -> np.ndarray:
+    """
+    Assigns every row a partition number so that each key lands in exactly one partition.
+    Partitions are contiguous ranges of the sorted keys, balanced by row count; missing keys go last.
+    """
+    codes, uniques = pd.factorize(keys, sort=True, use_na_sentinel=True)
+    n_keys = len(uniques) + int((codes < 0).any())
+    n_parts = max(1, min(n_parts, n_keys))
+    codes = np.where(codes < 0, len(uniques), codes)
+
+    rows_per_key = np.bincount(codes, minlength=n_keys)
+    rows_before = np.cumsum(rows_per_key) - rows_per_key
+    part_of_key = np.minimum(rows_before * n_parts // max(len(keys), 1), n_parts - 1)
+    return part_of_key[codes]
+
+
+def _concat(results):
+    frames = [r for r in results if isinstance(r, pd.DataFrame) and not (r.empty and len(r.columns) == 0)]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames) if len(frames) > 1 else frames[0]
+
+
+def run_partitioned(func, df: pd.DataFrame, key, backend: str = None, max_workers: int = None, aligned=None,
+                    **kwargs):
+    """
+    Runs a per-symbol engine over partitions of `df` and concatenates the results in partition order.
+
+    Args:
+        func: Engine function taking the partition as first argument (must be importable for 'processes').
+        df: Input frame.
+        key: Column name or row-aligned Series the engine is independent on (e.g. root symbol).
+        backend: 'serial' (single call on the whole frame), 'threads' or 'processes'.
+        max_workers: Pool size (defaults to the CPU count).
+        aligned: Optional {kwarg: (frame, key)} of extra inputs split with the same partition plan
+                 (e.g. stored open lots next to new executions).
+        **kwargs: Passed unchanged to every call.
+
+    Returns:
+        The concatenated DataFrame, or a tuple of concatenated DataFrames if `func` returns tuples.
+    """
+    backend = backend or 'serial'
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown execution backend '{backend}'. Expected one of {BACKENDS}.")
+    aligned = aligned or {}
+
+    if backend == 'serial' or df.empty:
+        return func(df, **{name: frame for name, (frame, _) in aligned.items()}, **kwargs)
+
+    def key_values(frame, k):
+        return frame[k] if isinstance(k, str) else pd.Series(k, index=frame.index)
+
+    max_workers = max_workers or os.cpu_count() or 1
+    keys = key_values(df, key)
+    extra_keys = {name: key_values(frame, k) for name, (frame, k) in aligned.items() if frame is not None}
+    all_keys = pd.concat([keys, *extra_keys.values()], ignore_index=True)
+    parts = assign_partitions(all_keys, max_workers * PARTITIONS_PER_WORKER)
+
+    offset = len(keys)
+    part_of_row = {None: parts[:offset]}
+    for name, k in extra_keys.items():
+        part_of_row[name] = parts[offset:offset + len(k)]
+        offset += len(k)
+
+    tasks = []
+    for part in np.unique(parts):
+        task_kwargs = dict(kwargs)
+        for name, (frame, _) in aligned.items():
+            task_kwargs[name] = frame[part_of_row[name] == part] if frame is not None else None
+        tasks.append((df[part_of_row[None] == part], task_kwargs))
+
+    logger.debug(f"Running {func.__qualname__} on {len(tasks)} partitions ({backend}, {max_workers} workers).")
+    if backend == 'threads':
+        pool = ThreadPoolExecutor(max_workers=max_workers)
+    else:
+        # 'spawn' avoids forking a process that already runs database and UI threads
+        pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+    with pool:
+        futures = [pool.submit(func, part_df, **task_kwargs) for part_df, task_kwargs in tasks]
+        results = [f.result() for f in futures]
+
+    if results and isinstance(results[0], tuple):
+        return tuple(_concat(items) for items in zip(*results))
+    return _concat(results)
@@ -1,8 +1,22 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import asyncio
+import random
 import time
 import logging
 import xml.etree.ElementTree as ET
+from contextlib import asynccontextmanager
 from typing import Optional
+from config import settings
+from core.instrumentation import stage, record_stage
+
+try:
+    import httpx
+except ImportError:  # Optional: only needed for AsyncIBKRFlexClient
+    httpx = None
+
+HTTPX_AVAILABLE = httpx is not None
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -13,17 +27,56 @@ class IBKRFlexClient:
     """
     Handles communication with IBKR Flex Web Service.
     Includes headers to avoid bot detection in Cloud environments.
+
+    All calls go through one requests.Session: the request and every download poll reuse a
+    keep-alive connection (per host), responses are gzip-compressed, and connection errors and
+    429/5xx answers are retried by the transport adapter before the Flex-level retry loop sees them.
+    Use it as a context manager (or call close()) to release the connection.
     """
 
     BASE_URL = "https://ndcdyn.interactivebrokers.com/Universal/servlet/FlexStatementService.SendRequest"
 
-    def __init__(self, token: str, query_id: str):
+    # IBKR sometimes blocks requests without a User-Agent
+    HEADERS = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+    }
+
+    # Seconds between polls while IBKR reports "Statement generation in progress"
+    POLL_INTERVAL = 3
+
+    # Seconds to wait for a connection; reads use settings.FLEX_TIMEOUT_SECONDS
+    CONNECT_TIMEOUT = 10
+
+    def __init__(self, token: str, query_id: str, session: requests.Session = None, timeout=None):
         self.token = token
         self.query_id = query_id
-        # IBKR sometimes blocks requests without a User-Agent
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
+        self.timeout = timeout if timeout is not None else (self.CONNECT_TIMEOUT, settings.FLEX_TIMEOUT_SECONDS)
+        self.session = session if session is not None else self.build_session()
+
+    @classmethod
+    def build_session(cls) -> requests.Session:
+        """Session with keep-alive, gzip and transport-level retries (connect errors, 429 and 5xx)."""
+        session = requests.Session()
+        session.headers.update(cls.HEADERS)
+        session.headers['Accept-Encoding'] = 'gzip, deflate'
+        retry = Retry(total=3, connect=3, read=2, status=3, backoff_factor=0.5,
+                      status_forcelist=(429, 500, 502, 503, 504), allowed_methods=frozenset({'GET'}),
+                      respect_retry_after_header=True, raise_on_status=False)
+        # One pool per host with a single connection: request and polls are strictly sequential
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=2, pool_maxsize=1)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
 
     def request_report(self) -> Optional[str]:
         """Sends the initial request to IBKR to generate the report."""
@@ -35,7 +88,8 @@ class IBKRFlexClient:
 
         try:
             logger.info("Sending Report Request to IBKR...")
-            response = requests.get(self.BASE_URL, params=params, headers=self.headers)
+            with stage('request'):
+                response = self.session.get(self.BASE_URL, params=params, timeout=self.timeout)
             response.raise_for_status()
 
             # IBKR returns XML
@@ -72,15 +126,19 @@ class IBKRFlexClient:
         # Increased retries for Cloud environments
         max_retries = 10
 
+        # Time spent waiting for the statement ('poll') vs. the attempt that returned it ('download')
+        started = time.perf_counter()
+
         for attempt in range(max_retries):
             try:
                 logger.info(f"Downloading Report (Attempt {attempt + 1}/{max_retries})...")
-                response = requests.get(download_url, params=params, headers=self.headers)
+                attempt_start = time.perf_counter()
+                response = self.session.get(download_url, params=params, timeout=self.timeout)
 
                 # Check for "Generation in Progress" (Error 1019)
                 if b"1019" in response.content and b"Statement generation in progress" in response.content:
-                    logger.warning("Statement generating... waiting 3 seconds.")
-                    time.sleep(3)
+                    logger.warning(f"Statement generating... waiting {self.POLL_INTERVAL} seconds.")
+                    time.sleep(self.POLL_INTERVAL)
                     continue
 
                 # Check for other XML Errors
@@ -100,12 +158,208 @@ class IBKRFlexClient:
                     logger.error(f"Downloaded content seems too short/empty: {response.text}")
                     return None
 
+                record_stage('poll', attempt_start - started, attempts=attempt + 1)
+                record_stage('download', time.perf_counter() - attempt_start, bytes=len(response.content))
                 logger.info("Report downloaded successfully.")
                 return response.text
 
             except Exception as e:
                 logger.error(f"Download attempt failed: {e}")
-                time.sleep(3)
+                time.sleep(self.POLL_INTERVAL)
 
+        record_stage('poll', time.perf_counter() - started, attempts=max_retries)
         logger.error("Max retries exceeded. Report download failed.")
-        return None
\ No newline at end of file
+        return None
+
+
+# --- ASYNC CLIENT ---
+
+# Flex error codes that mean "try again shortly" (statement not ready, server busy)
+RETRYABLE_CODES = {'1001', '1004', '1005', '1006', '1007', '1008', '1009', '1019', '1021'}
+# Token rate limit (1 request/second, 10 requests/minute): back off for at least FLEX_THROTTLE_DELAY
+THROTTLE_CODES = {'1018'}
+
+
+def flex_error(content: bytes):
+    """(code, message) of a Flex error response, or None. Only small error documents are parsed."""
+    if b"<ErrorCode>" not in content or b"<ErrorMessage>" not in content:
+        return None
+    root = ET.fromstring(content)
+    code = root.find('ErrorCode')
+    message = root.find('ErrorMessage')
+    return (code.text if code is not None else 'Unknown'), (message.text if message is not None else '')
+
+
+class BackoffPolicy:
+    """
+    Exponential backoff with jitter: the n-th retry waits initial * multiplier**n (capped at `maximum`),
+    of which a `jitter` fraction is randomized, so clients started together do not poll in lockstep.
+    """
+
+    def __init__(self, initial: float = None, maximum: float = None, multiplier: float = None,
+                 jitter: float = None, throttle_delay: float = None, rng: random.Random = None):
+        self.initial = settings.FLEX_BACKOFF_INITIAL if initial is None else initial
+        self.maximum = settings.FLEX_BACKOFF_MAX if maximum is None else maximum
+        self.multiplier = settings.FLEX_BACKOFF_MULTIPLIER if multiplier is None else multiplier
+        self.jitter = min(1.0, max(0.0, settings.FLEX_BACKOFF_JITTER if jitter is None else jitter))
+        self.throttle_delay = settings.FLEX_THROTTLE_DELAY if throttle_delay is None else throttle_delay
+        self.rng = rng or random.Random()
+
+    def delay(self, retry: int, throttled: bool = False) -> float:
+        """Seconds to wait before retry number `retry` (0-based)."""
+        base = min(self.maximum, self.initial * self.multiplier ** retry)
+        wait = base * (1 - self.jitter) + self.rng.uniform(0, base * self.jitter)
+        return max(wait, self.throttle_delay) if throttled else wait
+
+
+class AsyncIBKRFlexClient:
+    """
+    asyncio version of IBKRFlexClient (httpx). Polls with exponential backoff and jitter instead of
+    fixed 3 second sleeps, honors IBKR's throttling codes and gives up at an overall deadline, so
+    waiting for a report does not hold a thread.
+
+    Args:
+        backoff: BackoffPolicy (defaults from settings).
+        deadline: Seconds a request_report / download_report / fetch_report call may take in total.
+        timeout: Per-HTTP-request timeout in seconds.
+        client: Optional httpx.AsyncClient to reuse (otherwise one is opened per call).
+    """
+
+    BASE_URL = IBKRFlexClient.BASE_URL
+
+    def __init__(self, token: str, query_id: str, backoff: BackoffPolicy = None, deadline: float = None,
+                 timeout: float = None, client=None):
+        if httpx is None:
+            raise ImportError("httpx is required for AsyncIBKRFlexClient.")
+        self.token = token
+        self.query_id = query_id
+        self.backoff = backoff or BackoffPolicy()
+        self.deadline = settings.FLEX_DEADLINE_SECONDS if deadline is None else deadline
+        self.timeout = settings.FLEX_TIMEOUT_SECONDS if timeout is None else timeout
+        self.headers = dict(IBKRFlexClient.HEADERS)
+        self.client = client
+
+    @asynccontextmanager
+    async def _session(self):
+        """The injected client (left open), or a new one for the duration of the call."""
+        if self.client is not None:
+            yield self.client
+            return
+        # Connection errors are retried by the transport; keep-alive makes request and polls share a connection
+        transport = httpx.AsyncHTTPTransport(retries=2, limits=httpx.Limits(max_connections=2,
+                                                                           max_keepalive_connections=2))
+        async with httpx.AsyncClient(headers=self.headers, timeout=self.timeout, follow_redirects=True,
+                                     transport=transport) as client:
+            yield client
+
+    async def _get(self, client, url: str, params: dict, deadline: float, label: str):
+        """
+        GETs `url` until it returns something other than a retryable Flex error, or the deadline passes.
+
+        Returns:
+            (response or None, attempts, seconds of the final attempt)
+        """
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            attempt += 1
+            throttled = False
+            started = loop.time()
+            try:
+                response = await client.get(url, params=params)
+                if response.status_code == 429 or response.status_code >= 500:
+                    throttled = response.status_code == 429
+                    logger.warning(f"{label}: HTTP {response.status_code} (attempt {attempt}).")
+                else:
+                    response.raise_for_status()
+                    error = flex_error(response.content)
+                    if error is None:
+                        return response, attempt, loop.time() - started
+                    code, message = error
+                    if code not in RETRYABLE_CODES and code not in THROTTLE_CODES:
+                        logger.error(f"IBKR {label} Error [{code}]: {message}")
+                        return None, attempt, 0.0
+                    throttled = code in THROTTLE_CODES
+                    logger.info(f"{label}: [{code}] {message} (attempt {attempt}).")
+            except ET.ParseError as e:
+                # e.g. an HTML maintenance page: retried until the deadline, like the sync client does
+                logger.warning(f"{label}: unparseable response ({e}): {response.text[:200]!r} (attempt {attempt}).")
+            except httpx.TransportError as e:
+                logger.warning(f"{label}: {type(e).__name__}: {e} (attempt {attempt}).")
+            except httpx.HTTPStatusError as e:
+                logger.error(f"IBKR {label} failed: {e}")
+                return None, attempt, 0.0
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                logger.error(f"{label}: gave up after {attempt} attempts ({self.deadline:.0f}s deadline).")
+                return None, attempt, 0.0
+            await asyncio.sleep(min(self.backoff.delay(attempt - 1, throttled), remaining))
+
+    async def request_report(self, client=None, deadline: float = None) -> Optional[tuple]:
+        """Asks IBKR to generate the statement. Returns (reference_code, url) or None."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline if deadline is None else deadline
+        if client is None:
+            async with self._session() as client:
+                return await self.request_report(client, deadline)
+
+        params = {'t': self.token, 'q': self.query_id, 'v': '3'}
+        logger.info("Sending Report Request to IBKR...")
+        started = loop.time()
+        response, attempts, _ = await self._get(client, self.BASE_URL, params, deadline, 'Request')
+        record_stage('request', loop.time() - started, attempts=attempts)
+        if response is None:
+            return None
+        try:
+            root = ET.fromstring(response.content)
+            if root.findtext('Status') != 'Success':
+                logger.error(f"IBKR Request failed: {response.text[:500]}")
+                return None
+            reference_code, url = root.findtext('ReferenceCode'), root.findtext('Url')
+        except ET.ParseError as e:
+            logger.error(f"Unexpected response to report request: {e}")
+            return None
+        logger.info(f"Report request successful. Reference Code: {reference_code}")
+        return reference_code, url
+
+    async def download_report(self, reference_code: str, download_url: str, client=None,
+                              deadline: float = None) -> Optional[str]:
+        """Polls until the statement is ready and returns its XML, or None."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline if deadline is None else deadline
+        if client is None:
+            async with self._session() as client:
+                return await self.download_report(reference_code, download_url, client, deadline)
+
+        params = {'t': self.token, 'q': reference_code, 'v': '3'}
+        started = loop.time()
+        response, attempts, fetch_seconds = await self._get(client, download_url, params, deadline, 'Download')
+        record_stage('poll', loop.time() - started - fetch_seconds, attempts=attempts)
+        if response is None:
+            return None
+        record_stage('download', fetch_seconds, bytes=len(response.content))
+
+        if len(response.text) < 50:
+            logger.error(f"Downloaded content seems too short/empty: {response.text}")
+            return None
+        logger.info(f"Report downloaded successfully ({attempts} attempts).")
+        return response.text
+
+    async def fetch_report(self):
+        """
+        request_report + download_report on one connection and under one deadline.
+
+        Returns:
+            (xml_content, None) on success, (None, error message) otherwise.
+        """
+        deadline = asyncio.get_running_loop().time() + self.deadline
+        async with self._session() as client:
+            result = await self.request_report(client, deadline)
+            if not result:
+                return None, "Failed to initiate report request."
+            xml_content = await self.download_report(*result, client=client, deadline=deadline)
+            if not xml_content:
+                return None, "Download failed (empty content)."
+            return xml_content, None
+
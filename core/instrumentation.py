@@ -0,0 +1,225 @@
+import pandas as pd
+import logging
+import contextvars
+import json
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+try:
+    from pyinstrument import Profiler as PyinstrumentProfiler
+except ImportError:  # Optional: only needed for PROFILER=pyinstrument
+    PyinstrumentProfiler = None
+
+logger = logging.getLogger(__name__)
+
+PROFILERS = ('cprofile', 'pyinstrument')
+
+_current_run = contextvars.ContextVar('current_run', default=None)
+
+
+class Stage:
+    """Accumulated wall time and row count of one named pipeline stage."""
+    __slots__ = ('name', 'seconds', 'rows', 'calls', 'info')
+
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.rows = 0
+        self.calls = 0
+        self.info = {}
+
+    def to_dict(self):
+        return {'stage': self.name, 'seconds': round(self.seconds, 6), 'rows': self.rows, 'calls': self.calls,
+                **self.info}
+
+
+class RunTimer:
+    """
+    Per-stage timers and row counters for one pipeline run (a sync, a recompute, a dashboard render).
+
+    While a run is active (`with RunTimer('sync') as run:`), code anywhere below it reports into it
+    through the module-level `stage()`, without passing the timer around. Re-entering a stage name
+    accumulates into it (e.g. parse/save alternating per chunk).
+
+    Args:
+        kind: Run label stored in the record ('sync', 'recompute', 'render', ...).
+        profiler: None, 'cprofile' or 'pyinstrument'. The profile is written to `profile_dir` when the run ends.
+        profile_dir: Where profiles go (created on demand).
+    """
+
+    def __init__(self, kind: str, profiler: str = None, profile_dir: str = None):
+        if profiler and profiler not in PROFILERS:
+            raise ValueError(f"Unknown profiler '{profiler}'. Expected one of {PROFILERS}.")
+        self.kind = kind
+        self.run_id = uuid.uuid4().hex[:12]
+        self.profiler_name = profiler or None
+        self.profile_dir = profile_dir
+        self.profile_path = None
+        self.stages = {}
+        self.status = 'running'
+        self.error = None
+        self.started_at = None
+        self._start = None
+        self._seconds = None
+        self._profiler = None
+        self._token = None
+
+    # --- Lifecycle ---
+
+    def start(self):
+        self.started_at = datetime.now(timezone.utc)
+        self._start = time.perf_counter()
+        self._token = _current_run.set(self)
+        self._start_profiler()
+        return self
+
+    def finish(self, error=None) -> dict:
+        """Stops the clock and the profiler, and returns the run record. Passing `error` marks the run failed."""
+        if self._seconds is None:
+            self._seconds = time.perf_counter() - self._start
+            self._stop_profiler()
+            if self._token is not None:
+                try:
+                    _current_run.reset(self._token)
+                except ValueError:  # Finished from another context (e.g. a different thread)
+                    _current_run.set(None)
+                self._token = None
+            self.status = 'error' if error is not None else 'ok'
+            self.error = str(error) if error is not None else None
+        return self.to_record()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.finish(exc)
+        return False
+
+    # --- Stages ---
+
+    @contextmanager
+    def stage(self, name: str, rows: int = None):
+        """Times the enclosed block into stage `name`. The yielded Stage's `rows` can be raised inside the block."""
+        record = self.stages.get(name)
+        if record is None:
+            record = self.stages[name] = Stage(name)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record.seconds += time.perf_counter() - start
+            record.calls += 1
+            if rows:
+                record.rows += rows
+
+    def add(self, name: str, seconds: float, rows: int = 0, **info):
+        """Records time measured elsewhere (e.g. the polling part of a download loop)."""
+        record = self.stages.get(name)
+        if record is None:
+            record = self.stages[name] = Stage(name)
+        record.seconds += seconds
+        record.rows += rows or 0
+        record.calls += 1
+        record.info.update(info)
+
+    # --- Profiling ---
+
+    def _start_profiler(self):
+        if self.profiler_name == 'cprofile':
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif self.profiler_name == 'pyinstrument':
+            if PyinstrumentProfiler is None:
+                logger.warning("pyinstrument is not installed; running without a profiler.")
+                self.profiler_name = None
+                return
+            self._profiler = PyinstrumentProfiler()
+            self._profiler.start()
+
+    def _stop_profiler(self):
+        if self._profiler is None:
+            return
+        directory = Path(self.profile_dir or 'data/profiles')
+        directory.mkdir(parents=True, exist_ok=True)
+        stem = f"{self.kind}-{self.started_at:%Y%m%dT%H%M%S}-{self.run_id}"
+        try:
+            if self.profiler_name == 'cprofile':
+                self._profiler.disable()
+                path = directory / f"{stem}.prof"
+                self._profiler.dump_stats(str(path))
+            else:
+                self._profiler.stop()
+                path = directory / f"{stem}.html"
+                path.write_text(self._profiler.output_html(), encoding='utf-8')
+            self.profile_path = str(path)
+            logger.info(f"Profile written to {path}")
+        except Exception as e:
+            logger.error(f"Failed to write profile: {e}")
+        finally:
+            self._profiler = None
+
+    # --- Output ---
+
+    @property
+    def seconds(self) -> float:
+        return self._seconds if self._seconds is not None else time.perf_counter() - self._start
+
+    def to_record(self) -> dict:
+        """JSON-serializable timing record of the run."""
+        return {
+            'run_id': self.run_id,
+            'kind': self.kind,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'seconds': round(self.seconds, 6) if self._start is not None else 0.0,
+            'status': self.status,
+            'error': self.error,
+            'profile': self.profile_path,
+            'stages': [s.to_dict() for s in self.stages.values()],
+        }
+
+
+@contextmanager
+def stage(name: str, rows: int = None):
+    """Times the enclosed block into the active run's stage `name` (a no-op timer when no run is active)."""
+    run = _current_run.get()
+    if run is None:
+        yield Stage(name)
+        return
+    with run.stage(name, rows=rows) as record:
+        yield record
+
+
+def record_stage(name: str, seconds: float, rows: int = 0, **info):
+    """RunTimer.add on the active run, if any."""
+    run = _current_run.get()
+    if run is not None:
+        run.add(name, seconds, rows=rows, **info)
+
+
+def write_record(record: dict, path: str = None):
+    """Appends one run record as a JSON line to `path` and logs a one-line summary."""
+    summary = ', '.join(f"{s['stage']} {s['seconds']:.2f}s" for s in record['stages'])
+    logger.info(f"Run {record['kind']} ({record['status']}) took {record['seconds']:.2f}s: {summary}")
+    if not path:
+        return
+    try:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, default=str) + '\n')
+    except OSError as e:
+        logger.error(f"Failed to write timing record to {path}: {e}")
+
+
+def stages_frame(record: dict) -> pd.DataFrame:
+    """Stage breakdown of a run record as a table (seconds, share of the run, rows, rows/sec)."""
+    if not record or not record.get('stages'):
+        return pd.DataFrame(columns=['seconds', 'share', 'rows', 'rows_per_sec'])
+    df = pd.DataFrame(record['stages']).set_index('stage')
+    total = record.get('seconds') or df['seconds'].sum()
+    df['share'] = df['seconds'] / total if total else 0.0
+    df['rows_per_sec'] = (df['rows'] / df['seconds']).where(df['rows'] > 0).fillna(0.0)
+    return df[['seconds', 'share', 'rows', 'rows_per_sec']]
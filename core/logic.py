@@ -1,148 +1,233 @@
+import numpy as np
 import pandas as pd
 import logging
-from collections import deque
+import sys
+from array import array
+from core.lot_relief import Lot, book_factory
 
 logger = logging.getLogger(__name__)
 
 
+CLOSED_COLUMNS = ['root_symbol', 'asset_id', 'quantity', 'entry_date', 'close_date', 'commission', 'net_pnl',
+                  'close_reason', 'asset_class', 'put_call', 'strike', 'expiry']
+OPEN_COLUMNS = ['root_symbol', 'asset_id', 'quantity', 'avg_price']
+# Columns that identify a contract (see PnLEngine.build_asset_table)
+CONTRACT_COLUMNS = ('asset_class', 'underlying', 'symbol', 'expiry', 'strike', 'put_call')
+LOT_COLUMNS = ['asset_id', 'root_symbol', 'quantity', 'price', 'entry_date', 'multiplier', 'comm_per_unit']
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+class _ClosedTradeBuffer:
+    """Column buffers for closed matches (CLOSED_COLUMNS order); floats are packed into array('d')."""
+    FLOAT_COLUMNS = ('quantity', 'commission', 'net_pnl')
+
+    def __init__(self):
+        self.columns = {c: array('d') if c in self.FLOAT_COLUMNS else [] for c in CLOSED_COLUMNS}
+        self._appenders = [self.columns[c].append for c in CLOSED_COLUMNS]
+
+    def append(self, *values):
+        for append, value in zip(self._appenders, values):
+            append(value)
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame({c: np.frombuffer(v, dtype=np.float64) if isinstance(v, array) else v
+                             for c, v in self.columns.items()}, columns=CLOSED_COLUMNS)
+
+
 class PnLEngine:
     """
     Core Financial Logic.
     Calculates Realized P&L using FIFO (First-In-First-Out) methodology.
+
+    Two engines are available:
+    - 'python': the original row-by-row deque matcher.
+    - 'vectorized': FIFO matching on NumPy arrays via cumulative-quantity interval overlap.
     """
 
-    @staticmethod
-    def _generate_asset_key(row):
-        asset_class = str(row.get('asset_class', ''))
-        root = row.get('underlying') if row.get('underlying') else row.get('symbol')
-        if 'OPT' in asset_class or 'FOP' in asset_class:
-            return f"{root} {row.get('expiry')} {row.get('strike')} {row.get('put_call')}"
-        return root
+    ENGINES = ('python', 'vectorized')
+    DEFAULT_ENGINE = 'vectorized'
+    QTY_EPSILON = 1e-9
 
     @staticmethod
-    def calculate_fifo_pnl(trades_df: pd.DataFrame, cash_df: pd.DataFrame = None):
+    def calculate_fifo_pnl(trades_df: pd.DataFrame, cash_df: pd.DataFrame = None, engine: str = None):
         if trades_df.empty:
             return pd.DataFrame(), pd.DataFrame()
 
-        trades_df = trades_df.sort_values(by='trade_date')
-        closed_trades = []
-        portfolio = {}
+        closed_df, lots = PnLEngine.match_executions(trades_df, engine=engine)
 
-        # --- PART 1: PROCESS TRADES (FIFO) ---
-        for _, row in trades_df.iterrows():
-            asset_key = PnLEngine._generate_asset_key(row)
-            root_symbol = row.get('underlying') if row.get('underlying') else row.get('symbol')
+        dividends_df = PnLEngine.process_dividends(cash_df)
+        if not dividends_df.empty:
+            closed_df = pd.concat([closed_df, dividends_df], ignore_index=True) if not closed_df.empty else dividends_df
 
-            # Capture Option Metadata for Strategy Analysis
-            # Use .get() to avoid errors if cols missing in raw data
-            meta_asset_class = row.get('asset_class')
-            meta_put_call = row.get('put_call')
-            meta_strike = row.get('strike')
-            meta_expiry = row.get('expiry')
+        return closed_df, PnLEngine.summarize_open_lots(lots)
 
-            qty = float(row['quantity'])
-            price = float(row['price'])
-            comm = float(row['commission'])
-            multiplier = float(row['multiplier']) if row.get('multiplier') and pd.notna(row['multiplier']) else 1.0
+    @staticmethod
+    def match_executions(trades_df: pd.DataFrame, open_lots: pd.DataFrame = None, engine: str = None):
+        """
+        Runs raw executions through the lot matcher.
+
+        Args:
+            trades_df: Raw executions (rows of the trades table).
+            open_lots: Optional inventory carried over from a previous run (see LOT_COLUMNS),
+                in FIFO order per asset. New executions are matched against these first.
+            engine: 'python' or 'vectorized'. Defaults to DEFAULT_ENGINE.
+
+        Returns:
+            (closed_df, lots_df): one row per closed match, and the remaining open lots.
+        """
+        engine = engine or PnLEngine.DEFAULT_ENGINE
+        if engine not in PnLEngine.ENGINES:
+            raise ValueError(f"Unknown P&L engine '{engine}'. Expected one of {PnLEngine.ENGINES}.")
+
+        if trades_df.empty:
+            lots = open_lots if open_lots is not None else pd.DataFrame(columns=LOT_COLUMNS)
+            return pd.DataFrame(columns=CLOSED_COLUMNS), lots[LOT_COLUMNS]
+
+        # trade_id breaks timestamp ties so full and incremental runs replay in the same order
+        sort_cols = ['trade_date', 'trade_id'] if 'trade_id' in trades_df.columns else ['trade_date']
+        trades_df = trades_df.sort_values(by=sort_cols)
+
+        if engine == 'vectorized':
+            return PnLEngine._match_fifo_vectorized(trades_df, open_lots)
+        return PnLEngine._match_fifo_python(trades_df, open_lots)
+
+    @staticmethod
+    def _match_fifo_python(trades_df: pd.DataFrame, open_lots: pd.DataFrame = None):
+        return PnLEngine.match_lot_relief(trades_df, methods=('fifo',), open_lots=open_lots)['fifo']
+
+    @staticmethod
+    def match_lot_relief(trades_df: pd.DataFrame, methods=('fifo',), open_lots: pd.DataFrame = None,
+                         instructions: dict = None) -> dict:
+        """
+        Row-by-row matcher with pluggable lot relief (see core.lot_relief).
+        Several methods are computed in one pass over the executions, each with its own inventory.
+
+        Args:
+            trades_df: Raw executions, sorted in execution order.
+            methods: Relief methods to run ('fifo', 'lifo', 'hifo', 'average', 'specific').
+            open_lots: Optional carried-over inventory (LOT_COLUMNS), seeded into every method.
+            instructions: For 'specific': {closing trade_id: [opening trade_id, ...]}.
+
+        Returns:
+            {method: (closed_df, lots_df)}
+        """
+        books = {m: book_factory(m, instructions) for m in methods}
+        closed = {m: _ClosedTradeBuffer() for m in methods}
+        portfolios = {m: {} for m in methods}
+
+        # Seed inventory with lots carried over from a previous run
+        if open_lots is not None:
+            for lot in open_lots.itertuples(index=False):
+                asset_id = _intern(lot.asset_id)
+                for m in methods:
+                    book = portfolios[m].get(asset_id)
+                    if book is None:
+                        book = portfolios[m][asset_id] = books[m]()
+                    book.add(Lot(lot.quantity, lot.price, lot.entry_date, lot.multiplier, lot.comm_per_unit,
+                                 _intern(lot.root_symbol)))
+
+        # Asset keys and roots are built once per contract; equal keys share one interned string
+        keys = PnLEngine.build_asset_keys(trades_df)
+        asset_keys = [_intern(k) for k in keys['asset_id'].tolist()]
+        roots = [_intern(r) for r in keys['root_symbol'].tolist()]
+
+        n = len(trades_df)
+
+        def column(name, default=None):
+            return trades_df[name].tolist() if name in trades_df.columns else [default] * n
+
+        runs = [(books[m], portfolios[m], closed[m].append) for m in methods]
+
+        # --- PART 1: PROCESS TRADES ---
+        for (asset_key, root_symbol, quantity, price, comm, raw_mult, buy_sell, trade_date, code, trade_id,
+             meta_asset_class, meta_put_call, meta_strike, meta_expiry) in zip(
+                asset_keys, roots, column('quantity'), column('price'), column('commission'),
+                column('multiplier'), column('buy_sell'), column('trade_date'), column('code', ''),
+                column('trade_id'), column('asset_class'), column('put_call'), column('strike'), column('expiry')):
+            qty = float(quantity)
+            price = float(price)
+            comm = float(comm)
+            multiplier = float(raw_mult) if raw_mult and pd.notna(raw_mult) else 1.0
 
             # Check for IBKR Code (Assignment/Exercise)
-            code = str(row.get('code', ''))
+            code = str(code)
 
-            if str(row['buy_sell']).upper() in ['SELL', 'SLD'] and qty > 0:
+            if str(buy_sell).upper() in ['SELL', 'SLD'] and qty > 0:
                 qty = -qty
 
             current_comm_per_unit = comm / abs(qty) if qty != 0 else 0.0
 
-            if asset_key not in portfolio:
-                portfolio[asset_key] = deque()
-            inventory = portfolio[asset_key]
-
-            # Match FIFO
-            if not inventory or (inventory[0]['qty'] > 0 and qty > 0) or (inventory[0]['qty'] < 0 and qty < 0):
-                inventory.append({
-                    'qty': qty, 'price': price, 'date': row['trade_date'],
-                    'mult': multiplier, 'comm_per_unit': current_comm_per_unit
-                })
+            # Close Reason
+            if 'A' in code:
+                close_reason = "Assigned"
+            elif 'Ex' in code:
+                close_reason = "Exercised"
+            elif 'Ep' in code:
+                close_reason = "Expired"
+            elif ('OPT' in str(meta_asset_class)) and price == 0.0:
+                close_reason = "Expired"
             else:
+                close_reason = "Trade"
+
+            for new_book, portfolio, emit in runs:
+                inventory = portfolio.get(asset_key)
+                if inventory is None:
+                    inventory = portfolio[asset_key] = new_book()
+
+                # Same direction (or flat): open a new lot
+                if not inventory or (inventory.peek().qty > 0 and qty > 0) or (inventory.peek().qty < 0 and qty < 0):
+                    inventory.add(Lot(qty, price, trade_date, multiplier, current_comm_per_unit, root_symbol,
+                                      trade_id))
+                    continue
+
+                inventory.prepare(trade_id)
                 remaining_qty = qty
                 while remaining_qty != 0 and inventory:
-                    lot = inventory[0]
-
-                    # Close Reason
-                    if 'A' in code:
-                        close_reason = "Assigned"
-                    elif 'Ex' in code:
-                        close_reason = "Exercised"
-                    elif 'Ep' in code:
-                        close_reason = "Expired"
-                    elif ('OPT' in str(meta_asset_class)) and price == 0.0:
-                        close_reason = "Expired"
-                    else:
-                        close_reason = "Trade"
+                    lot = inventory.peek()
 
-                    if abs(remaining_qty) >= abs(lot['qty']):
-                        matched_q = lot['qty']
-                        inventory.popleft()
+                    if abs(remaining_qty) >= abs(lot.qty):
+                        matched_q = lot.qty
+                        inventory.pop()
                         remaining_qty -= (-matched_q)
-
-                        direction = 1 if matched_q > 0 else -1
-                        gross_pnl = (price - lot['price']) * abs(matched_q) * lot['mult'] * direction
-                        total_comm = (abs(matched_q) * lot['comm_per_unit']) + (abs(matched_q) * current_comm_per_unit)
-                        net_pnl = gross_pnl + total_comm
-
-                        closed_trades.append({
-                            'root_symbol': root_symbol,
-                            'asset_id': asset_key,
-                            'quantity': abs(matched_q),
-                            'entry_date': lot['date'],
-                            'close_date': row['trade_date'],
-                            'commission': total_comm,
-                            'net_pnl': net_pnl,
-                            'close_reason': close_reason,
-                            # NEW METADATA
-                            'asset_class': meta_asset_class,
-                            'put_call': meta_put_call,
-                            'strike': meta_strike,
-                            'expiry': meta_expiry
-                        })
                     else:
                         matched_q = -remaining_qty
-                        lot['qty'] -= matched_q
-
-                        direction = 1 if matched_q > 0 else -1
-                        gross_pnl = (price - lot['price']) * abs(matched_q) * lot['mult'] * direction
-                        total_comm = (abs(matched_q) * lot['comm_per_unit']) + (abs(matched_q) * current_comm_per_unit)
-                        net_pnl = gross_pnl + total_comm
-
-                        closed_trades.append({
-                            'root_symbol': root_symbol,
-                            'asset_id': asset_key,
-                            'quantity': abs(matched_q),
-                            'entry_date': lot['date'],
-                            'close_date': row['trade_date'],
-                            'commission': total_comm,
-                            'net_pnl': net_pnl,
-                            'close_reason': close_reason,
-                            # NEW METADATA
-                            'asset_class': meta_asset_class,
-                            'put_call': meta_put_call,
-                            'strike': meta_strike,
-                            'expiry': meta_expiry
-                        })
+                        lot.qty -= matched_q
                         remaining_qty = 0
+
+                    direction = 1 if matched_q > 0 else -1
+                    gross_pnl = (price - lot.price) * abs(matched_q) * lot.mult * direction
+                    total_comm = (abs(matched_q) * lot.comm_per_unit) + (abs(matched_q) * current_comm_per_unit)
+
+                    emit(root_symbol, asset_key, abs(matched_q), lot.date, trade_date, total_comm,
+                         gross_pnl + total_comm, close_reason,
+                         meta_asset_class, meta_put_call, meta_strike, meta_expiry)
+
                 if remaining_qty != 0:
-                    inventory.append({
-                        'qty': remaining_qty, 'price': price, 'date': row['trade_date'],
-                        'mult': multiplier, 'comm_per_unit': current_comm_per_unit
-                    })
+                    inventory.add(Lot(remaining_qty, price, trade_date, multiplier, current_comm_per_unit,
+                                      root_symbol, trade_id))
+
+        results = {}
+        for m in methods:
+            lots = [
+                (asset_id, l.root, l.qty, l.price, l.date, l.mult, l.comm_per_unit)
+                for asset_id, inventory in portfolios[m].items() for l in inventory.open_lots()
+            ]
+            results[m] = (closed[m].to_frame(), pd.DataFrame(lots, columns=LOT_COLUMNS))
+        return results
 
-        # --- PART 2: PROCESS DIVIDENDS ---
+    @staticmethod
+    def process_dividends(cash_df: pd.DataFrame) -> pd.DataFrame:
+        """Turns dividend-like cash transactions into closed-trade rows."""
+        rows = []
         if cash_df is not None and not cash_df.empty:
             div_types = ['Dividends', 'PaymentInLieuOfDividends', 'WithholdingTax']
             divs = cash_df[cash_df['type'].isin(div_types)]
 
             for _, row in divs.iterrows():
-                closed_trades.append({
+                rows.append({
                     'root_symbol': row['symbol'],
                     'asset_id': 'DIVIDEND',
                     'quantity': 0,
@@ -156,19 +241,247 @@ class PnLEngine:
                     'strike': None,
                     'expiry': None
                 })
+        return pd.DataFrame(rows)
 
-        # --- PART 3: CALCULATE OPEN POSITIONS ---
-        open_pos_list = []
-        for asset_id, lots in portfolio.items():
-            total_qty = sum(l['qty'] for l in lots)
-            if abs(total_qty) > 0.00001:
-                root = asset_id.split(' ')[0]
-                avg_price = sum(l['price'] * abs(l['qty']) for l in lots) / abs(total_qty)
-                open_pos_list.append({
-                    'root_symbol': root,
-                    'asset_id': asset_id,
-                    'quantity': total_qty,
-                    'avg_price': avg_price
-                })
+    # --- VECTORIZED ENGINE ---
+
+    @staticmethod
+    def build_asset_table(trades_df: pd.DataFrame):
+        """
+        Identifies the asset of every execution once per frame.
+
+        Stocks are keyed by their root symbol, options by "ROOT EXPIRY STRIKE RIGHT". The root is the
+        underlying when one is given, otherwise the symbol.
+
+        Returns:
+            (codes, assets): an int32 asset code per row of trades_df (-1 when no symbol is known), and the
+            lookup table indexed by code with asset_id, root_symbol and the contract it stands for
+            (asset_class, expiry, strike, put_call).
+        """
+        n = len(trades_df)
+        key_cols = [c for c in CONTRACT_COLUMNS if c in trades_df.columns]
+        if key_cols:
+            contract = trades_df.groupby(key_cols, sort=False, dropna=False).ngroup().to_numpy()
+        else:
+            contract = np.zeros(n, dtype=np.int64)
+
+        # One row per distinct contract, in order of first appearance
+        _, first = np.unique(contract, return_index=True)
+        # (in their own dtypes, so a None expiry still prints as None)
+        contracts = pd.DataFrame({
+            c: trades_df[c].iloc[first].reset_index(drop=True) if c in trades_df.columns
+            else pd.Series(np.full(len(first), None, dtype=object), dtype=object)
+            for c in CONTRACT_COLUMNS
+        })
+
+        underlying = contracts['underlying']
+        has_underlying = underlying.notna() & (underlying.astype(object) != '')
+        root = underlying.where(has_underlying, contracts['symbol']).astype(object)
+
+        asset_class = contracts['asset_class'].astype(str)
+        is_option = (asset_class.str.contains('OPT', regex=False, na=False)
+                     | asset_class.str.contains('FOP', regex=False, na=False)).to_numpy()
+        asset_id = root.copy()
+        asset_id[is_option] = [
+            f"{r} {e} {k} {p}" for r, e, k, p in zip(root[is_option], contracts['expiry'][is_option],
+                                                     contracts['strike'][is_option], contracts['put_call'][is_option])
+        ]
+
+        # Contracts that print to the same key (e.g. strike 5 vs 5.0) share one asset code
+        asset_of_contract, _ = pd.factorize(asset_id, use_na_sentinel=True)
+        codes = np.where(asset_of_contract[contract] >= 0, asset_of_contract[contract], -1).astype(np.int32)
+
+        assets = contracts.assign(asset_id=asset_id, root_symbol=root)[asset_of_contract >= 0]
+        assets = assets.drop_duplicates('asset_id').reset_index(drop=True)
+        return codes, assets[['asset_id', 'root_symbol', 'asset_class', 'expiry', 'strike', 'put_call']]
+
+    @staticmethod
+    def build_asset_keys(trades_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Returns asset_id and root_symbol for every execution, aligned with trades_df's rows,
+        as categoricals over the asset table from build_asset_table.
+        """
+        codes, assets = PnLEngine.build_asset_table(trades_df)
+        root_of_asset, roots = pd.factorize(assets['root_symbol'], use_na_sentinel=True)
+        root_codes = np.append(root_of_asset, -1)[codes]  # code -1 picks the appended -1
+        return pd.DataFrame({
+            'asset_id': pd.Categorical.from_codes(codes, categories=pd.Index(assets['asset_id'], dtype=object)),
+            'root_symbol': pd.Categorical.from_codes(root_codes, categories=pd.Index(roots, dtype=object)),
+        }, index=trades_df.index)
+
+    @staticmethod
+    def _prepare_executions(trades_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Normalizes sorted raw executions into the columns the matcher needs.
+        Mirrors the per-row rules of the python engine (signed qty, multiplier fallback,
+        commission per unit, close reason).
+        """
+        keys = PnLEngine.build_asset_keys(trades_df)
+
+        n = len(trades_df)
+
+        def column(name):
+            return trades_df[name].to_numpy() if name in trades_df.columns else np.full(n, None, dtype=object)
+
+        qty = trades_df['quantity'].astype(float).to_numpy()
+        is_sell = trades_df['buy_sell'].astype(str).str.upper().isin(['SELL', 'SLD']).to_numpy()
+        qty = np.where(is_sell & (qty > 0), -qty, qty)
+
+        price = trades_df['price'].astype(float).to_numpy()
+        comm = trades_df['commission'].astype(float).to_numpy()
+        comm_per_unit = np.divide(comm, np.abs(qty), out=np.zeros(n), where=qty != 0)
+
+        if 'multiplier' in trades_df.columns:
+            mult = pd.to_numeric(trades_df['multiplier'], errors='coerce')
+            mult = mult.where(mult.notna() & (mult != 0), 1.0).astype(float).to_numpy()
+        else:
+            mult = np.ones(n)
+
+        code = trades_df['code'].astype(str) if 'code' in trades_df.columns else pd.Series('', index=trades_df.index)
+        is_opt = trades_df['asset_class'].astype(str).str.contains('OPT', regex=False, na=False).to_numpy() \
+            if 'asset_class' in trades_df.columns else np.zeros(n, dtype=bool)
+        close_reason = np.select(
+            [code.str.contains('A', regex=False, na=False).to_numpy(),
+             code.str.contains('Ex', regex=False, na=False).to_numpy(),
+             code.str.contains('Ep', regex=False, na=False).to_numpy(),
+             is_opt & (price == 0.0)],
+            ['Assigned', 'Exercised', 'Expired', 'Expired'],
+            default='Trade'
+        ).astype(object)
+
+        return pd.DataFrame({
+            'asset_id': keys['asset_id'].to_numpy(),
+            'root_symbol': keys['root_symbol'].to_numpy(),
+            'quantity': qty,
+            'price': price,
+            'multiplier': mult,
+            'comm_per_unit': comm_per_unit,
+            'trade_date': trades_df['trade_date'].to_numpy(),
+            'close_reason': close_reason,
+            'asset_class': column('asset_class'),
+            'put_call': column('put_call'),
+            'strike': column('strike'),
+            'expiry': column('expiry'),
+        })
+
+    @staticmethod
+    def _match_intervals(execs: pd.DataFrame):
+        """
+        FIFO lot matching via cumulative-quantity intervals.
+
+        Within an asset, the k-th unit bought is always matched against the k-th unit sold,
+        whichever came first being the open lot. Each buy execution therefore covers the
+        interval [cum_before, cum_after) on the buy axis (likewise for sells), and every
+        overlap between a buy and a sell interval is one closed match.
+
+        Returns (matches, lots): matches as positional arrays into execs, and the open lots frame.
+        """
+        eps = PnLEngine.QTY_EPSILON
+        codes, _ = pd.factorize(execs['asset_id'], use_na_sentinel=False)
+        qty = execs['quantity'].to_numpy()
+        abs_qty = np.abs(qty)
+        n_assets = codes.max() + 1 if len(codes) else 0
+
+        def side(mask):
+            idx = np.flatnonzero(mask)
+            idx = idx[np.argsort(codes[idx], kind='stable')]
+            side_codes = codes[idx]
+            cum = np.cumsum(abs_qty[idx])
+            group_start = np.r_[True, side_codes[1:] != side_codes[:-1]] if len(idx) else np.zeros(0, dtype=bool)
+            base = np.maximum.accumulate(np.where(group_start, cum - abs_qty[idx], 0.0)) if len(idx) else cum
+            end = cum - base
+            return idx, side_codes, end - abs_qty[idx], end
+
+        b_idx, b_codes, b_start, b_end = side(qty > 0)
+        s_idx, s_codes, s_start, s_end = side(qty < 0)
+
+        total_bought = np.bincount(b_codes, weights=abs_qty[b_idx], minlength=n_assets)
+        total_sold = np.bincount(s_codes, weights=abs_qty[s_idx], minlength=n_assets)
+
+        # Lay assets end-to-end (with a gap) on one global axis so a single searchsorted finds all overlaps
+        offsets = np.r_[0.0, np.cumsum(np.maximum(total_bought, total_sold) + 1.0)][:n_assets]
+        gb_start, gb_end = b_start + offsets[b_codes], b_end + offsets[b_codes]
+        gs_start, gs_end = s_start + offsets[s_codes], s_end + offsets[s_codes]
+
+        lo = np.searchsorted(gb_end, gs_start, side='right')
+        hi = np.searchsorted(gb_start, gs_end, side='left')
+        counts = np.maximum(hi - lo, 0)
+        total = int(counts.sum())
+
+        s_pair = np.repeat(np.arange(len(s_idx)), counts)
+        b_pair = np.repeat(lo, counts) + (np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts))
+
+        overlap = np.minimum(b_end[b_pair], s_end[s_pair]) - np.maximum(b_start[b_pair], s_start[s_pair])
+        keep = (overlap > eps) & (b_codes[b_pair] == s_codes[s_pair])
+        b_rows, s_rows, overlap = b_idx[b_pair[keep]], s_idx[s_pair[keep]], overlap[keep]
+
+        lot_rows = np.minimum(b_rows, s_rows)
+        closer_rows = np.maximum(b_rows, s_rows)
+        order = np.lexsort((lot_rows, closer_rows))
+        matches = (lot_rows[order], closer_rows[order], overlap[order])
+
+        # Whatever lies beyond the opposite side's total is still open
+        b_open = b_end - np.maximum(b_start, total_sold[b_codes])
+        s_open = s_end - np.maximum(s_start, total_bought[s_codes])
+        open_rows = np.r_[b_idx[b_open > eps], s_idx[s_open > eps]]
+        open_qty = np.r_[b_open[b_open > eps], -s_open[s_open > eps]]
+        order = np.lexsort((open_rows, codes[open_rows]))
+        open_rows, open_qty = open_rows[order], open_qty[order]
+
+        lots = pd.DataFrame({
+            'asset_id': execs['asset_id'].to_numpy()[open_rows],
+            'root_symbol': execs['root_symbol'].to_numpy()[open_rows],
+            'quantity': open_qty,
+            'price': execs['price'].to_numpy()[open_rows],
+            'entry_date': execs['trade_date'].to_numpy()[open_rows],
+            'multiplier': execs['multiplier'].to_numpy()[open_rows],
+            'comm_per_unit': execs['comm_per_unit'].to_numpy()[open_rows],
+        })
+        return matches, lots
+
+    @staticmethod
+    def _match_fifo_vectorized(trades_df: pd.DataFrame, open_lots: pd.DataFrame = None):
+        execs = PnLEngine._prepare_executions(trades_df)
+
+        # Carried-over lots behave exactly like earlier executions of the same asset
+        if open_lots is not None and not open_lots.empty:
+            seeds = open_lots[LOT_COLUMNS].rename(columns={'entry_date': 'trade_date'}).assign(
+                close_reason='Trade', asset_class=None, put_call=None, strike=None, expiry=None)
+            execs = pd.concat([seeds[execs.columns], execs], ignore_index=True)
+
+        (lot, closer, matched), lots = PnLEngine._match_intervals(execs)
+
+        price = execs['price'].to_numpy()
+        cpu = execs['comm_per_unit'].to_numpy()
+        direction = np.where(execs['quantity'].to_numpy()[lot] > 0, 1, -1)
+        gross_pnl = (price[closer] - price[lot]) * matched * execs['multiplier'].to_numpy()[lot] * direction
+        total_comm = (matched * cpu[lot]) + (matched * cpu[closer])
+
+        closed_df = pd.DataFrame({
+            'root_symbol': execs['root_symbol'].to_numpy()[closer],
+            'asset_id': execs['asset_id'].to_numpy()[closer],
+            'quantity': matched,
+            'entry_date': execs['trade_date'].to_numpy()[lot],
+            'close_date': execs['trade_date'].to_numpy()[closer],
+            'commission': total_comm,
+            'net_pnl': gross_pnl + total_comm,
+            'close_reason': execs['close_reason'].to_numpy()[closer],
+            'asset_class': execs['asset_class'].to_numpy()[closer],
+            'put_call': execs['put_call'].to_numpy()[closer],
+            'strike': execs['strike'].to_numpy()[closer],
+            'expiry': execs['expiry'].to_numpy()[closer],
+        })
+        return closed_df, lots
+
+    @staticmethod
+    def summarize_open_lots(lots: pd.DataFrame) -> pd.DataFrame:
+        """Collapses open lots into one row per asset (net quantity and average entry price)."""
+        if lots.empty:
+            return pd.DataFrame(columns=OPEN_COLUMNS)
 
-        return pd.DataFrame(closed_trades), pd.DataFrame(open_pos_list)
\ No newline at end of file
+        weighted = lots.assign(cost=lots['price'] * lots['quantity'].abs())
+        positions = weighted.groupby('asset_id', sort=False).agg(
+            root_symbol=('root_symbol', 'first'), quantity=('quantity', 'sum'), cost=('cost', 'sum'))
+        positions = positions[positions['quantity'].abs() > 0.00001].reset_index()
+        positions['avg_price'] = positions['cost'] / positions['quantity'].abs()
+        return positions[OPEN_COLUMNS]
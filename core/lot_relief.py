@@ -0,0 +1,201 @@
+import heapq
+from abc import ABC, abstractmethod
+from collections import deque
+
+
+class Lot:
+    """One open lot in a per-asset inventory (row-by-row matcher)."""
+    __slots__ = ('qty', 'price', 'date', 'mult', 'comm_per_unit', 'root', 'lot_id')
+
+    def __init__(self, qty, price, date, mult, comm_per_unit, root, lot_id=None):
+        self.qty = qty
+        self.price = price
+        self.date = date
+        self.mult = mult
+        self.comm_per_unit = comm_per_unit
+        self.root = root
+        self.lot_id = lot_id
+
+
+class LotBook(ABC):
+    """
+    Open inventory of one asset. All lots share the same sign; a closing execution relieves
+    `peek()` until it is flat, calling `pop()` for every lot it consumes completely.
+    """
+    __slots__ = ()
+
+    @abstractmethod
+    def add(self, lot: Lot):
+        ...
+
+    @abstractmethod
+    def peek(self) -> Lot:
+        ...
+
+    @abstractmethod
+    def pop(self):
+        ...
+
+    def prepare(self, closing_id):
+        """Called before a closing execution relieves this book (specific-lot selection hook). No-op by default."""
+
+    @abstractmethod
+    def open_lots(self):
+        """Remaining lots in entry order."""
+
+
+class FifoBook(LotBook):
+    """First-In-First-Out: a deque, relieved from the left."""
+    __slots__ = ('lots',)
+
+    def __init__(self):
+        self.lots = deque()
+
+    def __bool__(self):
+        return bool(self.lots)
+
+    def add(self, lot):
+        self.lots.append(lot)
+
+    def peek(self):
+        return self.lots[0]
+
+    def pop(self):
+        self.lots.popleft()
+
+    def open_lots(self):
+        return list(self.lots)
+
+
+class LifoBook(LotBook):
+    """Last-In-First-Out: a stack, relieved from the top."""
+    __slots__ = ('lots',)
+
+    def __init__(self):
+        self.lots = []
+
+    def __bool__(self):
+        return bool(self.lots)
+
+    def add(self, lot):
+        self.lots.append(lot)
+
+    def peek(self):
+        return self.lots[-1]
+
+    def pop(self):
+        self.lots.pop()
+
+    def open_lots(self):
+        return list(self.lots)
+
+
+class HifoBook(LotBook):
+    """
+    Highest-In-First-Out: a heap on entry price, so each close realizes the smallest gain.
+    Longs relieve the highest purchase price first, shorts the lowest sale price; ties go FIFO.
+    """
+    __slots__ = ('heap', 'seq')
+
+    def __init__(self):
+        self.heap = []
+        self.seq = 0
+
+    def __bool__(self):
+        return bool(self.heap)
+
+    def add(self, lot):
+        self.seq += 1
+        heapq.heappush(self.heap, (-lot.price if lot.qty > 0 else lot.price, self.seq, lot))
+
+    def peek(self):
+        return self.heap[0][2]
+
+    def pop(self):
+        heapq.heappop(self.heap)
+
+    def open_lots(self):
+        return [lot for _, _, lot in sorted(self.heap, key=lambda item: item[1])]
+
+
+class AverageCostBook(LotBook):
+    """
+    Average cost: one running aggregate per asset. Adds re-weight the price and commission per unit;
+    closes relieve at the average. The entry date is the oldest still-open purchase.
+    """
+    __slots__ = ('position',)
+
+    def __init__(self):
+        self.position = None
+
+    def __bool__(self):
+        return self.position is not None
+
+    def add(self, lot):
+        pos = self.position
+        if pos is None:
+            self.position = Lot(lot.qty, lot.price, lot.date, lot.mult, lot.comm_per_unit, lot.root)
+            return
+        held, added = abs(pos.qty), abs(lot.qty)
+        total = held + added
+        if total > 0:
+            pos.price = (pos.price * held + lot.price * added) / total
+            pos.comm_per_unit = (pos.comm_per_unit * held + lot.comm_per_unit * added) / total
+        pos.qty += lot.qty
+
+    def peek(self):
+        return self.position
+
+    def pop(self):
+        self.position = None
+
+    def open_lots(self):
+        return [self.position] if self.position is not None else []
+
+
+class SpecificLotBook(FifoBook):
+    """
+    Specific identification: closes relieve the lots named in `instructions` (closing id -> opening ids,
+    in order) first, then fall back to FIFO.
+    """
+    __slots__ = ('instructions', 'preferred')
+
+    def __init__(self, instructions=None):
+        super().__init__()
+        self.instructions = instructions or {}
+        self.preferred = []
+
+    def prepare(self, closing_id):
+        wanted = self.instructions.get(closing_id)
+        if not wanted:
+            self.preferred = []
+            return
+        by_id = {lot.lot_id: lot for lot in self.lots if lot.lot_id is not None}
+        self.preferred = [by_id[i] for i in wanted if i in by_id]
+
+    def peek(self):
+        return self.preferred[0] if self.preferred else self.lots[0]
+
+    def pop(self):
+        if self.preferred:
+            self.lots.remove(self.preferred.pop(0))
+        else:
+            self.lots.popleft()
+
+
+RELIEF_METHODS = {
+    'fifo': FifoBook,
+    'lifo': LifoBook,
+    'hifo': HifoBook,
+    'average': AverageCostBook,
+    'specific': SpecificLotBook,
+}
+
+
+def book_factory(method: str, instructions=None):
+    """Returns a zero-argument constructor for the per-asset books of `method`."""
+    if method not in RELIEF_METHODS:
+        raise ValueError(f"Unknown lot relief method '{method}'. Expected one of {tuple(RELIEF_METHODS)}.")
+    if method == 'specific':
+        return lambda: SpecificLotBook(instructions)
+    return RELIEF_METHODS[method]
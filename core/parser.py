@@ -1,6 +1,17 @@
+import io
+import numpy as np
 import pandas as pd
 import xml.etree.ElementTree as ET
 import logging
+from array import array
+from pandas.api.types import union_categoricals
+
+try:
+    import pyarrow as pa
+except ImportError:  # Optional: only needed for Arrow output
+    pa = None
+
+ARROW_AVAILABLE = pa is not None
 
 logger = logging.getLogger(__name__)
 
@@ -65,4 +76,243 @@ def parse_ibkr_xml(xml_content: str) -> dict:
         }
     except Exception as e:
         logger.error(f"XML Parsing failed: {e}")
-        return {'trades': pd.DataFrame(), 'transactions': pd.DataFrame()}
\ No newline at end of file
+        return {'trades': pd.DataFrame(), 'transactions': pd.DataFrame()}
+
+
+# --- STREAMING PARSER ---
+
+# Rough cost of one buffered row, used to size chunks from a memory budget
+_BUFFER_BYTES_PER_ROW = 400
+DEFAULT_MAX_BUFFER_MB = 64
+_NAN = float('nan')
+
+
+def _float_or(default):
+    return lambda v: float(v) if v else default
+
+
+# (column, Flex attribute, converter) - same rules as parse_ibkr_xml
+TRADE_FIELDS = [
+    ('trade_id', 'tradeID', None),
+    ('symbol', 'symbol', None),
+    ('description', 'description', None),
+    ('asset_class', 'assetCategory', None),
+    ('trade_date', 'dateTime', None),
+    ('quantity', 'quantity', _float_or(0.0)),
+    ('price', 'tradePrice', _float_or(0.0)),
+    ('commission', 'ibCommission', _float_or(0.0)),
+    ('realized_pnl', None, lambda v: 0.0),
+    ('currency', None, lambda v: 'USD'),
+    ('flex_query_run_id', None, lambda v: ''),
+    ('buy_sell', 'buySell', None),
+    ('open_close', 'openCloseIndicator', None),
+    ('close_price', 'closePrice', _float_or(0.0)),
+    ('underlying', 'underlyingSymbol', None),
+    ('strike', 'strike', _float_or(None)),
+    ('expiry', 'expiry', None),
+    ('put_call', 'putCall', None),
+    ('multiplier', 'multiplier', _float_or(1.0)),
+    ('code', 'notes', lambda v: v if v is not None else ''),
+]
+
+CASH_FIELDS = [
+    ('transaction_id', 'transactionID', None),
+    ('type', 'type', None),
+    ('asset_class', 'assetCategory', None),
+    ('symbol', 'symbol', None),
+    ('amount', 'amount', _float_or(0.0)),
+    ('date', 'dateTime', None),
+    ('description', 'description', None),
+    ('currency', None, lambda v: 'USD'),
+]
+
+FLOAT_COLUMNS = {'quantity', 'price', 'commission', 'realized_pnl', 'close_price', 'strike', 'multiplier', 'amount'}
+CATEGORY_COLUMNS = {'symbol', 'asset_class', 'buy_sell', 'put_call', 'type', 'currency'}
+
+
+class ColumnarTableBuilder:
+    """
+    Appends parsed rows straight into per-column buffers, without building a dict per row.
+
+    - Float columns go into array('d') (missing values become NaN).
+    - Low-cardinality text columns are dictionary-encoded: each value is interned once
+      and the row stores an int32 code (-1 for missing).
+    - Everything else stays a plain list of strings.
+    """
+
+    def __init__(self, fields, float_columns=FLOAT_COLUMNS, category_columns=CATEGORY_COLUMNS):
+        self.fields = fields
+        self.columns = [col for col, _, _ in fields]
+        self.float_columns = {c for c in self.columns if c in float_columns}
+        self.category_columns = {c for c in self.columns if c in category_columns}
+        self._dictionaries = {c: {} for c in self.category_columns}
+        self.clear()
+
+    def clear(self):
+        self._buffers = {}
+        for col in self.columns:
+            if col in self.float_columns:
+                self._buffers[col] = array('d')
+            elif col in self.category_columns:
+                self._buffers[col] = array('i')
+            else:
+                self._buffers[col] = []
+        # Per-field (attribute, converter, kind, bound append, dictionary), resolved once per chunk
+        self._plan = [
+            (attr, convert,
+             'float' if col in self.float_columns else 'category' if col in self.category_columns else 'str',
+             self._buffers[col].append, self._dictionaries.get(col))
+            for col, attr, convert in self.fields
+        ]
+        self._rows = 0
+
+    def __len__(self):
+        return self._rows
+
+    def append(self, attrib):
+        """Appends one element's attributes, applying each field's converter."""
+        get = attrib.get
+        for attr, convert, kind, push, codes in self._plan:
+            value = get(attr) if attr else None
+            if convert is not None:
+                value = convert(value)
+            if kind == 'str':
+                push(value)
+            elif kind == 'float':
+                push(_NAN if value is None else value)
+            elif value is None:
+                push(-1)
+            else:
+                code = codes.get(value)
+                if code is None:
+                    code = codes[value] = len(codes)
+                push(code)
+        self._rows += 1
+
+    def _categories(self, col):
+        # Dicts keep insertion order, which is the code order
+        return list(self._dictionaries[col])
+
+    def to_frame(self) -> pd.DataFrame:
+        data = {}
+        for col in self.columns:
+            buf = self._buffers[col]
+            if col in self.float_columns:
+                data[col] = np.frombuffer(buf, dtype=np.float64) if len(buf) else np.empty(0)
+            elif col in self.category_columns:
+                codes = np.frombuffer(buf, dtype=np.int32) if len(buf) else np.empty(0, dtype=np.int32)
+                data[col] = pd.Categorical.from_codes(codes, categories=self._categories(col))
+            else:
+                data[col] = buf
+        return pd.DataFrame(data, columns=self.columns)
+
+    def to_arrow(self):
+        """Builds a pyarrow.Table (dictionary arrays for categorical columns)."""
+        if pa is None:
+            raise ImportError("pyarrow is required for Arrow output.")
+        arrays = []
+        for col in self.columns:
+            buf = self._buffers[col]
+            if col in self.float_columns:
+                arrays.append(pa.array(np.frombuffer(buf, dtype=np.float64) if len(buf) else np.empty(0),
+                                       from_pandas=True))
+            elif col in self.category_columns:
+                codes = np.frombuffer(buf, dtype=np.int32) if len(buf) else np.empty(0, dtype=np.int32)
+                arrays.append(pa.DictionaryArray.from_arrays(pa.array(codes, mask=codes < 0),
+                                                             pa.array(self._categories(col), type=pa.string())))
+            else:
+                arrays.append(pa.array(buf, type=pa.string()))
+        return pa.Table.from_arrays(arrays, names=self.columns)
+
+
+def _open_source(source):
+    """Accepts XML content (str/bytes), a file path or a binary file-like object."""
+    if isinstance(source, bytes):
+        return io.BytesIO(source)
+    if isinstance(source, str) and source.lstrip().startswith('<'):
+        return io.StringIO(source)
+    return source
+
+
+def iter_ibkr_xml_chunks(source, chunk_rows: int = None, max_buffer_mb: float = DEFAULT_MAX_BUFFER_MB,
+                         as_arrow: bool = False):
+    """
+    Streams a Flex report with iterparse, yielding ('trades' | 'transactions', chunk) pairs.
+
+    Elements are detached from the tree as soon as they are read, so memory is bounded by the
+    column buffers: at most `chunk_rows` rows per table (derived from `max_buffer_mb` when not given).
+    Chunks are DataFrames, or pyarrow Tables when `as_arrow` is set.
+    """
+    if chunk_rows is None:
+        chunk_rows = max(1000, int(max_buffer_mb * 1024 * 1024 / _BUFFER_BYTES_PER_ROW))
+
+    tables = {'Trade': 'trades', 'CashTransaction': 'transactions'}
+    builders = {'Trade': ColumnarTableBuilder(TRADE_FIELDS), 'CashTransaction': ColumnarTableBuilder(CASH_FIELDS)}
+
+    def flush(tag):
+        builder = builders[tag]
+        chunk = builder.to_arrow() if as_arrow else builder.to_frame()
+        builder.clear()
+        return tables[tag], chunk
+
+    parents = []
+    for event, elem in ET.iterparse(_open_source(source), events=('start', 'end')):
+        if event == 'start':
+            parents.append(elem)
+            continue
+
+        parents.pop()
+        builder = builders.get(elem.tag)
+        # Skip cash rows without IDs (same as parse_ibkr_xml)
+        if builder is not None and (elem.tag == 'Trade' or elem.get('transactionID')):
+            builder.append(elem.attrib)
+            if len(builder) >= chunk_rows:
+                yield flush(elem.tag)
+
+        # The tree is never needed again: drop finished elements so it cannot grow
+        if parents:
+            parents[-1].remove(elem)
+
+    for tag, builder in builders.items():
+        if len(builder):
+            yield flush(tag)
+
+
+def _concat_frames(frames):
+    """Concatenates chunks column by column, merging the per-chunk categories."""
+    data = {}
+    for col in frames[0].columns:
+        if isinstance(frames[0][col].dtype, pd.CategoricalDtype):
+            data[col] = union_categoricals([f[col] for f in frames])
+        else:
+            data[col] = pd.concat([f[col] for f in frames], ignore_index=True).infer_objects()
+    return pd.DataFrame(data)
+
+
+def parse_ibkr_xml_stream(source, chunk_rows: int = None, max_buffer_mb: float = DEFAULT_MAX_BUFFER_MB,
+                          as_arrow: bool = False) -> dict:
+    """
+    Bounded-memory equivalent of parse_ibkr_xml built on iter_ibkr_xml_chunks.
+    Returns the same {'trades', 'transactions'} tables, with typed float columns and
+    categorical symbol/asset_class/buy_sell/put_call (or pyarrow Tables when `as_arrow` is set).
+    """
+    if as_arrow and pa is None:
+        raise ImportError("pyarrow is required for Arrow output.")
+
+    def empty(table):
+        # Empty Arrow tables keep the builder's schema, so callers always get one type back
+        if not as_arrow:
+            return pd.DataFrame()
+        return ColumnarTableBuilder(TRADE_FIELDS if table == 'trades' else CASH_FIELDS).to_arrow()
+
+    chunks = {'trades': [], 'transactions': []}
+    try:
+        for table, chunk in iter_ibkr_xml_chunks(source, chunk_rows=chunk_rows, max_buffer_mb=max_buffer_mb,
+                                                 as_arrow=as_arrow):
+            chunks[table].append(chunk)
+        if as_arrow:
+            return {table: pa.concat_tables(parts) if parts else empty(table) for table, parts in chunks.items()}
+        return {table: _concat_frames(frames) if frames else empty(table) for table, frames in chunks.items()}
+    except Exception as e:
+        logger.error(f"XML Parsing failed: {e}")
+        return {table: empty(table) for table in chunks}
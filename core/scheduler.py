@@ -0,0 +1,190 @@
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from config import settings
+from core.database import DatabaseManager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+
+class FileLock:
+    """
+    Exclusive, non-blocking inter-process lock on a file (flock / msvcrt.locking).
+    The OS drops it when the holder exits, so a crashed scheduler never leaves a stale lock behind.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._fd = None
+
+    def acquire(self, record_pid: bool = True) -> bool:
+        """Takes the lock if it is free. Returns False (without waiting) if another process holds it."""
+        if self._fd is not None:
+            return True
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            os.close(fd)
+            return False
+        if record_pid:
+            # Holder's PID, for humans looking at the file
+            os.ftruncate(fd, 0)
+            os.write(fd, f"{os.getpid()}\n".encode())
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def is_held_elsewhere(self) -> bool:
+        """True if another process currently holds the lock (probes by briefly taking it)."""
+        if self._fd is not None or not self.path.exists():
+            return False
+        if self.acquire(record_pid=False):
+            self.release()
+            return False
+        return True
+
+    def __enter__(self):
+        if not self.acquire():
+            raise RuntimeError(f"Lock {self.path} is held by another process.")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+class SyncScheduler:
+    """
+    Runs sync (or recompute only) on a fixed cadence, outside the dashboard's request path.
+
+    Each cycle's outcome is stored in app_metadata ('scheduler_status') for the dashboard. Between
+    cycles every database connection is closed, so a local DuckDB file is free for the dashboard.
+
+    Args:
+        service: DataService to run the cycles with.
+        interval_minutes: Cadence; cycles start on a fixed grid from the first start, skipping missed slots.
+        fetch: If False, only recompute the P&L tables from stored executions.
+    """
+
+    def __init__(self, service, interval_minutes: float = None, fetch: bool = True):
+        self.service = service
+        self.interval = timedelta(minutes=interval_minutes or settings.SYNC_INTERVAL_MINUTES)
+        self.fetch = fetch
+        self.stop_event = threading.Event()
+
+    def _status(self, state, started_at, **fields):
+        return {'state': state, 'mode': 'sync' if self.fetch else 'recompute', 'started_at': started_at.isoformat(),
+                'interval_minutes': self.interval.total_seconds() / 60, 'pid': os.getpid(),
+                'host': socket.gethostname(), **fields}
+
+    def _store_status(self, status):
+        try:
+            self.service.db.set_scheduler_status(status)
+        except Exception as e:
+            logger.error(f"Could not store scheduler status: {e}")
+        finally:
+            DatabaseManager.close_all()
+
+    def run_once(self, next_run: datetime = None) -> dict:
+        """Runs one cycle and returns (and stores) its status."""
+        started_at = datetime.now(timezone.utc)
+        self._store_status(self._status('running', started_at))
+
+        start = time.perf_counter()
+        try:
+            if self.fetch:
+                success, message = self.service.sync_ibkr_data()
+            else:
+                processed = self.service.recompute_pnl()
+                success, message = True, f"Recomputed P&L from {processed} new executions."
+        except Exception as e:
+            success, message = False, str(e)
+
+        status = self._status('ok' if success else 'error', started_at,
+                              finished_at=datetime.now(timezone.utc).isoformat(),
+                              seconds=round(time.perf_counter() - start, 3), message=message,
+                              next_run=next_run.isoformat() if next_run else None)
+        (logger.info if success else logger.error)(f"Scheduled {status['mode']} finished: {message}")
+        self._store_status(status)
+        return status
+
+    def run_forever(self):
+        """Runs cycles until stop() is called (e.g. from a signal handler)."""
+        next_run = datetime.now(timezone.utc)
+        while not self.stop_event.is_set():
+            now = datetime.now(timezone.utc)
+            # Skip slots missed by a slow cycle instead of running them back to back
+            while next_run <= now:
+                next_run += self.interval
+            self.run_once(next_run=next_run)
+            delay = (next_run - datetime.now(timezone.utc)).total_seconds()
+            logger.info(f"Next run at {next_run:%Y-%m-%d %H:%M:%S} UTC.")
+            self.stop_event.wait(max(0.0, delay))
+
+    def stop(self):
+        self.stop_event.set()
+
+
+def describe_status(status: dict, lock_path: str = None) -> tuple:
+    """
+    Dashboard summary of a stored scheduler status.
+
+    Returns:
+        (level, text, active): level is 'info' / 'warning' / 'error'; active is True while the scheduler
+        looks alive (it is mid-cycle, or its last cycle succeeded and the next is not overdue), i.e. it
+        owns refreshing the data. After a failed cycle it is False, so a manual sync is offered.
+    """
+    if not status:
+        return 'info', "Scheduler: not running", False
+
+    now = datetime.now(timezone.utc)
+    running = status.get('state') == 'running'
+    if running and lock_path and Path(lock_path).exists() and not FileLock(lock_path).is_held_elsewhere():
+        running = False  # The process died mid-cycle (the lock went with it)
+
+    if running:
+        since = _local(status['started_at'])
+        return 'info', f"Scheduler: {status.get('mode', 'sync')} in progress (since {since})", True
+
+    next_run = status.get('next_run')
+    grace = timedelta(minutes=max(5.0, 0.5 * float(status.get('interval_minutes') or 0)))
+    alive = next_run is not None and datetime.fromisoformat(next_run) + grace > now
+    finished = _local(status.get('finished_at') or status['started_at'])
+    if status.get('state') == 'error':
+        return 'error', f"Scheduler: last run failed at {finished}: {status.get('message')}", False
+    text = f"Scheduler: last run {finished} ({status.get('seconds', 0):.0f}s)"
+    if alive:
+        return 'info', f"{text}, next {_local(next_run)}", True
+    return 'warning', f"{text}, no run since (scheduler stopped?)", False
+
+
+def _local(iso_value) -> str:
+    """ISO timestamp as local-time 'YYYY-MM-DD HH:MM'."""
+    return datetime.fromisoformat(iso_value).astimezone().strftime('%Y-%m-%d %H:%M')
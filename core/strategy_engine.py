@@ -1,10 +1,24 @@
+import numpy as np
 import pandas as pd
 import logging
-import uuid
 
 logger = logging.getLogger(__name__)
 
 
+def stable_group_ids(root_symbols, first_entries) -> np.ndarray:
+    """
+    Compact int64 ids for groups of trades, derived from each group's root symbol and first entry time.
+    The same history always yields the same ids, so results can be cached and diffed across runs.
+    Groups sharing both values are told apart by their order of appearance.
+    """
+    keys = pd.DataFrame({
+        'root_symbol': pd.Series(root_symbols).astype(str).to_numpy(),
+        'first_entry': pd.to_datetime(pd.Series(first_entries)).to_numpy(dtype='datetime64[ns]'),
+    })
+    keys['occurrence'] = keys.groupby(['root_symbol', 'first_entry'], dropna=False).cumcount()
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy().view(np.int64)
+
+
 class StrategyEngine:
     """
     Groups individual trade executions into "Strategies" (e.g., Spreads, Iron Condors).
@@ -32,101 +46,67 @@ class StrategyEngine:
         # Sort strictly by Symbol then Entry Time
         df = df.sort_values(by=['root_symbol', group_col])
 
-        # Initialize
-        df['strategy_id'] = None
-        df['strategy_type'] = 'Single'
-
-        # Grouping Logic
-        current_strategy_id = str(uuid.uuid4())
-        prev_row = None
-        strategy_buffer = []
-
-        for index, row in df.iterrows():
-            is_new_group = False
-
-            if prev_row is None:
-                is_new_group = True
-            else:
-                if row['root_symbol'] != prev_row['root_symbol']:
-                    is_new_group = True
-                else:
-                    # Time Delta Check on ENTRY time
-                    time_diff = (row[group_col] - prev_row[group_col]).total_seconds()
-                    if abs(time_diff) > time_threshold_seconds:
-                        is_new_group = True
-
-            if is_new_group:
-                if strategy_buffer:
-                    strat_type = StrategyEngine._classify_strategy(df.loc[strategy_buffer])
-                    df.loc[strategy_buffer, 'strategy_type'] = strat_type
-
-                current_strategy_id = str(uuid.uuid4())
-                strategy_buffer = [index]
-            else:
-                strategy_buffer.append(index)
-
-            df.at[index, 'strategy_id'] = current_strategy_id
-            prev_row = row
-
-        if strategy_buffer:
-            strat_type = StrategyEngine._classify_strategy(df.loc[strategy_buffer])
-            df.loc[strategy_buffer, 'strategy_type'] = strat_type
+        # Grouping Logic: a new strategy starts on a symbol change or an ENTRY time gap above the threshold
+        symbols = df['root_symbol']
+        gaps = df[group_col].diff().abs()
+        is_new_group = (symbols != symbols.shift()) | (gaps > pd.Timedelta(seconds=time_threshold_seconds))
+        cluster = is_new_group.cumsum().to_numpy() - 1
+
+        # Stable ids from each cluster's symbol and first entry time
+        starts = is_new_group.to_numpy()
+        ids = stable_group_ids(symbols.to_numpy()[starts], df[group_col].to_numpy()[starts])
+        df['strategy_id'] = ids[cluster]
+
+        # Classify every cluster in one grouped pass
+        types = StrategyEngine._classify_clusters(df, 'strategy_id')
+        df['strategy_type'] = df['strategy_id'].map(types)
 
         return df
 
     @staticmethod
-    def _classify_strategy(cluster_df: pd.DataFrame) -> str:
+    def _classify_clusters(df: pd.DataFrame, key: str) -> pd.Series:
         """
-        Determines if a cluster of trades is a Spread, Iron Condor, etc.
+        Determines if each cluster of trades is a Spread, Iron Condor, etc.
+        Returns one label per value of `key`, computed from per-cluster aggregates.
         """
-        count = len(cluster_df)
-        if count == 1:
-            return "Single"
-
-        # Safely extract attributes
-        try:
-            # Handle potential missing columns if running on raw data
-            asset_classes = [str(x) for x in
-                             cluster_df['asset_class'].unique().tolist()] if 'asset_class' in cluster_df.columns else []
-
-            # Helper to get unique non-null values
-            def get_unique(col):
-                return cluster_df[col].dropna().unique() if col in cluster_df.columns else []
-
-            rights = get_unique('put_call')
-            expiries = get_unique('expiry')
-            strikes = get_unique('strike')
-
-        except Exception:
-            return "Multi-Leg (Unknown)"
-
-        # 1. Stock Combinations
-        is_stock = any('STK' in x for x in asset_classes)
-        is_opt = any('OPT' in x or 'FOP' in x for x in asset_classes)
-
-        if is_stock and is_opt:
-            return "Covered/Protected Stock"
-
+        # Handle potential missing columns if running on raw data
+        def column(name):
+            return df[name] if name in df.columns else pd.Series(None, index=df.index, dtype=object)
+
+        asset_classes = column('asset_class').astype(str)
+        legs = pd.DataFrame({
+            key: df[key],
+            'expiry': column('expiry'),
+            'put_call': column('put_call'),
+            'is_stock': asset_classes.str.contains('STK', regex=False),
+            'is_opt': asset_classes.str.contains('OPT', regex=False) | asset_classes.str.contains('FOP', regex=False),
+        })
+        clusters = legs.groupby(key, sort=False).agg(
+            count=('is_stock', 'size'),
+            expiries=('expiry', 'nunique'),
+            rights=('put_call', 'nunique'),
+            is_stock=('is_stock', 'any'),
+            is_opt=('is_opt', 'any'),
+        )
+
+        count = clusters['count']
+        same_expiry = clusters['expiries'] == 1
+        rules = [
+            (count == 1, "Single"),
+            # 1. Stock Combinations
+            (clusters['is_stock'] & clusters['is_opt'], "Covered/Protected Stock"),
             # 2. Pure Options Strategies
-        if count == 2:
-            if len(expiries) == 1:
-                # Same Expiry
-                if len(rights) == 1:
-                    return "Vertical Spread"  # Same expiry, same type (Call/Call), diff strikes
-                else:
-                    return "Straddle/Strangle"  # Same expiry, diff type (Call/Put)
-            else:
-                return "Calendar/Diagonal Spread"
-
-        if count == 3:
-            return "Butterfly/Ladder"
-
-        if count == 4:
-            # Iron Condor usually has 4 legs, same expiry
-            if len(expiries) == 1:
-                return "Iron Condor"
-
-        return f"Custom {count}-Leg"
+            ((count == 2) & same_expiry & (clusters['rights'] == 1), "Vertical Spread"),  # Same expiry, same type
+            ((count == 2) & same_expiry, "Straddle/Strangle"),  # Same expiry, diff type (Call/Put)
+            (count == 2, "Calendar/Diagonal Spread"),
+            (count == 3, "Butterfly/Ladder"),
+            ((count == 4) & same_expiry, "Iron Condor"),  # Iron Condor usually has 4 legs, same expiry
+        ]
+        labels = pd.Series("Custom " + count.astype(str) + "-Leg", index=clusters.index, dtype=object)
+        # Apply in reverse so the first matching rule wins
+        for condition, label in reversed(rules):
+            labels = labels.mask(condition, label)
+        return labels
 
     @staticmethod
     def aggregate_strategy_pnl(df_with_strategies: pd.DataFrame) -> pd.DataFrame:
@@ -3,6 +3,8 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from core.data_service import DataService
+from core.scheduler import describe_status
+from core.instrumentation import RunTimer, stages_frame
 from datetime import datetime, timedelta, date
 from config import settings
 
@@ -10,7 +12,75 @@ from config import settings
 st.set_page_config(page_title="IBKR Trading Dashboard", layout="wide")
 st.title("📈 Trading Performance Dashboard")
 
-data_service = DataService()
+
+# --- CACHING ---
+# Processed frames are cached per data version: the version only moves on sync / P&L refresh,
+# so widget interactions re-slice cached frames instead of re-querying and recomputing.
+@st.cache_resource
+def get_data_service():
+    return DataService()
+
+
+@st.cache_data(max_entries=2, show_spinner=False)
+def load_overview(data_version):
+    """First close date and the ticker list for the sidebar."""
+    service = get_data_service()
+    first_close, _ = service.get_close_date_range()
+    return first_close, service.get_root_symbols()
+
+
+@st.cache_data(max_entries=2, show_spinner=False)
+def load_processed_data(data_version):
+    return get_data_service().get_processed_data()
+
+
+@st.cache_data(max_entries=2, show_spinner=False)
+def load_strategy_data(data_version):
+    closed, _ = load_processed_data(data_version)
+    return get_data_service().get_strategy_data(closed)
+
+
+@st.cache_data(max_entries=2, show_spinner=False)
+def load_campaign_data(data_version):
+    closed, _ = load_processed_data(data_version)
+    return get_data_service().get_campaign_data(closed)
+
+
+@st.cache_data(max_entries=2, show_spinner=False)
+def load_lot_relief_data(data_version):
+    return get_data_service().get_lot_relief_comparison()
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def load_benchmark_data(symbol, start_date):
+    return get_data_service().get_benchmark_data(symbol, start_date=start_date)
+
+
+TRADE_VIEW_COLUMNS = ['root_symbol', 'asset_id', 'quantity', 'entry_date', 'close_date', 'commission', 'net_pnl',
+                      'close_reason']
+
+# Render timings are kept per session (not persisted), shown next to the last sync when SHOW_TIMINGS is on
+render_run = RunTimer('render').start()
+
+data_service = get_data_service()
+
+
+def release_database():
+    """Lets the scheduler process write to a local database file once no session is mid-run."""
+    if settings.RELEASE_DB_LOCK and not data_service.db.use_motherduck:
+        data_service.db.release()
+
+
+def finish_page():
+    """Records this page run's timings and releases the database. Call before st.rerun() / st.stop() too."""
+    # Everything not attributed to a pipeline stage (queries, charts, tables) counts as 'render'
+    render_run.add('render', max(0.0, render_run.seconds - sum(s.seconds for s in render_run.stages.values())))
+    st.session_state['last_render_timings'] = render_run.finish()
+    release_database()
+
+
+data_service.ensure_pnl_tables()
+data_version = data_service.get_data_version()
 
 # --- SIDEBAR CONTROLS ---
 st.sidebar.header("Controls")
@@ -24,15 +94,36 @@ mode = "CLOUD (MotherDuck)" if settings.MOTHERDUCK_TOKEN else "LOCAL (File)"
 st.sidebar.caption(f"Mode: {mode}")
 # ------------------
 
-if st.sidebar.button("🔄 Sync with IBKR"):
+# Background scheduler (scheduler.py): while it is alive it owns refreshing, so the page only reads
+level, status_text, scheduler_active = describe_status(data_service.get_scheduler_status(),
+                                                       settings.SCHEDULER_LOCK_FILE)
+if level == 'info':
+    st.sidebar.caption(status_text)
+else:
+    getattr(st.sidebar, level)(status_text)
+
+if not scheduler_active and st.sidebar.button("🔄 Sync with IBKR"):
     with st.spinner("Connecting to IBKR... This may take up to 30s."):
-        success, msg = data_service.sync_ibkr_data()
+        with render_run.stage('sync'):
+            success, msg = data_service.sync_ibkr_data()
         if success:
             st.sidebar.success(msg)
+            finish_page()
             st.rerun()  # Refresh the page to show new data
         else:
             st.sidebar.error(msg)
 
+if settings.SHOW_TIMINGS:
+    with st.sidebar.expander("⏱️ Run Timings"):
+        for label, record in [("Last sync / recompute", data_service.get_last_run_timings()),
+                              ("Previous render", st.session_state.get('last_render_timings'))]:
+            if not record:
+                continue
+            st.caption(f"{label}: {record['seconds']:.2f}s ({record['status']}, {record['started_at'][:19]})")
+            st.dataframe(stages_frame(record).style.format({'seconds': '{:.3f}', 'share': '{:.0%}',
+                                                            'rows': '{:,}', 'rows_per_sec': '{:,.0f}'}),
+                         width="stretch")
+
 st.sidebar.divider()
 
 # 1. VIEW MODE
@@ -65,31 +156,36 @@ if time_period == "Custom":
         start_date, end_date = date_range
 
 # --- LOAD RAW DATA ---
-closed_df, open_df = data_service.get_processed_data()
+first_close, all_roots = load_overview(data_version)
 
-if closed_df.empty:
-    st.warning("No trading data found. Click 'Sync with IBKR' in the sidebar.")
+if first_close is None:
+    if scheduler_active:
+        # The Sync button is hidden while the scheduler owns refreshing
+        st.info("No trading data yet. Waiting for the scheduler's first sync.")
+    else:
+        st.warning("No trading data found. Click 'Sync with IBKR' in the sidebar.")
+    finish_page()
     st.stop()
 
 # Helper for Global Filtering
 if start_date is None:
-    start_date = closed_df['close_date'].min().date()
-
-# Apply Filters to RAW data for Standard View
-# For Strategy view, we apply filters AFTER grouping to ensure full campaigns are captured
-mask = (closed_df['close_date'].dt.date >= start_date) & (closed_df['close_date'].dt.date <= end_date)
-filtered_df = closed_df.loc[mask].copy()
+    start_date = pd.Timestamp(first_close).date()
 
-all_roots = sorted(closed_df['root_symbol'].astype(str).unique())
 selected_roots = st.sidebar.multiselect("Filter by Ticker", all_roots)
 
-if selected_roots:
-    filtered_df = filtered_df[filtered_df['root_symbol'].isin(selected_roots)]
+# Day bounds for filtering aggregated results (end is exclusive)
+start_ts = pd.Timestamp(start_date)
+end_ts = pd.Timestamp(end_date) + pd.Timedelta(days=1)
 
 # ==============================================================================
 # VIEW 1: STANDARD DASHBOARD
 # ==============================================================================
 if view_mode == "Standard Dashboard":
+    # Date and ticker filters run inside DuckDB; only the columns this view uses are read.
+    # (Strategy Lab filters AFTER grouping instead, to ensure full campaigns are captured.)
+    filtered_df = data_service.query_closed_trades(start_date, end_date, selected_roots, columns=TRADE_VIEW_COLUMNS)
+    open_df = data_service.query_open_positions(selected_roots)
+
     st.sidebar.divider()
     st.sidebar.subheader("Chart Settings")
     chart_resolution = st.sidebar.selectbox("Resolution", ["Daily", "Weekly", "Monthly"], index=0)
@@ -105,7 +201,7 @@ if view_mode == "Standard Dashboard":
     if show_benchmark:
         try:
             fetch_start = start_date - timedelta(days=5) if start_date else datetime(2020, 1, 1).date()
-            sp500_data = data_service.get_benchmark_data("^GSPC", start_date=fetch_start)
+            sp500_data = load_benchmark_data("^GSPC", fetch_start)
             if not sp500_data.empty:
                 sp500_df = sp500_data.rename(columns={'close': 'Close'})
                 sp500_df = sp500_df[sp500_df.index.date <= end_date]
@@ -133,12 +229,12 @@ if view_mode == "Standard Dashboard":
 
     with tab_equity:
         if not filtered_df.empty:
-            df_chart = filtered_df.copy()
-            df_chart = df_chart.set_index('close_date')
+            # Resample the per-day rollup; cost follows the number of days, not fills
+            daily = data_service.query_daily_pnl(start_date, end_date, selected_roots)
             rule_map = {"Daily": "D", "Weekly": "W-FRI", "Monthly": "MS"}
             rule = rule_map.get(chart_resolution, "D")
 
-            df_resampled = df_chart['net_pnl'].resample(rule).sum().fillna(0)
+            df_resampled = daily['net_pnl'].resample(rule).sum().fillna(0)
 
             # SP500
             sp_resampled_price = pd.Series(dtype=float)
@@ -194,9 +290,7 @@ if view_mode == "Standard Dashboard":
     st.divider()
     st.subheader("📋 Current Open Positions")
     if not open_df.empty:
-        open_view = open_df.copy()
-        if selected_roots: open_view = open_view[open_view['root_symbol'].isin(selected_roots)]
-        st.dataframe(open_view.sort_values('root_symbol'), width="stretch")
+        st.dataframe(open_df.sort_values('root_symbol'), width="stretch")
     else:
         st.info("No open positions.")
 
@@ -208,12 +302,12 @@ elif view_mode == "Strategy Lab":
     st.title("🔬 Strategy & Campaign Analytics")
 
     # 1. Process Data (Using FULL history to group correctly)
-    strat_df = data_service.get_strategy_data(closed_df)
-    camp_df = data_service.get_campaign_data(closed_df)
+    strat_df = load_strategy_data(data_version)
+    camp_df = load_campaign_data(data_version)
 
     # 2. Apply Filters to the RESULTS
     if not strat_df.empty:
-        s_mask = (strat_df['date'].dt.date >= start_date) & (strat_df['date'].dt.date <= end_date)
+        s_mask = (strat_df['date'] >= start_ts) & (strat_df['date'] < end_ts)
         if selected_roots:
             s_mask = s_mask & strat_df['root_symbol'].isin(selected_roots)
         strat_view = strat_df.loc[s_mask].copy()
@@ -221,7 +315,7 @@ elif view_mode == "Strategy Lab":
         strat_view = pd.DataFrame()
 
     if not camp_df.empty:
-        c_mask = (camp_df['end_date'].dt.date >= start_date) & (camp_df['end_date'].dt.date <= end_date)
+        c_mask = (camp_df['end_date'] >= start_ts) & (camp_df['end_date'] < end_ts)
         if selected_roots:
             c_mask = c_mask & camp_df['root_symbol'].isin(selected_roots)
         camp_view = camp_df.loc[c_mask].copy()
@@ -243,7 +337,7 @@ elif view_mode == "Strategy Lab":
         c3.metric("Campaigns Completed", len(camp_view))
 
     # --- TABS ---
-    tab_campaigns, tab_spreads = st.tabs(["🎡 Wheel Campaigns", "🦋 Strategy Log"])
+    tab_campaigns, tab_spreads, tab_lots = st.tabs(["🎡 Wheel Campaigns", "🦋 Strategy Log", "🧾 Tax Lots"])
 
     with tab_campaigns:
         st.subheader("The Wheel: Campaign Performance")
@@ -292,4 +386,36 @@ elif view_mode == "Strategy Lab":
             st.dataframe(strat_view[['date', 'root_symbol', 'strategy_type', 'net_pnl', 'leg_count', 'close_reason']],
                          width="stretch")
         else:
-            st.info("No strategies found.")
\ No newline at end of file
+            st.info("No strategies found.")
+
+    with tab_lots:
+        st.subheader("Lot Relief Comparison")
+        st.markdown("*Realized P&L of the same executions under FIFO, LIFO, highest-cost-first and average cost.*")
+
+        lots_closed, lots_open = load_lot_relief_data(data_version)
+        if not lots_closed.empty:
+            method_labels = {'fifo': 'FIFO', 'lifo': 'LIFO', 'hifo': 'HIFO', 'average': 'Average Cost'}
+            l_mask = (lots_closed['close_date'] >= start_ts) & (lots_closed['close_date'] < end_ts)
+            if selected_roots:
+                l_mask = l_mask & lots_closed['root_symbol'].isin(selected_roots)
+            lots_view = lots_closed.loc[l_mask].copy()
+            lots_view['method'] = lots_view['method'].map(method_labels)
+            lots_view['year'] = lots_view['close_date'].dt.year
+
+            by_method = lots_view.groupby('method', sort=False)['net_pnl'].sum()
+            fig_lots = px.bar(by_method, title="Realized P&L by Relief Method",
+                              labels={'value': 'Realized P&L ($)', 'method': 'Method'})
+            fig_lots.update_layout(template="plotly_dark", showlegend=False)
+            st.plotly_chart(fig_lots, width="stretch")
+
+            st.dataframe(lots_view.pivot_table(index='year', columns='method', values='net_pnl', aggfunc='sum',
+                                               sort=False).fillna(0), width="stretch")
+
+            open_view = lots_open if not selected_roots else lots_open[lots_open['root_symbol'].isin(selected_roots)]
+            open_basis = open_view.groupby('method', sort=False)['cost_basis'].sum().rename(index=method_labels)
+            st.caption("Open cost basis by method")
+            st.dataframe(open_basis, width="stretch")
+        else:
+            st.info("No executions found.")
+
+finish_page()
@@ -1,11 +1,26 @@
+"""
+Headless entry point: runs the pipeline without Streamlit (cron jobs, batch boxes).
+
+Usage:
+    python main.py sync                                 # download from IBKR, ingest, refresh P&L
+    python main.py recompute --full --backend processes
+    python main.py backfill --from-file statements/2019-2023.xml --chunk-rows 50000
+    python main.py export closed --start 2024-01-01 --format csv --output closed.csv
+    python main.py bench --fills 10000 1000000 --json bench.json
+    python main.py profile --profiler cprofile --top 30
+
+Without a subcommand the stored executions are recomputed and summarized (the old behaviour).
+"""
+import argparse
+import pandas as pd
+import json
 import logging
 import sys
-import pandas as pd
+from pathlib import Path
+
 from config import settings
-from core.ibkr_client import IBKRFlexClient
-from core.database import DatabaseManager
-from core.parser import parse_ibkr_xml
-from core.logic import PnLEngine
+from core.data_service import DataService
+from core.instrumentation import stages_frame
 
 # Configure Logging
 logging.basicConfig(
@@ -15,81 +30,298 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+OUTPUT_FORMATS = ['table', 'csv', 'json', 'parquet']
+EXPORT_DATASETS = ['closed', 'open', 'daily', 'strategies', 'campaigns', 'timings']
+
+
+def print_summary(service, output_format='table'):
+    """Prints realized P&L and the open positions from the materialized tables."""
+    closed_df, open_df = service.get_processed_data()
+
+    if closed_df.empty:
+        logger.warning("No trades found in database (after filtering out CASH/Forex).")
+        return
 
-def run_pipeline(fetch_new=False):
+    if output_format == 'json':
+        print(json.dumps({
+            'closed_trades': len(closed_df),
+            'realized_pnl': round(float(closed_df['net_pnl'].sum()), 2),
+            'open_assets': len(open_df),
+            'open_positions': json.loads(open_df.to_json(orient='records', date_format='iso')),
+        }, indent=2))
+        return
+
+    print("\n--- PERFORMANCE SUMMARY ---")
+    print(f"Total Closed Trades: {len(closed_df)}")
+    print(f"Total Realized P&L: ${closed_df['net_pnl'].sum():,.2f}")
+    print(f"Total Open Assets:   {len(open_df)}")
+
+    if open_df.empty:
+        print("\n--- NO OPEN POSITIONS ---")
+        return
+
+    # --- OPEN STOCKS ---
+    stocks_open = open_df[~open_df['asset_id'].str.contains(' ')]
+    if not stocks_open.empty:
+        print("\n--- OPEN STOCK POSITIONS ---")
+        print(stocks_open.sort_values('quantity', ascending=False))
+
+    # --- OPEN OPTIONS ---
+    # Options asset_id contains spaces: "CCJ 20250919 75.0 P"
+    options_open = open_df[open_df['asset_id'].str.contains(' ')]
+    if not options_open.empty:
+        print("\n--- OPEN OPTION POSITIONS ---")
+        print(options_open.sort_values('quantity', ascending=False))
+    else:
+        print("\n--- NO OPEN OPTION POSITIONS ---")
+
+
+def run_pipeline(fetch_new=False, output_format='table'):
     """
     Executes the pipeline.
     Args:
         fetch_new (bool): If True, downloads from IBKR. If False, just runs Logic on DB.
+    Returns:
+        bool: False if the download or the P&L calculation failed.
     """
-    db = DatabaseManager()
+    service = DataService()
+    synced = False
 
     if fetch_new:
         logger.info("--- Starting IBKR Data Download ---")
-        try:
-            client = IBKRFlexClient(token=settings.IBKR_TOKEN, query_id=settings.IBKR_QUERY_ID)
-            result = client.request_report()
-            if result:
-                ref_code, url = result
-                xml_content = client.download_report(ref_code, url)
-                if xml_content:
-                    data_map = parse_ibkr_xml(xml_content)
-                    db.save_dataframe('trades', data_map.get('trades'))
-                    db.save_dataframe('transactions', data_map.get('transactions'))
-        except Exception as e:
-            logger.error(f"Download failed: {e}")
+        synced, msg = service.sync_ibkr_data()
+        if not synced:
+            logger.error(f"Download failed: {msg}")
 
     # --- LOGIC ENGINE STEP ---
     logger.info("--- Starting P&L Calculation ---")
 
-    conn = db.get_connection()
     try:
-        # Load executions, excluding Cash/Forex pairs like USD.CAD
-        raw_trades_df = conn.execute("""
-            SELECT * FROM trades 
-            WHERE asset_class NOT IN ('CASH')
-            AND symbol NOT LIKE '%.%'
-        """).df()
-
-        if raw_trades_df.empty:
-            logger.warning("No trades found in database (after filtering out CASH/Forex).")
-            return
-
-        logger.info(f"Loaded {len(raw_trades_df)} raw executions.")
-
-        # Run FIFO Engine
-        closed_df, open_df = PnLEngine.calculate_fifo_pnl(raw_trades_df)
-
-        if not closed_df.empty:
-            print("\n--- PERFORMANCE SUMMARY ---")
-            print(f"Total Closed Trades: {len(closed_df)}")
-            print(f"Total Realized P&L: ${closed_df['net_pnl'].sum():,.2f}")
-            print(f"Total Open Assets:   {len(open_df)}")
-
-            # --- OPEN STOCKS ---
-            stocks_open = open_df[~open_df['asset_id'].str.contains(' ')]
-            if not stocks_open.empty:
-                print("\n--- OPEN STOCK POSITIONS ---")
-                print(stocks_open.sort_values('quantity', ascending=False))
-
-            # --- OPEN OPTIONS ---
-            # Options asset_id contains spaces: "CCJ 20250919 75.0 P"
-            options_open = open_df[open_df['asset_id'].str.contains(' ')]
-            if not options_open.empty:
-                print("\n--- OPEN OPTION POSITIONS ---")
-                print(options_open.sort_values('quantity', ascending=False))
-            else:
-                print("\n--- NO OPEN OPTION POSITIONS ---")
+        # Brings closed_trades / open_positions up to date (a successful sync already did)
+        if not synced:
+            service.recompute_pnl()
+        print_summary(service, output_format)
+        return synced or not fetch_new
+    except Exception as e:
+        logger.error(f"Logic Engine failed: {e}")
+        return False
+    finally:
+        service.db.close()
+
 
+def write_frame(df, output_format='table', output=None):
+    """Writes a result table to `output` (or stdout) as a printed table, CSV, JSON records or Parquet."""
+    if output_format == 'table' and output:
+        suffix = Path(output).suffix.lstrip('.').lower()
+        output_format = suffix if suffix in OUTPUT_FORMATS else 'csv'
+
+    if output_format == 'table':
+        with pd.option_context('display.max_rows', 200, 'display.width', 200):
+            print(df)
+    elif output_format == 'csv':
+        df.to_csv(output or sys.stdout)
+    elif output_format == 'json':
+        text = df.to_json(orient='records', date_format='iso', indent=2)
+        if output:
+            Path(output).write_text(text, encoding='utf-8')
         else:
-            logger.info("No closed trades generated.")
+            print(text)
+    elif output_format == 'parquet':
+        if not output:
+            raise SystemExit("--format parquet needs --output.")
+        df.to_parquet(output)
+    if output:
+        logger.info(f"Wrote {len(df)} rows to {output}")
 
-    except Exception as e:
-        logger.error(f"Logic Engine failed: {e}")
+
+def load_export(service, dataset, start=None, end=None, symbols=None):
+    """
+    The rows behind one dashboard table, filtered like the dashboard (end date inclusive).
+    Strategies and campaigns are built from all closed rows, dividends included, as on the dashboard.
+    """
+    service.ensure_pnl_tables()
+    if dataset == 'closed':
+        return service.query_closed_trades(start, end, symbols)
+    if dataset == 'open':
+        return service.query_open_positions(symbols)
+    if dataset == 'daily':
+        return service.query_daily_pnl(start, end, symbols)
+    if dataset == 'timings':
+        return stages_frame(service.get_last_run_timings())
+
+    closed_df = service.query_closed_trades(symbols=symbols)
+    end_ts = pd.Timestamp(end) + pd.Timedelta(days=1) if end else None
+    result = service.get_strategy_data(closed_df) if dataset == 'strategies' else service.get_campaign_data(closed_df)
+    if result.empty or not (start or end):
+        return result
+    date_col = 'date' if dataset == 'strategies' else 'end_date'
+    mask = pd.Series(True, index=result.index)
+    if start:
+        mask &= result[date_col] >= pd.Timestamp(start)
+    if end_ts is not None:
+        mask &= result[date_col] < end_ts
+    return result[mask]
+
+
+# --- SUBCOMMANDS ---
+
+def cmd_sync(args):
+    return 0 if run_pipeline(fetch_new=True, output_format=args.format) else 1
+
+
+def cmd_recompute(args):
+    service = DataService()
+    try:
+        processed = service.recompute_pnl(full_rebuild=args.full)
+        logger.info(f"Recomputed P&L from {processed} executions.")
+        print_summary(service, args.format)
+        return 0
+    finally:
+        service.db.close()
+
+
+def cmd_backfill(args):
+    if not Path(args.from_file).is_file():
+        logger.error(f"File not found: {args.from_file}")
+        return 1
+    service = DataService()
+    try:
+        success, msg = service.backfill_from_file(args.from_file, recompute=not args.no_recompute)
+        (logger.info if success else logger.error)(msg)
+        return 0 if success else 1
+    finally:
+        service.db.close()
+
+
+def cmd_export(args):
+    service = DataService()
+    try:
+        df = load_export(service, args.dataset, start=args.start, end=args.end, symbols=args.symbols)
+        write_frame(df, args.format, args.output)
+        return 0
+    finally:
+        service.db.close()
+
+
+def cmd_bench(args):
+    from benchmarks.bench_pipeline import run_benchmark, compare, print_results
+
+    results = run_benchmark(args.fills, engine=args.engine, backend=args.backend, dom_limit=args.dom_limit)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            compare(results, json.load(f))
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'engine': args.engine, 'backend': args.backend, 'runs': results}, f, indent=2)
+    return 0
+
+
+def cmd_profile(args):
+    import pstats
+
+    settings.PROFILER = args.profiler
+    if args.profile_dir:
+        settings.PROFILE_DIR = args.profile_dir
+    service = DataService()
+    try:
+        if args.from_file:
+            success, msg = service.backfill_from_file(args.from_file)
+            if not success:
+                logger.error(msg)
+                return 1
+        else:
+            service.recompute_pnl(full_rebuild=not args.incremental)
+        record = service.get_last_run_timings()
     finally:
-        db.close()
+        service.db.close()
+
+    write_frame(stages_frame(record))
+    path = record.get('profile') if record else None
+    if path and args.profiler == 'cprofile':
+        pstats.Stats(path).sort_stats(args.sort).print_stats(args.top)
+    if path:
+        print(f"Profile: {path}")
+    return 0
+
+
+def apply_overrides(args):
+    """Command-line performance flags win over .env / environment settings for this process."""
+    if args.backend:
+        settings.EXECUTION_BACKEND = args.backend
+    if args.workers:
+        settings.EXECUTION_WORKERS = args.workers
+    if args.engine:
+        settings.PNL_ENGINE = args.engine
+    if args.chunk_rows:
+        settings.PARSER_CHUNK_ROWS = args.chunk_rows
+
+
+COMMON_DEFAULTS = {'backend': None, 'workers': None, 'engine': None, 'chunk_rows': None, 'format': 'table'}
+
+
+def build_parser():
+    # Shared flags are accepted before and after the subcommand. SUPPRESS keeps a flag given before the
+    # subcommand from being reset by the subparser's default; main() fills in COMMON_DEFAULTS afterwards.
+    common = argparse.ArgumentParser(add_help=False, argument_default=argparse.SUPPRESS)
+    common.add_argument('--backend', choices=['serial', 'threads', 'processes'],
+                        help="Execution backend for the per-symbol engines (default: EXECUTION_BACKEND).")
+    common.add_argument('--workers', type=int, help="Worker count for threads/processes.")
+    common.add_argument('--engine', choices=['python', 'vectorized'], help="Lot matching engine (default: PNL_ENGINE).")
+    common.add_argument('--chunk-rows', type=int, help="Rows per parser chunk while ingesting Flex XML.")
+    common.add_argument('--format', choices=OUTPUT_FORMATS, help="Output format (default: table).")
+
+    parser = argparse.ArgumentParser(description="IBKR trading dashboard pipeline (headless).", parents=[common])
+    sub = parser.add_subparsers(dest='command')
+
+    p = sub.add_parser('sync', parents=[common], help="Download the Flex report, ingest it and refresh P&L.")
+    p.set_defaults(func=cmd_sync)
+
+    p = sub.add_parser('recompute', parents=[common], help="Refresh the P&L tables from stored executions.")
+    p.add_argument('--full', action='store_true', help="Replay every execution instead of only new ones.")
+    p.set_defaults(func=cmd_recompute)
+
+    p = sub.add_parser('backfill', parents=[common], help="Ingest a saved Flex XML statement.")
+    p.add_argument('--from-file', required=True, help="Flex XML file to load.")
+    p.add_argument('--no-recompute', action='store_true', help="Only ingest; refresh P&L later.")
+    p.set_defaults(func=cmd_backfill)
+
+    p = sub.add_parser('export', parents=[common], help="Write a result table to stdout or a file.")
+    p.add_argument('dataset', choices=EXPORT_DATASETS)
+    p.add_argument('--start', help="First date (YYYY-MM-DD).")
+    p.add_argument('--end', help="Last date, inclusive (YYYY-MM-DD).")
+    p.add_argument('--symbols', nargs='+', help="Root symbols to keep.")
+    p.add_argument('--output', '-o', help="File to write (format taken from --format or the extension).")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser('bench', parents=[common], help="Run the synthetic pipeline benchmark.")
+    p.add_argument('--fills', type=int, nargs='+', default=[10_000, 100_000])
+    p.add_argument('--dom-limit', type=int, default=1_000_000)
+    p.add_argument('--json', help="Write the results to this file.")
+    p.add_argument('--baseline', help="Earlier --json output to compare against.")
+    p.set_defaults(func=cmd_bench)
+
+    p = sub.add_parser('profile', parents=[common], help="Profile a recompute (or a backfill) run.")
+    p.add_argument('--profiler', choices=['cprofile', 'pyinstrument'], default='cprofile')
+    p.add_argument('--profile-dir', help="Where to write the profile (default: PROFILE_DIR).")
+    p.add_argument('--from-file', help="Profile ingesting this Flex XML file instead of a recompute.")
+    p.add_argument('--incremental', action='store_true', help="Profile an incremental instead of a full recompute.")
+    p.add_argument('--top', type=int, default=25, help="Functions to print (cProfile only).")
+    p.add_argument('--sort', default='cumulative', help="pstats sort key (cProfile only).")
+    p.set_defaults(func=cmd_profile)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    for name, default in COMMON_DEFAULTS.items():
+        if not hasattr(args, name):
+            setattr(args, name, default)
+    apply_overrides(args)
+    if args.command is None:
+        return 0 if run_pipeline(fetch_new=False, output_format=args.format) else 1
+    return args.func(args)
 
 
 if __name__ == "__main__":
-    # Usually fetch_new=True once to get data, then False to iterate on logic
-    run_pipeline(fetch_new=False)
\ No newline at end of file
+    sys.exit(main())
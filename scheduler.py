@@ -0,0 +1,70 @@
+"""
+Background sync scheduler: downloads the Flex report and refreshes the P&L tables on a fixed cadence,
+so the dashboard only reads precomputed results.
+
+A file lock (SCHEDULER_LOCK_FILE) keeps runs from overlapping: a second scheduler, or a cron-started
+`--once` while the previous one is still busy, exits without doing anything.
+
+Usage:
+    python scheduler.py                      # every SYNC_INTERVAL_MINUTES until stopped
+    python scheduler.py --interval 15
+    python scheduler.py --once               # one cycle, e.g. from cron
+    python scheduler.py --recompute-only     # no IBKR download, just refresh derived tables
+
+With a local DuckDB file, run the dashboard with RELEASE_DB_LOCK=true so both processes can take turns.
+"""
+import argparse
+import logging
+import signal
+import sys
+from datetime import datetime, timezone
+
+from config import settings
+from core.data_service import DataService
+from core.scheduler import FileLock, SyncScheduler
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+logger = logging.getLogger(__name__)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run IBKR sync + P&L recompute on a schedule.")
+    parser.add_argument('--interval', type=float, default=settings.SYNC_INTERVAL_MINUTES,
+                        help="Minutes between runs (default: SYNC_INTERVAL_MINUTES).")
+    parser.add_argument('--once', action='store_true', help="Run a single cycle and exit.")
+    parser.add_argument('--recompute-only', action='store_true', help="Skip the IBKR download.")
+    parser.add_argument('--lock-file', default=settings.SCHEDULER_LOCK_FILE)
+    args = parser.parse_args(argv)
+
+    lock = FileLock(args.lock_file)
+    if not lock.acquire():
+        logger.warning(f"Another scheduler holds {args.lock_file}; not starting.")
+        return 0 if args.once else 1
+
+    scheduler = SyncScheduler(DataService(), interval_minutes=args.interval, fetch=not args.recompute_only)
+
+    def handle_signal(signum, frame):
+        logger.info("Stop requested; exiting after the current run.")
+        scheduler.stop()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    try:
+        if args.once:
+            # Cron-driven: the next run is expected one interval from now
+            next_run = datetime.now(timezone.utc) + scheduler.interval
+            return 0 if scheduler.run_once(next_run=next_run)['state'] == 'ok' else 1
+        logger.info(f"Scheduler started ({args.interval:g} min interval).")
+        scheduler.run_forever()
+        return 0
+    finally:
+        lock.release()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+from benchmarks.synthetic import iter_history
+from core.logic import PnLEngine
+from core.parser import ColumnarTableBuilder, TRADE_FIELDS
+
+# Stocks, equity options and futures options, with the underlying, strike or expiry missing in turn
+ROWS = [
+    # asset_class, symbol, underlying, expiry, strike, put_call
+    ('STK', 'AAPL', '', None, None, None),
+    ('STK', 'AAPL', None, None, None, None),
+    ('STK', 'BRK B', 'BRK B', None, None, None),
+    ('OPT', 'AAPL  240119C00190000', 'AAPL', '20240119', 190.0, 'C'),
+    ('OPT', 'AAPL  240119C00190000', 'AAPL', '20240119', 190.0, 'C'),
+    ('OPT', 'AAPL  240119P00185000', 'AAPL', '20240119', 185.5, 'P'),
+    ('OPT', 'CCJ   240216P00040000', '', '20240216', 40.0, 'P'),
+    ('OPT', 'CCJ   240216P00040000', None, '20240216', 40.0, 'P'),
+    ('OPT', 'CCJ', 'CCJ', None, 40.0, 'P'),
+    ('OPT', 'CCJ', 'CCJ', '20240216', None, 'P'),
+    ('OPT', 'CCJ', 'CCJ', '20240216', 40.0, None),
+    ('FOP', 'ESH4 C4800', 'ES', '20240315', 4800.0, 'C'),
+    ('FOP', 'ESH4 C4800', '', '20240315', 4800.0, 'C'),
+    ('FOP', 'ESH4', 'ES', None, None, 'C'),
+    ('CASH', 'EUR.USD', '', None, None, None),
+    ('STK', None, None, None, None, None),
+    ('OPT', None, None, '20240119', 10.0, 'C'),
+]
+
+
+# --- Reference: the original per-row key ---
+
+def reference_asset_key(row):
+    asset_class = str(row.get('asset_class', ''))
+    root = row.get('underlying') if row.get('underlying') else row.get('symbol')
+    if 'OPT' in asset_class or 'FOP' in asset_class:
+        return f"{root} {row.get('expiry')} {row.get('strike')} {row.get('put_call')}"
+    return root
+
+
+def reference_root(row):
+    return row.get('underlying') if row.get('underlying') else row.get('symbol')
+
+
+def trades_frame(rows):
+    # Object columns keep None as None (pandas would otherwise infer str columns holding NaN)
+    df = pd.DataFrame(rows, columns=['asset_class', 'symbol', 'underlying', 'expiry', 'strike', 'put_call'],
+                      dtype=object)
+    return df.astype({'strike': float})
+
+
+def check_against_reference(trades_df):
+    # Plain records: iterrows would infer a str row and turn None into NaN
+    records = trades_df.astype(object).to_dict('records')
+    expected_ids = [reference_asset_key(row) for row in records]
+    expected_roots = [reference_root(row) for row in records]
+
+    # Lookup table: every code points at its reference key, unknown symbols get -1
+    codes, assets = PnLEngine.build_asset_table(trades_df)
+    looked_up = [assets['asset_id'].iloc[c] if c >= 0 else None for c in codes]
+    assert looked_up == expected_ids, f"asset table keys differ:\n{looked_up}\n{expected_ids}"
+    assert assets['asset_id'].is_unique, "One code per asset key"
+    assert [assets['root_symbol'].iloc[c] if c >= 0 else None for c in codes] == expected_roots
+
+    # Categoricals aligned with the input rows
+    keys = PnLEngine.build_asset_keys(trades_df)
+    assert keys.index.equals(trades_df.index)
+    ids = [None if pd.isna(v) else v for v in keys['asset_id'].astype(object)]
+    roots = [None if pd.isna(v) else v for v in keys['root_symbol'].astype(object)]
+    assert ids == expected_ids, f"asset_id differs:\n{ids}\n{expected_ids}"
+    assert roots == expected_roots, f"root_symbol differs:\n{roots}\n{expected_roots}"
+    return codes, assets
+
+
+def test_asset_keys_match_reference():
+    trades_df = trades_frame(ROWS)
+    codes, assets = check_against_reference(trades_df)
+    # Same contract, same code; a missing underlying falls back to the symbol
+    assert codes[3] == codes[4] and codes[0] == codes[1]
+    assert assets['asset_id'].iloc[codes[6]] == 'CCJ   240216P00040000 20240216 40.0 P'
+    assert codes[15] == -1
+
+    # The one intended difference: a NaN underlying (str columns) counts as missing, where the old
+    # truthiness check keyed the row by NaN
+    nan_underlying = trades_df.assign(underlying=pd.Series(trades_df['underlying'].tolist(), dtype='str'))
+    assert nan_underlying['underlying'].isna().sum() == 4
+    keys = PnLEngine.build_asset_keys(nan_underlying)
+    assert keys['asset_id'].iloc[1] == 'AAPL' and keys['asset_id'].iloc[7] == 'CCJ   240216P00040000 20240216 40.0 P'
+    print(f"{len(trades_df)} hand-picked rows: {len(assets)} assets keyed like the original.")
+
+
+def test_random_asset_keys():
+    rng = np.random.default_rng(18)
+    n = 3000
+    picked = trades_frame(ROWS).iloc[rng.integers(0, len(ROWS), n)]
+    # Shuffled, with a non-default index and a strike column that mixes in integers
+    picked = picked.set_index(pd.Index(rng.permutation(n) * 3))
+    check_against_reference(picked)
+
+    # Without the optional contract columns, as on stock-only extracts
+    check_against_reference(picked[['asset_class', 'symbol']])
+    print(f"{n} shuffled rows (and a stock-only extract) keyed like the original.")
+
+
+def test_parsed_asset_keys():
+    # Frames from the parser: categorical symbol/asset_class/put_call, '' for a missing underlying
+    builder = ColumnarTableBuilder(TRADE_FIELDS)
+    for kind, attrs in iter_history(3000, n_underlyings=12, seed=18):
+        if kind == 'trade':
+            builder.append(attrs)
+    trades_df = builder.to_frame()
+    _, assets = check_against_reference(trades_df)
+    print(f"{len(trades_df)} parsed executions: {len(assets)} assets keyed like the original.")
+
+
+def run_test():
+    print("--- Comparing asset keys with the original per-row key ---")
+    test_asset_keys_match_reference()
+    test_random_asset_keys()
+    test_parsed_asset_keys()
+    print("✅ SUCCESS: Asset codes and lookup table reproduce the original keys.")
+
+
+if __name__ == "__main__":
+    run_test()
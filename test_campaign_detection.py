@@ -0,0 +1,182 @@
+import numpy as np
+import pandas as pd
+from core.campaign_engine import CampaignEngine
+
+REASONS = np.array(['Trade', 'Trade', 'Assigned', 'Expired', 'Exercised'], dtype=object)
+
+
+def random_closed_trades(rng, n_rows, tie_heavy=False):
+    """
+    Closed trades on a coarse time grid, so entry times tie often. Closes can land before the running
+    campaign window ends (early closes), and some dates and symbols are missing.
+
+    With `tie_heavy`, closes stay on the same grid and short: tied entries then often close together for
+    different reasons, so which of them sets the campaign window (and its tolerance) decides the split.
+    """
+    start = pd.Timestamp('2024-01-01')
+    entry = start + pd.to_timedelta(rng.integers(0, max(40, n_rows // 2), n_rows) * 3, unit='h')
+    hours = [0, 3, 6] if tie_heavy else [0, 1, 2, 30, 72, 200]
+    close = entry + pd.to_timedelta(rng.choice(hours, n_rows), unit='h')
+    df = pd.DataFrame({
+        'root_symbol': rng.choice(np.array(['AAPL', 'CCJ', 'SPX', None], dtype=object), n_rows, p=[.45, .4, .1, .05]),
+        'entry_date': entry,
+        'close_date': close,
+        'close_reason': rng.choice(REASONS, n_rows),
+        'net_pnl': rng.normal(0, 100, n_rows).round(2),
+    })
+    df.loc[rng.random(n_rows) < 0.05, 'entry_date'] = pd.NaT
+    df.loc[rng.random(n_rows) < 0.05, 'close_date'] = pd.NaT
+    return df
+
+
+# --- Reference: the original row-by-row implementation ---
+
+def reference_campaigns(closed_trades_df):
+    df = closed_trades_df[~closed_trades_df['root_symbol'].isin(['SPX', 'SPXW'])].copy()
+    df = df.sort_values(by=['root_symbol', 'entry_date'])
+    df['campaign_id'] = None
+    camp_number = 0
+
+    for symbol, group in df.groupby('root_symbol'):
+        group = group.sort_values('entry_date')
+        camp_number += 1
+        camp_end = group.iloc[0]['close_date']
+        camp_end_reason = group.iloc[0]['close_reason']
+
+        for idx, row in group.iterrows():
+            passive = camp_end_reason in CampaignEngine.PASSIVE_CLOSES
+            tolerance = CampaignEngine.TOLERANCE_LOOSE if passive else CampaignEngine.TOLERANCE_STRICT
+            if row['entry_date'] <= (camp_end + tolerance):
+                df.at[idx, 'campaign_id'] = camp_number
+                if row['close_date'] > camp_end:
+                    camp_end = row['close_date']
+                    camp_end_reason = row['close_reason']
+            else:
+                camp_number += 1
+                df.at[idx, 'campaign_id'] = camp_number
+                camp_end = row['close_date']
+                camp_end_reason = row['close_reason']
+    return df
+
+
+def partition(df):
+    """Campaigns as sets of row labels (independent of the id values), plus the rows left unassigned."""
+    assigned = df[df['campaign_id'].notna()]
+    groups = {frozenset(rows) for rows in assigned.groupby('campaign_id').groups.values()}
+    return groups, frozenset(df.index[df['campaign_id'].isna()])
+
+
+def test_campaigns_match_reference(n_cases=300):
+    rng = np.random.default_rng(2024)
+    campaigns = 0
+    for case in range(n_cases):
+        # Every third history is long enough for per-symbol blocks above numpy's insertion-sort cutoff (16),
+        # where the order of tied entry times depends on the sort algorithm
+        if case % 3 == 0:
+            closed_df = random_closed_trades(rng, int(rng.integers(100, 250)), tie_heavy=True)
+        else:
+            closed_df = random_closed_trades(rng, int(rng.integers(1, 60)))
+        result = CampaignEngine.identify_campaigns(closed_df)
+        expected = reference_campaigns(closed_df)
+        if expected.empty:
+            assert result.empty, f"case {case}: expected no rows"
+            continue
+
+        assert sorted(result.index) == sorted(expected.index), f"case {case}: different rows kept"
+        assert partition(result) == partition(expected), f"case {case}: campaign splits differ\n{closed_df}"
+        campaigns += len(partition(expected)[0])
+    print(f"{n_cases} randomized histories: {campaigns} campaigns split like the original loop.")
+
+
+def random_campaign_rows(rng, n_campaigns=400):
+    """Campaign-tagged closed trades: stock-only, option-only and mixed (wheel) campaigns."""
+    rows = []
+    start = pd.Timestamp('2024-01-01')
+    for camp in range(n_campaigns):
+        kind = ('stock', 'option', 'mixed')[camp % 3]
+        first = start + pd.Timedelta(hours=int(rng.integers(0, 5000)))
+        for _ in range(int(rng.integers(1, 6))):
+            is_stock = kind == 'stock' or (kind == 'mixed' and rng.random() < 0.4)
+            entry = first + pd.Timedelta(hours=int(rng.integers(0, 100)))
+            rows.append({
+                'campaign_id': camp * 7919,
+                'root_symbol': f"S{camp % 25}",
+                'asset_class': 'STK' if is_stock else rng.choice(['OPT', 'FOP']),
+                'quantity': float(rng.integers(-300, 300)) if is_stock else float(rng.integers(-5, 5)),
+                # Stock rows: no strike; some option rows have a zero or missing strike
+                'strike': np.nan if is_stock else rng.choice([0.0, np.nan, 45.0, 50.0, 52.5]),
+                'close_price': rng.choice([0.0, 0.0, 48.2, 101.5]),
+                'net_pnl': rng.choice([0.0, round(float(rng.normal(0, 200)), 2)]),
+                'entry_date': entry,
+                # Some campaigns last under a day (duration floored at 1)
+                'close_date': entry + pd.Timedelta(minutes=int(rng.choice([5, 600, 3000, 20000]))),
+            })
+    return pd.DataFrame(rows)
+
+
+def reference_campaign_stats(df_with_campaigns):
+    def estimate_capital(rows):
+        max_cap = 0.0
+        for _, r in rows.iterrows():
+            val = 0.0
+            qty = abs(r['quantity'])
+            if 'strike' in r and pd.notna(r['strike']) and r['strike'] > 0:
+                val = r['strike'] * 100 * qty
+            elif 'STK' in str(r.get('asset_class', '')):
+                price = r.get('close_price', 0)
+                if price == 0 and r.get('net_pnl') != 0: price = 100
+                val = price * qty
+            if val > max_cap: max_cap = val
+        return max_cap if max_cap > 0 else 1.0
+
+    stats = []
+    for camp_id, group in df_with_campaigns.groupby('campaign_id'):
+        start_date = group['entry_date'].min()
+        end_date = group['close_date'].max()
+        duration_days = (end_date - start_date).total_seconds() / (24 * 3600)
+        if duration_days < 1: duration_days = 1
+        total_pnl = group['net_pnl'].sum()
+        capital = estimate_capital(group)
+        roi_abs = total_pnl / capital
+        stats.append({
+            'campaign_id': camp_id,
+            'root_symbol': group['root_symbol'].iloc[0],
+            'start_date': start_date,
+            'end_date': end_date,
+            'duration_days': round(duration_days, 1),
+            'trades_count': len(group),
+            'total_pnl': total_pnl,
+            'capital_est': capital,
+            'roi_abs': roi_abs * 100,
+            'roi_annualized': roi_abs * (365 / duration_days) * 100,
+        })
+    return pd.DataFrame(stats).sort_values(by='end_date', ascending=False)
+
+
+def test_campaign_stats_match_reference():
+    rng = np.random.default_rng(7)
+    campaigns = random_campaign_rows(rng)
+    for name, df in [('mixed history', campaigns),
+                     ('stock only', campaigns[campaigns['asset_class'] == 'STK']),
+                     ('options only', campaigns[campaigns['asset_class'] != 'STK'])]:
+        stats = CampaignEngine.aggregate_campaign_stats(df)
+        pd.testing.assert_frame_equal(stats, reference_campaign_stats(df))
+        print(f"{name}: {len(stats)} campaign rows identical to the per-campaign loop.")
+
+    # Detected campaigns straight from identify_campaigns
+    closed_df = random_closed_trades(rng, 200).assign(
+        quantity=1.0, strike=np.nan, asset_class='STK', close_price=rng.choice([0.0, 55.0], 200))
+    tagged = CampaignEngine.identify_campaigns(closed_df)
+    pd.testing.assert_frame_equal(CampaignEngine.aggregate_campaign_stats(tagged),
+                                  reference_campaign_stats(tagged), check_dtype=False)
+
+
+def run_test():
+    print("--- Comparing campaign detection and stats with the original row-by-row implementation ---")
+    test_campaigns_match_reference()
+    test_campaign_stats_match_reference()
+    print("✅ SUCCESS: Campaign splits and stats are unchanged.")
+
+
+if __name__ == "__main__":
+    run_test()
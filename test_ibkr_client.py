@@ -0,0 +1,206 @@
+import asyncio
+import gzip
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse
+from core.ibkr_client import IBKRFlexClient, AsyncIBKRFlexClient, BackoffPolicy, HTTPX_AVAILABLE
+
+if HTTPX_AVAILABLE:
+    import httpx
+
+STATEMENT = ('<FlexQueryResponse queryName="stub" type="AF"><FlexStatements count="1"><FlexStatement>'
+             + '<Trade tradeID="1" symbol="AAPL" />' * 200 + '</FlexStatement></FlexStatements></FlexQueryResponse>')
+
+
+
+def flex_error_xml(code, message):
+    return (f'<FlexStatementResponse><Status>Warn</Status><ErrorCode>{code}</ErrorCode>'
+            f'<ErrorMessage>{message}</ErrorMessage></FlexStatementResponse>')
+
+
+IN_PROGRESS = flex_error_xml(1019, 'Statement generation in progress. Please try again shortly.')
+THROTTLED = flex_error_xml(1018, 'Too many requests have been made from this token.')
+EXPIRED = flex_error_xml(1012, 'Token has expired.')
+MAINTENANCE = '<html><body><ErrorCode>503</ErrorCode><ErrorMessage>Down for maintenance<br></body></html>'
+
+
+class StubFlexHandler(BaseHTTPRequestHandler):
+    """Plays the IBKR Flex endpoints: SendRequest succeeds, GetStatement follows the server's script."""
+    protocol_version = 'HTTP/1.1'  # keep-alive
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.connections.add(self.client_address)
+        server.encodings.append(self.headers.get('Accept-Encoding', ''))
+
+        if urlparse(self.path).path.endswith('SendRequest'):
+            status, body = 200, ('<FlexStatementResponse><Status>Success</Status><ReferenceCode>42</ReferenceCode>'
+                                 f'<Url>{server.base_url}/GetStatement</Url></FlexStatementResponse>')
+        else:
+            step = server.script.pop(0) if server.script else 'statement'
+            status, body = (503, 'busy') if step == 503 else (200, IN_PROGRESS if step == 1019 else STATEMENT)
+
+        payload = body.encode()
+        self.send_response(status)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            payload = gzip.compress(payload)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def start_stub_server(script):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubFlexHandler)
+    server.base_url = f"http://127.0.0.1:{server.server_port}"
+    server.script = list(script)
+    server.connections = set()
+    server.encodings = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_session_client():
+    # A 503 (retried by the adapter) and two "in progress" polls before the statement
+    server = start_stub_server([503, 1019, 1019])
+    try:
+        with IBKRFlexClient('token', 'query') as client:
+            client.BASE_URL = f"{server.base_url}/SendRequest"
+            client.POLL_INTERVAL = 0
+            ref_code, url = client.request_report()
+            content = client.download_report(ref_code, url)
+    finally:
+        server.shutdown()
+
+    assert content == STATEMENT, "Statement content mismatch"
+    assert len(server.encodings) == 5, f"Expected 5 requests, got {len(server.encodings)}"
+    assert all('gzip' in e for e in server.encodings), "Requests should accept gzip"
+    assert len(server.connections) == 1, f"Expected one keep-alive connection, got {len(server.connections)}"
+    print(f"Session client: {len(server.encodings)} requests over {len(server.connections)} connection.")
+
+
+def test_async_client():
+    if not HTTPX_AVAILABLE:
+        print("httpx not installed, skipping the async client.")
+        return
+    server = start_stub_server([1019, 503, 1019])
+    try:
+        client = AsyncIBKRFlexClient('token', 'query', backoff=BackoffPolicy(initial=0.01, maximum=0.05), deadline=10)
+        client.BASE_URL = f"{server.base_url}/SendRequest"
+        content, error = asyncio.run(client.fetch_report())
+    finally:
+        server.shutdown()
+
+    assert error is None and content == STATEMENT, f"Async fetch failed: {error}"
+    assert len(server.connections) == 1, f"Expected one keep-alive connection, got {len(server.connections)}"
+    print(f"Async client: {len(server.encodings)} requests over {len(server.connections)} connection.")
+
+
+class RecordingBackoff(BackoffPolicy):
+    """BackoffPolicy that remembers every (retry, throttled, delay) it hands out."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.waits = []
+
+    def delay(self, retry, throttled=False):
+        wait = super().delay(retry, throttled)
+        self.waits.append((retry, throttled, wait))
+        return wait
+
+
+def run_mocked(statement_script, backoff, deadline=10, send_request=None):
+    """fetch_report against an httpx.MockTransport. Returns (content, error, requests seen)."""
+    script = list(statement_script)
+    seen = []
+
+    def handler(request):
+        seen.append(request.url.path)
+        if request.url.path.endswith('SendRequest'):
+            body = send_request or ('<FlexStatementResponse><Status>Success</Status><ReferenceCode>42</ReferenceCode>'
+                                    '<Url>https://flex.test/GetStatement</Url></FlexStatementResponse>')
+        else:
+            body = script.pop(0) if script else STATEMENT
+        return httpx.Response(200, text=body)
+
+    async def fetch():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as http:
+            client = AsyncIBKRFlexClient('token', 'query', backoff=backoff, deadline=deadline, client=http)
+            client.BASE_URL = 'https://flex.test/SendRequest'
+            return await client.fetch_report()
+
+    content, error = asyncio.run(fetch())
+    return content, error, seen
+
+
+def test_async_throttle_backoff():
+    if not HTTPX_AVAILABLE:
+        return
+    # 1018 (rate limited) waits at least the throttle delay, then the backoff grows again
+    backoff = RecordingBackoff(initial=0.001, maximum=0.01, multiplier=2, jitter=0, throttle_delay=0.02)
+    content, error, seen = run_mocked([THROTTLED, THROTTLED, IN_PROGRESS], backoff)
+
+    assert error is None and content == STATEMENT, f"Throttled fetch failed: {error}"
+    assert [throttled for _, throttled, _ in backoff.waits] == [True, True, False], backoff.waits
+    assert all(wait >= 0.02 for _, throttled, wait in backoff.waits if throttled), "Throttle delay not honored"
+    assert [retry for retry, _, _ in backoff.waits] == [0, 1, 2], "Retries should back off exponentially"
+    print(f"Async client: backed off {len(backoff.waits)} times on 1018/1019 before downloading.")
+
+
+def test_async_deadline():
+    if not HTTPX_AVAILABLE:
+        return
+    # A statement that never finishes generating: give up at the deadline instead of polling forever
+    backoff = BackoffPolicy(initial=0.01, maximum=0.05, jitter=0)
+    start = time.perf_counter()
+    content, error, seen = run_mocked([IN_PROGRESS] * 10_000, backoff, deadline=0.3)
+    elapsed = time.perf_counter() - start
+
+    assert content is None and error, "Expected a failure once the deadline passed"
+    assert elapsed < 2, f"Deadline of 0.3s not honored ({elapsed:.2f}s)"
+    assert len(seen) > 2, "Expected several polls before giving up"
+    print(f"Async client: gave up after {len(seen)} requests in {elapsed:.2f}s.")
+
+
+def test_async_fatal_code():
+    if not HTTPX_AVAILABLE:
+        return
+    # Non-retryable codes (expired token) fail on the first answer, without backing off
+    backoff = RecordingBackoff(initial=0.01)
+    content, error, seen = run_mocked([], backoff, send_request=EXPIRED)
+
+    assert content is None and error, "Expired token should fail the fetch"
+    assert len(seen) == 1 and not backoff.waits, f"Fatal code was retried: {seen}"
+    print("Async client: fatal error code stopped after one request.")
+
+
+def test_async_unparseable_response():
+    if not HTTPX_AVAILABLE:
+        return
+    # An HTML page that trips the error sniffing is retried, not raised out of the backoff loop
+    backoff = RecordingBackoff(initial=0.001, jitter=0)
+    content, error, seen = run_mocked([MAINTENANCE, MAINTENANCE], backoff)
+
+    assert error is None and content == STATEMENT, f"Unparseable response broke the fetch: {error}"
+    assert len(backoff.waits) == 2, backoff.waits
+    print("Async client: retried past unparseable responses.")
+
+
+def run_test():
+    print("--- Testing IBKR Flex clients against a local stub server ---")
+    test_session_client()
+    test_async_client()
+    test_async_throttle_backoff()
+    test_async_deadline()
+    test_async_fatal_code()
+    test_async_unparseable_response()
+    print("✅ SUCCESS: Reports downloaded over a single reused connection.")
+
+
+if __name__ == "__main__":
+    run_test()
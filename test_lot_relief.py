@@ -0,0 +1,114 @@
+import pandas as pd
+from core.logic import PnLEngine, LOT_COLUMNS
+
+START = pd.Timestamp('2024-01-02 10:00:00')
+
+# One stock, no commissions, so every P&L below can be checked by hand:
+#   1-3 build a long of 30 (10 @ 100, 10 @ 120, 10 @ 110)
+#   4   partial close (sell 15 @ 130)
+#   5   closes the remaining 15 and flips short 10 @ 140
+#   6-7 add shorts 10 @ 135 and 10 @ 150
+#   8   partial short cover (buy 5 @ 145)
+HISTORY = [
+    ('1', 'BUY', 10, 100.0),
+    ('2', 'BUY', 10, 120.0),
+    ('3', 'BUY', 10, 110.0),
+    ('4', 'SELL', 15, 130.0),
+    ('5', 'SELL', 25, 140.0),
+    ('6', 'SELL', 10, 135.0),
+    ('7', 'SELL', 10, 150.0),
+    ('8', 'BUY', 5, 145.0),
+]
+
+# Closing trade 4 names lots 3 then 1; trade 8 names lot 2, which trade 5 already closed (falls back to FIFO)
+INSTRUCTIONS = {'4': ['3', '1'], '8': ['2']}
+
+# method -> (net_pnl of each closed match in order, open lots as (quantity, price))
+EXPECTED = {
+    # 4: 10x(130-100) + 5x(130-120) | 5: 5x(140-120) + 10x(140-110) | 8: covers the 140 short
+    'fifo': ([300, 50, 100, 300, -25], [(-5, 140), (-10, 135), (-10, 150)]),
+    # 4: 10x(130-110) + 5x(130-120) | 5: 5x(140-120) + 10x(140-100) | 8: covers the newest (150) short
+    'lifo': ([200, 50, 100, 400, 25], [(-10, 140), (-10, 135), (-5, 150)]),
+    # Longs relieve the highest cost first, shorts the lowest sale price (135): the smallest gain each time
+    'hifo': ([100, 100, 150, 400, -50], [(-10, 140), (-5, 135), (-10, 150)]),
+    # Long average 110 | short average (140x10 + 135x10 + 150x10) / 30 = 141.67
+    'average': ([300, 450, -50 / 3], [(-25, 425 / 3)]),
+    # 4: lot 3 then lot 1 (partially) | 5: FIFO from what is left (5 @ 100, 10 @ 120) | 8: FIFO fallback
+    'specific': ([200, 150, 200, 200, -25], [(-5, 140), (-10, 135), (-10, 150)]),
+}
+
+
+def build_trades(rows):
+    return pd.DataFrame([{
+        'trade_id': trade_id,
+        'symbol': 'AAPL',
+        'asset_class': 'STK',
+        'trade_date': START + pd.Timedelta(days=i),
+        'quantity': float(qty),
+        'price': price,
+        'commission': 0.0,
+        'buy_sell': side,
+        'underlying': '',
+        'strike': None,
+        'expiry': None,
+        'put_call': None,
+        'multiplier': 1.0,
+        'code': '',
+    } for i, (trade_id, side, qty, price) in enumerate(rows)])
+
+
+def rounded(values, digits=4):
+    return [round(float(v), digits) for v in values]
+
+
+def test_relief_methods():
+    results = PnLEngine.match_lot_relief(build_trades(HISTORY), methods=tuple(EXPECTED), instructions=INSTRUCTIONS)
+
+    for method, (pnl, lots) in EXPECTED.items():
+        closed_df, lots_df = results[method]
+        assert rounded(closed_df['net_pnl']) == rounded(pnl), f"{method} P&L: {closed_df['net_pnl'].tolist()}"
+        open_lots = list(zip(rounded(lots_df['quantity']), rounded(lots_df['price'])))
+        assert open_lots == [(round(q, 4), round(p, 4)) for q, p in lots], f"{method} open lots: {open_lots}"
+        print(f"{method:>8}: realized {sum(pnl):9.2f}, {len(lots)} open lot(s)")
+
+    # FIFO's first match is lot 1; average cost dates a position from its oldest still-open purchase
+    fifo_closed = results['fifo'][0]
+    assert fifo_closed['entry_date'].iloc[0] == START, "FIFO should close the oldest lot first"
+    average_lots = results['average'][1]
+    assert average_lots['entry_date'].iloc[0] == START + pd.Timedelta(days=4), "Short dates from the flip"
+
+
+def test_carried_over_lots():
+    # Two lots from a previous run (10 @ 90, 10 @ 95), then buy 10 @ 80 and sell 15 @ 100
+    seeded = pd.DataFrame([
+        ('AAPL', 'AAPL', 10.0, 90.0, START - pd.Timedelta(days=30), 1.0, 0.0),
+        ('AAPL', 'AAPL', 10.0, 95.0, START - pd.Timedelta(days=20), 1.0, 0.0),
+    ], columns=LOT_COLUMNS)
+    trades = build_trades([('9', 'BUY', 10, 80.0), ('10', 'SELL', 15, 100.0)])
+    expected = {
+        'fifo': 10 * 10 + 5 * 5,       # 90, then half of 95
+        'lifo': 10 * 20 + 5 * 5,       # 80, then half of 95
+        'hifo': 10 * 5 + 5 * 10,       # 95, then half of 90
+        'average': 15 * (100 - 265 / 3),  # (90 + 95 + 80) / 3
+    }
+
+    results = PnLEngine.match_lot_relief(trades, methods=tuple(expected), open_lots=seeded)
+    for method, pnl in expected.items():
+        closed_df, lots_df = results[method]
+        assert round(closed_df['net_pnl'].sum(), 4) == round(pnl, 4), f"{method} with seeded lots"
+        assert round(lots_df['quantity'].sum(), 4) == 15, f"{method} should leave 15 shares open"
+
+    # Every method gets its own copy of the seeded lots
+    assert seeded['quantity'].tolist() == [10.0, 10.0], "Seeded frame must not be modified"
+    print("Carried-over lots are seeded into every method independently.")
+
+
+def run_test():
+    print("--- Testing lot relief methods on a hand-checked history ---")
+    test_relief_methods()
+    test_carried_over_lots()
+    print("✅ SUCCESS: FIFO, LIFO, HIFO, average cost and specific lots match the hand-checked results.")
+
+
+if __name__ == "__main__":
+    run_test()
@@ -0,0 +1,76 @@
+import os
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+
+# Scratch database, set before config is imported
+os.environ['DATABASE_URL'] = os.path.join(tempfile.mkdtemp(), 'test_scheduler.duckdb')
+os.environ['MOTHERDUCK_TOKEN'] = ''
+
+from core import database
+from core.database import DatabaseManager
+from core.scheduler import describe_status
+
+
+def make_status(state, next_in_minutes=30):
+    now = datetime.now(timezone.utc)
+    return {'state': state, 'mode': 'sync', 'started_at': (now - timedelta(minutes=1)).isoformat(),
+            'finished_at': now.isoformat(), 'seconds': 12.0, 'interval_minutes': 60, 'message': 'boom',
+            'next_run': (now + timedelta(minutes=next_in_minutes)).isoformat()}
+
+
+def test_describe_status():
+    level, _, active = describe_status(make_status('ok'))
+    assert (level, active) == ('info', True), "A healthy scheduler owns refreshing the data"
+
+    # A failed cycle must hand the Sync button back, even though the next run is not due yet
+    level, text, active = describe_status(make_status('error'))
+    assert (level, active) == ('error', False), f"Failed run reported as active: {text}"
+
+    level, _, active = describe_status(make_status('ok', next_in_minutes=-120))
+    assert (level, active) == ('warning', False), "An overdue scheduler should look stopped"
+
+    assert describe_status(None)[2] is False
+    print("describe_status: ok / error / overdue / missing handled.")
+
+
+def test_release_keeps_busy_sessions():
+    db = DatabaseManager()
+    in_query, may_finish = threading.Event(), threading.Event()
+    errors = []
+
+    def other_session():
+        try:
+            cursor = db.get_connection()
+            in_query.set()
+            may_finish.wait(10)
+            cursor.execute("SELECT COUNT(*) FROM trades").fetchone()  # Must still work after the first release
+        except Exception as e:
+            errors.append(e)
+        finally:
+            db.release()
+
+    db.get_connection()
+    thread = threading.Thread(target=other_session)
+    thread.start()
+    in_query.wait(10)
+
+    db.release()
+    assert db.db_path in database._shared_connections, "Connection closed while another session was using it"
+    may_finish.set()
+    thread.join()
+
+    assert not errors, f"Concurrent session failed: {errors}"
+    assert db.db_path not in database._shared_connections, "Last release should close the connection"
+    print("release: shared connection kept for busy sessions, closed by the last one.")
+
+
+def run_test():
+    print("--- Testing scheduler status and database release ---")
+    test_describe_status()
+    test_release_keeps_busy_sessions()
+    print("✅ SUCCESS: Scheduler status and connection release behave.")
+
+
+if __name__ == "__main__":
+    run_test()
@@ -0,0 +1,150 @@
+import uuid
+import numpy as np
+import pandas as pd
+from benchmarks.synthetic import iter_history
+from core.logic import PnLEngine
+from core.parser import ColumnarTableBuilder, TRADE_FIELDS
+from core.strategy_engine import StrategyEngine
+
+
+def synthetic_closed_trades(n_fills=3000, seed=11):
+    """Closed trades of a synthetic wheel/spread history (no database needed)."""
+    builder = ColumnarTableBuilder(TRADE_FIELDS)
+    for kind, attrs in iter_history(n_fills, n_underlyings=12, seed=seed):
+        if kind == 'trade':
+            builder.append(attrs)
+    trades_df = builder.to_frame()
+    trades_df['trade_date'] = pd.to_datetime(trades_df['trade_date'], format='%Y%m%d;%H%M%S')
+    closed_df, _ = PnLEngine.calculate_fifo_pnl(trades_df)
+    return closed_df
+
+
+def perturb(closed_df, seed=5):
+    """Jitters entry times around the 10s threshold, blanks some of them and shuffles the rows."""
+    rng = np.random.default_rng(seed)
+    df = closed_df.copy()
+    n = len(df)
+    jitter = pd.to_timedelta(rng.choice([0, 0, 0, 5, 10, 11, 25], size=n), unit='s')
+    df['entry_date'] = pd.to_datetime(df['entry_date']) + jitter
+    df.loc[rng.random(n) < 0.03, 'entry_date'] = pd.NaT
+    return df.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+# --- Reference: the original row-by-row implementation ---
+
+def reference_group(trades_df, time_threshold_seconds=10):
+    df = trades_df.copy()
+    group_col = 'entry_date' if 'entry_date' in df.columns else 'trade_date'
+    if not pd.api.types.is_datetime64_any_dtype(df[group_col]):
+        df[group_col] = pd.to_datetime(df[group_col])
+    df = df.sort_values(by=['root_symbol', group_col])
+    df['strategy_id'] = None
+    df['strategy_type'] = 'Single'
+
+    current_strategy_id = str(uuid.uuid4())
+    prev_row = None
+    strategy_buffer = []
+    for index, row in df.iterrows():
+        if prev_row is None or row['root_symbol'] != prev_row['root_symbol']:
+            is_new_group = True
+        else:
+            time_diff = (row[group_col] - prev_row[group_col]).total_seconds()
+            is_new_group = abs(time_diff) > time_threshold_seconds
+
+        if is_new_group:
+            if strategy_buffer:
+                df.loc[strategy_buffer, 'strategy_type'] = reference_classify(df.loc[strategy_buffer])
+            current_strategy_id = str(uuid.uuid4())
+            strategy_buffer = [index]
+        else:
+            strategy_buffer.append(index)
+        df.at[index, 'strategy_id'] = current_strategy_id
+        prev_row = row
+
+    if strategy_buffer:
+        df.loc[strategy_buffer, 'strategy_type'] = reference_classify(df.loc[strategy_buffer])
+    return df
+
+
+def reference_classify(cluster_df):
+    count = len(cluster_df)
+    if count == 1:
+        return "Single"
+    asset_classes = [str(x) for x in
+                     cluster_df['asset_class'].unique().tolist()] if 'asset_class' in cluster_df.columns else []
+
+    def get_unique(col):
+        return cluster_df[col].dropna().unique() if col in cluster_df.columns else []
+
+    rights = get_unique('put_call')
+    expiries = get_unique('expiry')
+
+    is_stock = any('STK' in x for x in asset_classes)
+    is_opt = any('OPT' in x or 'FOP' in x for x in asset_classes)
+    if is_stock and is_opt:
+        return "Covered/Protected Stock"
+    if count == 2:
+        if len(expiries) == 1:
+            return "Vertical Spread" if len(rights) == 1 else "Straddle/Strangle"
+        return "Calendar/Diagonal Spread"
+    if count == 3:
+        return "Butterfly/Ladder"
+    if count == 4 and len(expiries) == 1:
+        return "Iron Condor"
+    return f"Custom {count}-Leg"
+
+
+def partition(df, key):
+    """The groups as sets of row labels, independent of the id values."""
+    return {frozenset(rows) for rows in df.groupby(key, sort=False).groups.values()}
+
+
+def test_grouping_matches_reference():
+    for name, closed_df in [('synthetic', synthetic_closed_trades()),
+                            ('jittered', perturb(synthetic_closed_trades()))]:
+        grouped = StrategyEngine.group_executions_into_strategies(closed_df)
+        expected = reference_group(closed_df)
+
+        assert partition(grouped, 'strategy_id') == partition(expected, 'strategy_id'), f"{name}: groupings differ"
+        pd.testing.assert_series_equal(grouped['strategy_type'].sort_index(), expected['strategy_type'].sort_index(),
+                                       check_dtype=False)
+        print(f"{name}: {len(closed_df)} closed trades, {grouped['strategy_id'].nunique()} strategies match.")
+
+
+def random_clusters(n_clusters=2000, seed=3):
+    """Clusters of 1-6 legs mixing stock and option rows, with missing classes, expiries and rights."""
+    rng = np.random.default_rng(seed)
+    sizes = rng.integers(1, 7, size=n_clusters)
+    n = int(sizes.sum())
+    return pd.DataFrame({
+        'cluster': np.repeat(np.arange(n_clusters), sizes),
+        'asset_class': rng.choice(np.array(['OPT', 'OPT', 'FOP', 'STK', 'CASH', None], dtype=object), n),
+        'expiry': rng.choice(np.array(['20250117', '20250117', '20250221', None], dtype=object), n),
+        'put_call': rng.choice(np.array(['P', 'C', None], dtype=object), n),
+        'strike': rng.choice([90.0, 100.0, np.nan], n),
+    })
+
+
+def test_classifier_matches_reference():
+    clusters = random_clusters()
+    # Also without the optional columns, as on raw executions
+    for name, df in [('all columns', clusters),
+                     ('no expiry/put_call', clusters.drop(columns=['expiry', 'put_call'])),
+                     ('no asset_class', clusters.drop(columns=['asset_class']))]:
+        labels = StrategyEngine._classify_clusters(df, 'cluster')
+        expected = df.groupby('cluster', sort=False).apply(reference_classify, include_groups=False)
+        pd.testing.assert_series_equal(labels.sort_index(), expected.sort_index(), check_names=False,
+                                       check_dtype=False)
+        print(f"{name}: {len(labels)} random clusters classified like the original "
+              f"({labels.nunique()} distinct labels).")
+
+
+def run_test():
+    print("--- Comparing strategy grouping with the original row-by-row implementation ---")
+    test_grouping_matches_reference()
+    test_classifier_matches_reference()
+    print("✅ SUCCESS: Strategy groupings and labels are unchanged.")
+
+
+if __name__ == "__main__":
+    run_test()